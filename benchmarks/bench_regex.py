@@ -0,0 +1,87 @@
+"""Compare --regex-json post-processing: per-pattern re.sub vs RegexEngine.
+
+Run with ``python benchmarks/bench_regex.py [pattern_count] [text_kb]``.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from md_batch_gpt.regex_rules import RegexEngine, RegexRule  # noqa: E402
+
+
+def build_rules(count: int, grouped: bool = True) -> list[RegexRule]:
+    """Return whole-word glossary rules mixed with other patterns.
+
+    With *grouped* the whole-word rules come first, so RegexEngine merges
+    them into one scan; otherwise every third rule is one, interleaved with
+    the others as a hand-written rules file might be.
+    """
+    words = []
+    others = []
+    rules = []
+    for i in range(count):
+        if i % 3 == 0:
+            rule = RegexRule(re.compile(rf"\bterm{i}\b"), f"TERM{i}")
+            words.append(rule)
+        elif i % 3 == 1:
+            rule = RegexRule(re.compile(rf"(?i)heading {i}:\s+(\w+)"), rf"H{i} \1")
+            others.append(rule)
+        else:
+            rule = RegexRule(re.compile(rf"\[ref-{i}\]\((\S+?)\)"), rf"<\1>")
+            others.append(rule)
+        rules.append(rule)
+    return words + others if grouped else rules
+
+
+def build_text(rules: int, kb: int, hit_rate: float) -> str:
+    rng = random.Random(0)
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "lesson", "module"]
+    out = []
+    size = 0
+    while size < kb * 1024:
+        i = rng.randrange(rules)
+        if rng.random() < hit_rate:
+            token = rng.choice(
+                [f"term{i}", f"Heading {i}:  intro", f"[ref-{i}](https://x/{i})"]
+            )
+        else:
+            token = rng.choice(words)
+        out.append(token)
+        size += len(token) + 1
+    return " ".join(out)
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    kb = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    runs = 5
+    print(f"{count} patterns over {kb} KB of text (best of {runs})")
+    for grouped in (True, False):
+        rules = build_rules(count, grouped)
+        engine = RegexEngine(rules)
+        print("whole-word rules grouped" if grouped else "whole-word rules interleaved")
+        for hit_rate in (0.01, 0.2):
+            text = build_text(count, kb, hit_rate)
+
+            def sequential() -> str:
+                out = text
+                for rule in rules:
+                    out = rule.pattern.sub(rule.replacement, out)
+                return out
+
+            seq = min(timeit.repeat(sequential, number=1, repeat=runs))
+            comb = min(timeit.repeat(lambda: engine.apply(text), number=1, repeat=runs))
+            print(f"  {hit_rate:.0%} of words matched")
+            print(f"    sequential re.sub: {seq * 1000:8.1f} ms")
+            print(f"    RegexEngine:       {comb * 1000:8.1f} ms  ({seq / comb:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
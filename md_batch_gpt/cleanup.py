@@ -0,0 +1,233 @@
+"""Stripping stray code-fence wrappers and renaming files after their heading.
+
+These used to be the standalone ``remove-file-wrappers.py`` and
+``rename_by_heading.py`` scripts. :func:`clean_folder` runs both over a
+folder; :func:`~md_batch_gpt.orchestrator.process_folder` can apply them to
+the model output before it is written.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Tuple
+import io
+import json
+import os
+import re
+
+from .file_io import iter_markdown_files, write_atomic
+from .report import RunReport
+
+# Lines a model sometimes wraps a whole document in
+START_TOKENS = {"'''", "```json", "```markdown"}
+END_TOKENS = {"```"}
+
+# Renames made in an output tree by earlier runs, relative to the tree:
+# original name -> name after the heading
+RENAMED_FILE = Path(".mdgpt") / "renamed.json"
+
+_NUMBERED_RE = re.compile(r"^(\d+)\.(\d+)\s+(.*)")
+_HEADING_RE = re.compile(r"^# .*$", re.MULTILINE)
+
+
+def strip_wrappers(text: str) -> str:
+    """Drop a wrapper line at the start and a stray closing fence at the end of *text*.
+
+    The closing fence only goes with a wrapper at the start or when it is
+    unbalanced, so a document that really ends with a code block is kept.
+    """
+    lines = io.StringIO(text).readlines()
+    wrapped = bool(lines) and lines[0].strip() in START_TOKENS
+    if wrapped:
+        lines = lines[1:]
+    if lines and lines[-1].strip() in END_TOKENS:
+        fences = sum(1 for line in lines if line.lstrip().startswith("```"))
+        if wrapped or fences % 2:
+            lines = lines[:-1]
+    return "".join(lines)
+
+
+def slugify(text: str) -> str:
+    """Return the file name stem for heading *text*.
+
+    A leading ``1.2`` module number becomes a ``1-2-`` prefix; the rest is
+    lower-cased, stripped of punctuation and joined with dashes.
+    """
+    match = _NUMBERED_RE.match(text)
+    if match:
+        major, minor, title = match.groups()
+        prefix = f"{major}-{minor}"
+    else:
+        prefix = ""
+        title = text
+    title = title.strip().lower()
+    title = re.sub(r"[^\w\s-]", "", title)
+    title = re.sub(r"\s+", "-", title)
+    title = re.sub(r"-+", "-", title)
+    return f"{prefix}-{title}".strip("-")
+
+
+def heading_slug(text: str) -> str | None:
+    """Return the slug of the first ``# `` heading in *text*, or None."""
+    match = _HEADING_RE.search(text)
+    if match is None:
+        return None
+    return slugify(match.group(0).lstrip("# ").strip()) or None
+
+
+def plan_renames(
+    slugs: Iterable[Tuple[Path, str | None]],
+    previous: Mapping[Path, Path] | None = None,
+) -> Tuple[Dict[Path, Path], List[Tuple[Path, str]]]:
+    """Return the renames for ``(path, slug)`` pairs and the conflicts found.
+
+    Each file moves to ``<slug>.md`` in its own directory. A rename is
+    refused, with a reason in the second list, when two files would get the
+    same name or the name is taken by a file that stays where it is, unless
+    *previous* records that file as this path renamed by an earlier run.
+    Chains of renames are refused too; rerunning resolves them.
+    """
+    previous = previous or {}
+    wanted: Dict[Path, List[Path]] = {}
+    for path, slug in slugs:
+        if slug is None:
+            continue
+        target = path.with_name(f"{slug}.md")
+        if target != path:
+            wanted.setdefault(target, []).append(path)
+    renames: Dict[Path, Path] = {}
+    conflicts: List[Tuple[Path, str]] = []
+    for target, sources in wanted.items():
+        if len(sources) > 1:
+            names = ", ".join(sorted(p.name for p in sources))
+            for source in sources:
+                conflicts.append((source, f"{names} would all be named {target.name}"))
+            continue
+        source = sources[0]
+        if _taken(source, target, previous):
+            conflicts.append((source, f"{target.name} already exists"))
+            continue
+        renames[source] = target
+    return renames, conflicts
+
+
+def _taken(source: Path, target: Path, previous: Mapping[Path, Path]) -> bool:
+    return (
+        target.exists()
+        and not os.path.samefile(source, target)
+        and previous.get(source) != target
+    )
+
+
+def _move(source: Path, target: Path) -> None:
+    if (
+        source.name.casefold() != target.name.casefold()
+        and target.exists()
+        and os.path.samefile(source, target)
+    ):
+        # hard links to one file, e.g. in a mirrored output tree: rename()
+        # would do nothing and leave both names
+        os.unlink(source)
+    else:
+        os.replace(source, target)
+
+
+def apply_renames(
+    renames: Dict[Path, Path],
+    conflicts: List[Tuple[Path, str]],
+    folder: Path,
+    report: RunReport,
+    dry_run: bool = False,
+    previous: Mapping[Path, Path] | None = None,
+) -> None:
+    """Rename files as planned by :func:`plan_renames`, recording the results.
+
+    Paths in *report* are relative to *folder*; conflicts are failures. With
+    *dry_run* the renames are only recorded. A target *previous* maps the
+    source to is replaced.
+    """
+    previous = previous or {}
+    for source, reason in conflicts:
+        rel = source.relative_to(folder).as_posix()
+        report.record_failure(rel, FileExistsError(f"Not renamed: {reason}"))
+    for source, target in sorted(renames.items()):
+        rel = source.relative_to(folder).as_posix()
+        try:
+            if _taken(source, target, previous):
+                raise FileExistsError(f"Not renamed: {target.name} already exists")
+            if not dry_run:
+                _move(source, target)
+        except OSError as exc:
+            report.record_failure(rel, exc)
+            continue
+        report.renamed[rel] = target.relative_to(folder).as_posix()
+
+
+def load_renamed(folder: Path) -> Dict[str, str]:
+    """Return the renames recorded by :func:`save_renamed` in *folder*."""
+    path = Path(folder) / RENAMED_FILE
+    if not path.exists():
+        return {}
+    try:
+        renamed = json.loads(path.read_text(encoding="utf-8"))
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Invalid JSON in {path}: {exc}") from exc
+    if not isinstance(renamed, dict):
+        raise ValueError(f"{path} does not contain an object")
+    return {str(k): str(v) for k, v in renamed.items()}
+
+
+def save_renamed(folder: Path, renamed: Mapping[str, str]) -> None:
+    """Record *renamed* (folder-relative paths) in *folder* for later runs."""
+    path = Path(folder) / RENAMED_FILE
+    path.parent.mkdir(exist_ok=True)
+    write_atomic(path, json.dumps(dict(sorted(renamed.items())), indent=2) + "\n", "none")
+
+
+def clean_folder(
+    folder: Path,
+    strip: bool = True,
+    rename: bool = True,
+    workers: int = 4,
+    dry_run: bool = False,
+    durability: str = "file",
+) -> RunReport:
+    """Strip wrappers from and/or rename every Markdown file under *folder*.
+
+    Files are read and rewritten on *workers* threads; renames are planned
+    once all files are read, so collisions across the folder are detected
+    before anything is renamed. With *dry_run* nothing is changed, but the
+    report lists what would be.
+    """
+    folder = Path(folder)
+    report = RunReport()
+
+    def clean(md_file: Path) -> Tuple[bool, str | None]:
+        text = md_file.read_text(encoding="utf-8", errors="replace")
+        changed = False
+        if strip:
+            stripped = strip_wrappers(text)
+            changed = stripped != text
+            if changed and not dry_run:
+                write_atomic(md_file, stripped, durability)
+            text = stripped
+        return changed, heading_slug(text) if rename else None
+
+    files = sorted(iter_markdown_files(folder))
+    slugs: List[Tuple[Path, str | None]] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [(f, pool.submit(clean, f)) for f in files]
+        for md_file, future in futures:
+            rel = md_file.relative_to(folder).as_posix()
+            try:
+                changed, slug = future.result()
+            except OSError as exc:
+                report.record_failure(rel, exc)
+                continue
+            (report.processed if changed else report.skipped).append(rel)
+            slugs.append((md_file, slug))
+    if rename:
+        renames, conflicts = plan_renames(slugs)
+        apply_renames(renames, conflicts, folder, report, dry_run)
+    return report
@@ -1,11 +1,55 @@
 from __future__ import annotations
 
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, Iterable, Iterator, List, Tuple
 import json
+import sys
 
-from .openai_client import generate_image
+from .config import DEFAULT_MODEL, DURABILITY, HEDGE_MAX_RATE, HEDGE_PERCENTILE
+from .cleanup import clean_folder
+from .file_io import DURABILITY_LEVELS, is_markdown_file, write_atomic_bytes
+from .git_changes import GitError, head_commit, remember, select_since
+from .image_postprocess import (
+    ImagePostProcessor,
+    PostProcessOptions,
+    postprocess_image,
+    require_pillow,
+)
+from .images import (
+    check_entries,
+    doc_prompt,
+    is_doc_file,
+    iter_batches,
+    iter_doc_entries,
+    iter_spec_file,
+    write_image_entries,
+)
+from .jobs import DEFAULT_QUEUE_PATH, LEASE_SECONDS, JobQueue, serve
 from .markdown_parser import parse_markdown_image_entries
+from .metrics import serve_http, start_textfile_writer
+from .openai_client import (
+    generate_image,
+    generate_images,
+    http_settings,
+    set_hedging,
+    set_http_settings,
+)
+from .planner import (
+    Manifest,
+    diff_manifests,
+    execute_manifest,
+    load_manifest,
+    plan_docs,
+    plan_prompt_file,
+    plan_run,
+    plan_spec_files,
+)
+from .progress import Progress
+from .report import RunReport, load_report, merge_reports
+from .scheduling import SCHEDULES
+from .sharding import format_shard, in_shard, parse_shard, run_local_shards
+from .watch import watch
 
 import typer
 
@@ -20,9 +64,315 @@ def validate_prompts(_: typer.Context, value: Tuple[Path, ...]) -> List[Path]:
     return list(value)
 
 
+def validate_shard(_: typer.Context, value: str | None) -> tuple[int, int] | None:
+    """Return ``(index, count)`` parsed from an ``i/N`` *value*."""
+    if value is None:
+        return None
+    try:
+        return parse_shard(value)
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc)) from exc
+
+
+def validate_durability(_: typer.Context, value: str) -> str:
+    """Return *value* if it is a known durability level."""
+    if value not in DURABILITY_LEVELS:
+        raise typer.BadParameter(
+            f"Unknown durability {value!r}; use one of {', '.join(DURABILITY_LEVELS)}"
+        )
+    return value
+
+
+def validate_schedule(_: typer.Context, value: str) -> str:
+    """Return *value* if it is a known schedule."""
+    if value not in SCHEDULES:
+        raise typer.BadParameter(
+            f"Unknown schedule {value!r}; use one of {', '.join(SCHEDULES)}"
+        )
+    return value
+
+
+def validate_progress_json(_: typer.Context, value: Path | None) -> Path | None:
+    """Return *value* unless it is ``-``: stdout carries the command's own output."""
+    if value is not None and str(value) == "-":
+        raise typer.BadParameter(
+            "stdout is used for the command's output; give a file, e.g. /dev/stderr"
+        )
+    return value
+
+
+def _resolve_prompts(prompts: List[Path]) -> List[Path]:
+    """Return *prompts*, or the ``prompts/*.txt`` files next to the package."""
+    prompt_list = list(prompts)
+    if len(prompt_list) == 0:
+        default_dir = Path(__file__).parent.parent / "prompts"
+        prompt_paths = sorted(default_dir.glob("*.txt"))
+        if not prompt_paths:
+            raise typer.BadParameter(
+                f"No prompt files found in {default_dir}. "
+                "Pass --prompts explicitly or add *.txt files."
+            )
+        prompt_list = list(prompt_paths)
+    return prompt_list
+
+
+def _echo_failures(report: RunReport) -> None:
+    for failure in report.failures:
+        typer.echo(f"Failed {failure['item']}: {failure['error']}", err=True)
+
+
+def _finish_report(report: RunReport, path: Path | None) -> None:
+    """Write *report* to *path* if given and fail if any item failed."""
+    if path is not None:
+        report.write(path)
+    if report.failures:
+        _echo_failures(report)
+        raise typer.Exit(code=1)
+
+
+SHARD_HELP = "Only process shard i of N (zero-based), e.g. 0/4"
+REPORT_HELP = "Write a JSON usage/failure report to this path"
+KEEP_GOING_HELP = "Record failures in the report and continue"
+DURABILITY_HELP = "Write durability: none, file (fsync files) or dir (also fsync directories)"
+PROGRESS_HELP = "Show a live progress line on stderr (default: if stderr is a terminal and not -v)"
+SCHEDULE_HELP = (
+    "Order of work: input, largest (most expensive first) or fair "
+    "(largest first, taking turns between groups)"
+)
+SINCE_HELP = (
+    "Only process files git reports as changed or untracked since this ref; "
+    "'last' means since the previous --since run of this command"
+)
+PROGRESS_JSON_HELP = "Append one JSON progress record per second to this file"
+
+
+def durability_option():
+    return typer.Option(
+        DURABILITY, "--durability", help=DURABILITY_HELP, callback=validate_durability
+    )
+
+
+def schedule_option():
+    return typer.Option(
+        "input", "--schedule", help=SCHEDULE_HELP, callback=validate_schedule
+    )
+
+
+def since_option():
+    return typer.Option(None, "--since", help=SINCE_HELP)
+
+
+def _since_key(key: str, shard: tuple[int, int] | None) -> str:
+    """Return the ``--since last`` record key; every shard keeps its own."""
+    return f"{key}@{format_shard(shard)}" if shard else key
+
+
+def _select_since(
+    folder: Path, since: str, key: str, accept
+) -> Tuple[List[Path] | None, str, Dict[str, str]]:
+    """Return the changed files, the current commit and the kept hashes
+    (see :func:`~md_batch_gpt.git_changes.select_since`)."""
+    try:
+        commit = head_commit(folder)
+        files, kept = select_since(folder, since, key, accept)
+    except (GitError, ValueError) as exc:
+        raise typer.BadParameter(str(exc)) from exc
+    return files, commit, kept
+
+
+def progress_option():
+    return typer.Option(None, "--progress/--no-progress", help=PROGRESS_HELP)
+
+
+def progress_json_option():
+    return typer.Option(
+        None, "--progress-json", help=PROGRESS_JSON_HELP, callback=validate_progress_json
+    )
+
+
+POSTPROCESS_HELP = "Re-encode images for their file extension (e.g. .webp, .jpg) with Pillow"
+
+
+def postprocess_option():
+    return typer.Option(False, "--postprocess", help=POSTPROCESS_HELP)
+
+
+def quality_option():
+    return typer.Option(
+        85, "--quality", min=1, max=100, help="Encoder quality with --postprocess"
+    )
+
+
+def thumbnail_option():
+    return typer.Option(
+        [],
+        "--thumbnail",
+        min=1,
+        help="Also write a NAME-<W>w copy this many pixels wide (repeatable)",
+    )
+
+
+def keep_metadata_option():
+    return typer.Option(
+        False, "--keep-metadata", help="Keep EXIF data when post-processing"
+    )
+
+
+def _postprocess_options(
+    postprocess: bool, quality: int, thumbnails: List[int], keep_metadata: bool
+) -> PostProcessOptions | None:
+    """Return the post-processing settings, or None if ``--postprocess`` is off."""
+    if not postprocess:
+        if thumbnails:
+            raise typer.BadParameter("--thumbnail requires --postprocess")
+        return None
+    try:
+        require_pillow()
+    except RuntimeError as exc:
+        raise typer.BadParameter(str(exc)) from exc
+    return PostProcessOptions(
+        quality=quality,
+        thumbnails=tuple(thumbnails),
+        strip_metadata=not keep_metadata,
+    )
+
+
+@contextmanager
+def _postprocessor(
+    options: PostProcessOptions | None, durability: str
+) -> Iterator[ImagePostProcessor | None]:
+    if options is None:
+        yield None
+        return
+    with ImagePostProcessor(options, durability=durability) as postprocessor:
+        yield postprocessor
+
+
+def _reread(entries: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+    """Yield image *entries* read again after validation, reporting a
+    ValueError (the files changed in between) as a usage error."""
+    try:
+        yield from entries
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc)) from exc
+
+
+@contextmanager
+def _progress(
+    show: bool | None, json_path: Path | None, unit: str, verbose: bool
+) -> Iterator[Progress | None]:
+    """Yield a started :class:`Progress` for the command, or None if unwanted."""
+    if show is None:
+        show = sys.stderr.isatty() and not verbose
+    if not show and json_path is None:
+        yield None
+        return
+    with ExitStack() as stack:
+        json_stream = None
+        if json_path is not None:
+            json_stream = stack.enter_context(json_path.open("a", encoding="utf-8"))
+        progress = Progress(
+            unit=unit, stream=sys.stderr if show else None, json_stream=json_stream
+        )
+        with progress:
+            yield progress
+
+
 app = typer.Typer()
 
 
+@app.callback()
+def main(
+    ctx: typer.Context,
+    metrics_port: int | None = typer.Option(
+        None, "--metrics-port", help="Serve Prometheus metrics on this port at /metrics"
+    ),
+    metrics_host: str = typer.Option(
+        "127.0.0.1", "--metrics-host", help="Interface for --metrics-port"
+    ),
+    metrics_textfile: Path = typer.Option(
+        None,
+        "--metrics-textfile",
+        help="Periodically write metrics to this file (node-exporter textfile format)",
+    ),
+    metrics_interval: float = typer.Option(
+        15.0, "--metrics-interval", help="Seconds between --metrics-textfile writes"
+    ),
+    hedge: float | None = typer.Option(
+        None,
+        "--hedge",
+        min=1,
+        max=99.9,
+        help="Duplicate API calls slower than this latency percentile, e.g. 95",
+    ),
+    hedge_max_rate: float | None = typer.Option(
+        None,
+        "--hedge-max-rate",
+        min=0,
+        max=1,
+        help=(
+            "Largest fraction of API calls that may be duplicated "
+            f"(default: {HEDGE_MAX_RATE}); applies to a configured --hedge too"
+        ),
+    ),
+    max_connections: int | None = typer.Option(
+        None, "--max-connections", min=1, help="Most open HTTP connections to the API"
+    ),
+    max_keepalive: int | None = typer.Option(
+        None, "--max-keepalive", min=1, help="Most idle connections kept open"
+    ),
+    keepalive_expiry: float | None = typer.Option(
+        None, "--keepalive-expiry", min=0.1, help="Seconds an idle connection is kept"
+    ),
+    connect_timeout: float | None = typer.Option(
+        None, "--connect-timeout", min=0.1, help="Seconds to wait for a connection"
+    ),
+    read_timeout: float | None = typer.Option(
+        None, "--read-timeout", min=0.1, help="Seconds to wait for a response"
+    ),
+    http2: bool | None = typer.Option(
+        None,
+        "--http2/--no-http2",
+        help="Multiplex requests over HTTP/2 connections (needs the h2 package)",
+    ),
+) -> None:
+    """Batch-process Markdown files and generate images with the OpenAI API.
+
+    Connection options override ``[tool.md_batch_gpt.http]`` and apply to
+    image downloads as well.
+    """
+    if hedge is not None or hedge_max_rate is not None:
+        set_hedging(
+            HEDGE_PERCENTILE if hedge is None else hedge,
+            HEDGE_MAX_RATE if hedge_max_rate is None else hedge_max_rate,
+        )
+    overrides = dict(
+        max_connections=max_connections,
+        max_keepalive=max_keepalive,
+        keepalive_expiry=keepalive_expiry,
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        http2=http2,
+    )
+    try:
+        current = http_settings()
+        settings = current.merged(**overrides)
+        if settings != current:
+            set_http_settings(settings)
+    except (RuntimeError, ValueError) as exc:
+        raise typer.BadParameter(f"Invalid connection settings: {exc}") from exc
+    if metrics_port is not None:
+        server = serve_http(metrics_port, metrics_host)
+
+        def stop_server() -> None:
+            server.shutdown()
+            server.server_close()
+
+        ctx.call_on_close(stop_server)
+    if metrics_textfile is not None:
+        ctx.call_on_close(start_textfile_writer(metrics_textfile, metrics_interval))
+
+
 @app.command()
 def run(
     folder: Path = typer.Argument(..., exists=True, file_okay=False, dir_okay=True),
@@ -32,7 +382,11 @@ def run(
         help="Space-separated list of prompt files",
         callback=validate_prompts,
     ),
-    model: str = typer.Option("o3", "--model", help="OpenAI model to use"),
+    model: str = typer.Option(
+        DEFAULT_MODEL,
+        "--model",
+        help="Default OpenAI model; [tool.md_batch_gpt] routes may override it",
+    ),
     max_tokens: int | None = typer.Option(
         None, "--max-tokens", help="Max tokens for completion"
     ),
@@ -52,18 +406,66 @@ def run(
         "--dry-run",
         help="List files to be processed without sending prompts",
     ),
+    shard: str = typer.Option(None, "--shard", help=SHARD_HELP, callback=validate_shard),
+    local_shards: int | None = typer.Option(
+        None,
+        "--local-shards",
+        min=1,
+        help="Split the folder into N shards and run them in a local process pool",
+    ),
+    report_path: Path = typer.Option(None, "--report", help=REPORT_HELP),
+    keep_going: bool = typer.Option(False, "--keep-going", help=KEEP_GOING_HELP),
+    workers: int = typer.Option(
+        1, "--workers", min=1, help="Number of files sent to the API concurrently"
+    ),
+    prefetch: int = typer.Option(
+        4, "--prefetch", min=1, help="Number of files read ahead of the API workers"
+    ),
+    durability: str = durability_option(),
+    edit_mode: bool = typer.Option(
+        False,
+        "--edit-mode",
+        help="Ask for find/replace edits instead of the full text (falls back on failure)",
+    ),
+    pack_tokens: int | None = typer.Option(
+        None,
+        "--pack-tokens",
+        min=1,
+        help="Send small files together in requests of up to this many estimated tokens",
+    ),
+    schedule: str = schedule_option(),
+    since: str = since_option(),
+    output_dir: Path = typer.Option(
+        None,
+        "--output-dir",
+        file_okay=False,
+        help="Write results to a mirror of the folder (hard links for the rest) "
+        "instead of in place",
+    ),
+    strip_wrappers: bool = typer.Option(
+        False,
+        "--strip-wrappers",
+        help="Remove code-fence wrappers from the model output",
+    ),
+    rename_by_heading: bool = typer.Option(
+        False,
+        "--rename-by-heading",
+        help="Rename processed files after their first '# ' heading",
+    ),
+    show_progress: bool | None = progress_option(),
+    progress_json: Path = progress_json_option(),
 ) -> None:
     """Run the batch processor on *folder* using *prompts*."""
-    prompt_list = list(prompts)
-    if len(prompt_list) == 0:
-        default_dir = Path(__file__).parent.parent / "prompts"
-        prompt_paths = sorted(default_dir.glob("*.txt"))
-        if not prompt_paths:
-            raise typer.BadParameter(
-                f"No prompt files found in {default_dir}. "
-                "Pass --prompts explicitly or add *.txt files."
-            )
-        prompt_list = list(prompt_paths)
+    prompt_list = _resolve_prompts(prompts)
+    files = None
+    # each output tree remembers its own last commit
+    since_key = _since_key(
+        "run" if output_dir is None else f"run:{output_dir.resolve()}", shard
+    )
+    if since:
+        files, commit, kept = _select_since(
+            folder, since, since_key, lambda p: is_markdown_file(folder, p)
+        )
 
     if verbose:
         typer.echo(f"Folder: {folder}")
@@ -71,15 +473,51 @@ def run(
         typer.echo(f"Model: {model} Max tokens: {max_tokens}")
         if regex_json:
             typer.echo(f"Regex JSON: {regex_json}")
-    process_folder(
-        folder,
-        prompt_list,
+        if shard:
+            typer.echo(f"Shard: {format_shard(shard)}")
+    options = dict(
         model=model,
         max_tokens=max_tokens,
         regex_json=regex_json,
         dry_run=dry_run,
         verbose=verbose,
+        keep_going=keep_going,
+        workers=workers,
+        prefetch=prefetch,
+        durability=durability,
+        edit_mode=edit_mode,
+        pack_tokens=pack_tokens,
+        schedule=schedule,
+        files=files,
+        output_dir=output_dir,
+        strip_wrappers=strip_wrappers,
+        rename_by_heading=rename_by_heading,
     )
+    if local_shards:
+        if shard:
+            raise typer.BadParameter("--shard cannot be combined with --local-shards")
+        if show_progress or progress_json:
+            raise typer.BadParameter(
+                "--progress/--progress-json cannot be combined with --local-shards"
+            )
+        reports = run_local_shards(
+            local_shards, process_folder, folder, prompt_list, **options
+        )
+        report = merge_reports(reports)
+    else:
+        show = False if dry_run else show_progress
+        with _progress(show, progress_json, "files", verbose) as progress:
+            report = process_folder(
+                folder, prompt_list, shard=shard, progress=progress, **options
+            )
+    if since and not dry_run and not report.failures:
+        written = (
+            [report.renamed.get(rel, rel) for rel in report.processed]
+            if output_dir is None
+            else ()
+        )
+        remember(folder, since_key, commit, written, kept)
+    _finish_report(report, report_path)
     if verbose:
         typer.echo("Done")
 
@@ -94,8 +532,14 @@ def generate_image_cmd(
     ),
     size: str = typer.Option("1024x1024", "--size", help="Image size, e.g. 1024x1024"),
     verbose: bool = typer.Option(False, "--verbose", "-v"),
+    durability: str = durability_option(),
+    postprocess: bool = postprocess_option(),
+    quality: int = quality_option(),
+    thumbnails: List[int] = thumbnail_option(),
+    keep_metadata: bool = keep_metadata_option(),
 ) -> None:
     """Generate an image using a filename and prompt from *prompt_file*."""
+    pp_options = _postprocess_options(postprocess, quality, thumbnails, keep_metadata)
     text = prompt_file.read_text(encoding="utf-8", errors="replace")
     lines = text.splitlines()
     if not lines:
@@ -109,7 +553,15 @@ def generate_image_cmd(
     if verbose:
         typer.echo(f"Generating {filename} with model {model}")
     image_bytes = generate_image(prompt, model=model, size=size)
-    Path(filename).write_bytes(image_bytes)
+    if pp_options is None:
+        write_atomic_bytes(Path(filename), image_bytes, durability)
+    else:
+        try:
+            stats = postprocess_image(image_bytes, filename, pp_options, durability)
+        except ValueError as exc:
+            raise typer.BadParameter(str(exc)) from exc
+        if verbose:
+            typer.echo(f"Re-encoded {stats['bytes_in']} -> {stats['bytes_out']} bytes")
     if verbose:
         typer.echo(f"Wrote {filename}")
 
@@ -124,34 +576,81 @@ def generate_images_cmd(
     ),
     size: str = typer.Option("1024x1024", "--size", help="Image size, e.g. 1024x1024"),
     verbose: bool = typer.Option(False, "--verbose", "-v"),
+    shard: str = typer.Option(None, "--shard", help=SHARD_HELP, callback=validate_shard),
+    report_path: Path = typer.Option(None, "--report", help=REPORT_HELP),
+    keep_going: bool = typer.Option(False, "--keep-going", help=KEEP_GOING_HELP),
+    durability: str = durability_option(),
+    show_progress: bool | None = progress_option(),
+    progress_json: Path = progress_json_option(),
+    postprocess: bool = postprocess_option(),
+    quality: int = quality_option(),
+    thumbnails: List[int] = thumbnail_option(),
+    keep_metadata: bool = keep_metadata_option(),
+    since: str = since_option(),
 ) -> None:
-    """Generate images for each entry in one or more JSON files."""
+    """Generate images for each entry in one or more JSON files.
+
+    Every file is validated in a streaming pass before the first image is
+    requested; generation then streams the files again in batches of 256
+    entries, so memory stays bounded however large they are. Identical
+    prompts are only requested together (with n=) within one batch, so keep
+    repeated summaries close together in the files.
+
+    With --since, a file git reports as unchanged is skipped whole; each
+    file, and each shard of it, remembers its own last commit.
+    """
+    report = RunReport(shards=[format_shard(shard)] if shard else [])
+    selected = lambda e: in_shard(e["expected_filename"], shard)  # noqa: E731
+    records = []
+    if since:
+        changed = []
+        for json_file in json_files:
+            path = json_file.resolve()
+            key = _since_key(f"images:{path.name}", shard)
+            files, commit, _ = _select_since(
+                path.parent, since, key, lambda p, path=path: p.resolve() == path
+            )
+            records.append((path.parent, key, commit))
+            if files is None or files:
+                changed.append(json_file)
+            elif verbose:
+                typer.echo(f"Unchanged since {since}: {json_file}")
+        json_files = changed
+    total = 0
     for json_file in json_files:
-        if verbose:
-            typer.echo(f"Processing {json_file}")
         try:
-            entries = json.loads(
-                json_file.read_text(encoding="utf-8", errors="replace")
-            )
-        except json.JSONDecodeError as exc:  # pragma: no cover - error path
-            raise typer.BadParameter(f"Invalid JSON in {json_file}: {exc}") from exc
-        if not isinstance(entries, list):
-            raise typer.BadParameter(f"{json_file} does not contain a list")
-        for idx, entry in enumerate(entries):
-            if not isinstance(entry, dict):
-                raise typer.BadParameter(f"Entry {idx} in {json_file} is not an object")
-            filename = entry.get("expected_filename")
-            prompt = entry.get("summary")
-            if not filename or not prompt:
-                raise typer.BadParameter(
-                    f"Entry {idx} in {json_file} missing expected_filename or summary"
-                )
-            if verbose:
-                typer.echo(f"  Generating {filename}")
-            image_bytes = generate_image(prompt, model=model, size=size)
-            Path(filename).write_bytes(image_bytes)
+            total += check_entries(iter_spec_file(json_file), selected)
+        except ValueError as exc:
+            raise typer.BadParameter(str(exc)) from exc
+    pp_options = _postprocess_options(postprocess, quality, thumbnails, keep_metadata)
+    with _progress(
+        show_progress, progress_json, "images", verbose
+    ) as progress, _postprocessor(pp_options, durability) as postprocessor:
+        if progress is not None:
+            progress.add_total(total)
+        for json_file in json_files:
             if verbose:
-                typer.echo(f"  Wrote {filename}")
+                typer.echo(f"Processing {json_file}")
+            entries = filter(selected, _reread(iter_spec_file(json_file)))
+            for batch in iter_batches(entries):
+                write_image_entries(
+                    batch,
+                    model,
+                    size,
+                    report,
+                    verbose=verbose,
+                    keep_going=keep_going,
+                    indent="  ",
+                    durability=durability,
+                    generate=generate_image,
+                    generate_many=generate_images,
+                    progress=progress,
+                    postprocessor=postprocessor,
+                )
+    if since and not report.failures:
+        for folder, key, commit in records:
+            remember(folder, key, commit)
+    _finish_report(report, report_path)
 
 
 @app.command("generate-images-from-docs")
@@ -164,47 +663,57 @@ def generate_images_from_docs_cmd(
     ),
     size: str = typer.Option("1024x1024", "--size", help="Image size, e.g. 1024x1024"),
     verbose: bool = typer.Option(False, "--verbose", "-v"),
+    shard: str = typer.Option(None, "--shard", help=SHARD_HELP, callback=validate_shard),
+    report_path: Path = typer.Option(None, "--report", help=REPORT_HELP),
+    keep_going: bool = typer.Option(False, "--keep-going", help=KEEP_GOING_HELP),
+    durability: str = durability_option(),
+    show_progress: bool | None = progress_option(),
+    progress_json: Path = progress_json_option(),
+    postprocess: bool = postprocess_option(),
+    quality: int = quality_option(),
+    thumbnails: List[int] = thumbnail_option(),
+    keep_metadata: bool = keep_metadata_option(),
+    since: str = since_option(),
 ) -> None:
     """Generate images based on Markdown/JSON files under *docs_folder*."""
-    entries = parse_markdown_image_entries(docs_folder)
+    files = None
+    since_key = _since_key("docs", shard)
+    if since:
+        files, commit, _ = _select_since(
+            docs_folder, since, since_key, lambda p: is_doc_file(docs_folder, p)
+        )
+    selected = lambda e: in_shard(e["expected_filename"], shard)  # noqa: E731
+    try:
+        total = check_entries(iter_doc_entries(docs_folder, files), selected)
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc)) from exc
 
-    for json_path in docs_folder.glob("*.json"):
-        try:
-            raw = json.loads(
-                json_path.read_text(encoding="utf-8", errors="replace")
+    report = RunReport(shards=[format_shard(shard)] if shard else [])
+    pp_options = _postprocess_options(postprocess, quality, thumbnails, keep_metadata)
+    with _progress(
+        show_progress, progress_json, "images", verbose
+    ) as progress, _postprocessor(pp_options, durability) as postprocessor:
+        if progress is not None:
+            progress.add_total(total)
+        entries = filter(selected, _reread(iter_doc_entries(docs_folder, files)))
+        for batch in iter_batches(entries):
+            write_image_entries(
+                batch,
+                model,
+                size,
+                report,
+                verbose=verbose,
+                keep_going=keep_going,
+                build_prompt=doc_prompt,
+                durability=durability,
+                generate=generate_image,
+                generate_many=generate_images,
+                progress=progress,
+                postprocessor=postprocessor,
             )
-        except json.JSONDecodeError as exc:
-            raise typer.BadParameter(f"Invalid JSON in {json_path}: {exc}") from exc
-
-        specs = raw if isinstance(raw, list) else [raw]
-        for spec in specs:
-            if not isinstance(spec, dict):
-                raise typer.BadParameter(f"{json_path} entry is not an object")
-            if not spec.get("expected_filename") or not spec.get("summary"):
-                raise typer.BadParameter(
-                    f"{json_path} missing expected_filename or summary"
-                )
-            entries.append(spec)
-
-    for entry in entries:
-        filename = entry["expected_filename"]
-        if entry.get("alt_text"):
-            prompt = (
-                f"Create a file named `{entry['expected_filename']}` with alt text \"{entry['alt_text']}\".\n"
-                f"Description:\n{entry['summary']}"
-            )
-            if entry.get("lesson_number") or entry.get("lesson_title"):
-                prompt += (
-                    f"\n(Lesson {entry.get('lesson_number')}: {entry.get('lesson_title')})"
-                )
-        else:
-            prompt = entry["summary"]
-        if verbose:
-            typer.echo(f"Generating {filename}")
-        image_bytes = generate_image(prompt, model=model, size=size)
-        Path(filename).write_bytes(image_bytes)
-        if verbose:
-            typer.echo(f"Wrote {filename}")
+    if since and not report.failures:
+        remember(docs_folder, since_key, commit)
+    _finish_report(report, report_path)
 
 
 @app.command("docs")
@@ -217,6 +726,17 @@ def docs_cmd(
     ),
     size: str = typer.Option("1024x1024", "--size", help="Image size, e.g. 1024x1024"),
     verbose: bool = typer.Option(False, "--verbose", "-v"),
+    shard: str = typer.Option(None, "--shard", help=SHARD_HELP, callback=validate_shard),
+    report_path: Path = typer.Option(None, "--report", help=REPORT_HELP),
+    keep_going: bool = typer.Option(False, "--keep-going", help=KEEP_GOING_HELP),
+    durability: str = durability_option(),
+    show_progress: bool | None = progress_option(),
+    progress_json: Path = progress_json_option(),
+    postprocess: bool = postprocess_option(),
+    quality: int = quality_option(),
+    thumbnails: List[int] = thumbnail_option(),
+    keep_metadata: bool = keep_metadata_option(),
+    since: str = since_option(),
 ) -> None:
     """Alias for :func:`generate_images_from_docs_cmd`."""
     generate_images_from_docs_cmd(
@@ -224,7 +744,497 @@ def docs_cmd(
         model=model,
         size=size,
         verbose=verbose,
+        shard=shard,
+        report_path=report_path,
+        keep_going=keep_going,
+        durability=durability,
+        show_progress=show_progress,
+        progress_json=progress_json,
+        postprocess=postprocess,
+        quality=quality,
+        thumbnails=thumbnails,
+        keep_metadata=keep_metadata,
+        since=since,
+    )
+
+
+def _clean(
+    folder: Path,
+    strip: bool,
+    rename: bool,
+    workers: int,
+    dry_run: bool,
+    durability: str,
+    report_path: Path | None,
+) -> None:
+    report = clean_folder(
+        folder,
+        strip=strip,
+        rename=rename,
+        workers=workers,
+        dry_run=dry_run,
+        durability=durability,
+    )
+    prefix = "Would clean" if dry_run else "Cleaned"
+    for rel in report.processed:
+        typer.echo(f"{prefix}: {rel}")
+    prefix = "Would rename" if dry_run else "Renamed"
+    for old, new in report.renamed.items():
+        typer.echo(f"{prefix}: {old} → {new}")
+    _finish_report(report, report_path)
+
+
+@app.command("strip-wrappers")
+def strip_wrappers_cmd(
+    folder: Path = typer.Argument(..., exists=True, file_okay=False, dir_okay=True),
+    workers: int = typer.Option(4, "--workers", min=1, help="Files handled at once"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="Only list the files to clean"),
+    durability: str = durability_option(),
+    report_path: Path = typer.Option(None, "--report", help=REPORT_HELP),
+) -> None:
+    """Remove code-fence wrappers around whole Markdown files under *folder*."""
+    _clean(folder, True, False, workers, dry_run, durability, report_path)
+
+
+@app.command("rename-by-heading")
+def rename_by_heading_cmd(
+    folder: Path = typer.Argument(..., exists=True, file_okay=False, dir_okay=True),
+    strip: bool = typer.Option(
+        False, "--strip-wrappers", help="Also remove code-fence wrappers"
+    ),
+    workers: int = typer.Option(4, "--workers", min=1, help="Files read at once"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="Only list the renames"),
+    durability: str = durability_option(),
+    report_path: Path = typer.Option(None, "--report", help=REPORT_HELP),
+) -> None:
+    """Rename Markdown files under *folder* after their first ``# `` heading.
+
+    Names that would clash with each other or with existing files are
+    reported and left unchanged.
+    """
+    _clean(folder, strip, True, workers, dry_run, durability, report_path)
+
+
+@app.command("merge-reports")
+def merge_reports_cmd(
+    report_files: List[Path] = typer.Argument(
+        ..., exists=True, file_okay=True, dir_okay=False, readable=True
+    ),
+    output: Path = typer.Option(
+        None, "--output", "-o", help="Write the merged report here instead of stdout"
+    ),
+) -> None:
+    """Merge per-shard reports written with ``--report`` into one."""
+    try:
+        merged = merge_reports(load_report(p) for p in report_files)
+    except (ValueError, json.JSONDecodeError) as exc:
+        raise typer.BadParameter(str(exc)) from exc
+    if output is None:
+        typer.echo(json.dumps(merged.to_dict(), indent=2))
+    else:
+        merged.write(output)
+
+
+@app.command("watch")
+def watch_cmd(
+    folder: Path = typer.Argument(..., exists=True, file_okay=False, dir_okay=True),
+    prompts: List[Path] = typer.Option(
+        [],
+        "--prompts",
+        help="Space-separated list of prompt files",
+        callback=validate_prompts,
+    ),
+    model: str = typer.Option(
+        None, "--model", help="Model for prompts (default from config) or images"
+    ),
+    max_tokens: int | None = typer.Option(None, "--max-tokens"),
+    regex_json: Path = typer.Option(
+        None, "--regex-json", exists=True, file_okay=True, dir_okay=False
+    ),
+    images: bool = typer.Option(
+        False, "--images", help="Generate images from changed files instead of prompting"
+    ),
+    size: str = typer.Option("1024x1024", "--size", help="Image size with --images"),
+    workers: int = typer.Option(1, "--workers", min=1),
+    debounce: float = typer.Option(
+        1.0, "--debounce", help="Seconds without changes before a batch is processed"
+    ),
+    poll_interval: float = typer.Option(
+        1.0, "--poll-interval", help="Seconds between scans when polling"
+    ),
+    polling: bool = typer.Option(
+        False, "--polling", help="Scan for changes instead of using inotify"
+    ),
+    durability: str = durability_option(),
+    verbose: bool = typer.Option(False, "--verbose", "-v"),
+) -> None:
+    """Process Markdown files under *folder* whenever they are created or changed."""
+    if images:
+
+        def handle(paths: List[Path]) -> List[Path]:
+            report = RunReport()
+            try:
+                entries = parse_markdown_image_entries(folder, paths)
+            except ValueError as exc:
+                typer.echo(str(exc), err=True)
+                return []
+            write_image_entries(
+                entries,
+                model or "dall-e-3",
+                size,
+                report,
+                verbose=verbose,
+                keep_going=True,
+                build_prompt=doc_prompt,
+                durability=durability,
+                generate=generate_image,
+                generate_many=generate_images,
+            )
+            _echo_failures(report)
+            return []
+
+    else:
+        prompt_list = _resolve_prompts(prompts)
+
+        def handle(paths: List[Path]) -> List[Path]:
+            if verbose:
+                typer.echo(f"Changed: {', '.join(str(p) for p in paths)}")
+            report = process_folder(
+                folder,
+                prompt_list,
+                model=model or DEFAULT_MODEL,
+                max_tokens=max_tokens,
+                regex_json=regex_json,
+                verbose=verbose,
+                keep_going=True,
+                workers=workers,
+                durability=durability,
+                files=paths,
+            )
+            _echo_failures(report)
+            return [folder / rel for rel in report.processed]
+
+    if verbose:
+        typer.echo(f"Watching {folder}")
+    try:
+        watch(
+            folder,
+            handle,
+            debounce=debounce,
+            poll_interval=poll_interval,
+            force_polling=polling,
+        )
+    except KeyboardInterrupt:  # pragma: no cover - interactive stop
+        pass
+
+
+plan_app = typer.Typer(help="Compile command inputs into a work-unit manifest.")
+app.add_typer(plan_app, name="plan")
+
+MANIFEST_OUTPUT_HELP = "Write the manifest here instead of stdout"
+
+
+def _emit_manifest(build, output: Path | None) -> None:
+    try:
+        manifest: Manifest = build()
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc)) from exc
+    if output is None:
+        typer.echo(json.dumps(manifest.to_dict(), indent=2))
+    else:
+        manifest.save(output)
+
+
+def _load_manifest(path: Path) -> Manifest:
+    try:
+        return load_manifest(path)
+    except (ValueError, KeyError, json.JSONDecodeError) as exc:
+        raise typer.BadParameter(f"Invalid manifest {path}: {exc}") from exc
+
+
+@plan_app.command("run")
+def plan_run_cmd(
+    folder: Path = typer.Argument(..., exists=True, file_okay=False, dir_okay=True),
+    prompts: List[Path] = typer.Option(
+        [], "--prompts", help="Prompt files", callback=validate_prompts
+    ),
+    model: str = typer.Option(DEFAULT_MODEL, "--model"),
+    max_tokens: int | None = typer.Option(None, "--max-tokens"),
+    regex_json: Path = typer.Option(
+        None, "--regex-json", exists=True, file_okay=True, dir_okay=False
+    ),
+    edit_mode: bool = typer.Option(False, "--edit-mode"),
+    output: Path = typer.Option(None, "--output", "-o", help=MANIFEST_OUTPUT_HELP),
+) -> None:
+    """Plan one prompt unit per Markdown file, like ``run``."""
+    prompt_list = _resolve_prompts(prompts)
+    _emit_manifest(
+        lambda: plan_run(folder, prompt_list, model, max_tokens, regex_json, edit_mode),
+        output,
+    )
+
+
+@plan_app.command("images")
+def plan_images_cmd(
+    json_files: List[Path] = typer.Argument(
+        ..., exists=True, file_okay=True, dir_okay=False, readable=True
+    ),
+    model: str = typer.Option("dall-e-3", "--model"),
+    size: str = typer.Option("1024x1024", "--size"),
+    output: Path = typer.Option(None, "--output", "-o", help=MANIFEST_OUTPUT_HELP),
+) -> None:
+    """Plan image units for ``generate-images`` JSON files."""
+    _emit_manifest(lambda: plan_spec_files(json_files, model, size), output)
+
+
+@plan_app.command("docs")
+def plan_docs_cmd(
+    docs_folder: Path = typer.Argument(..., exists=True, file_okay=False, dir_okay=True),
+    model: str = typer.Option("dall-e-3", "--model"),
+    size: str = typer.Option("1024x1024", "--size"),
+    output: Path = typer.Option(None, "--output", "-o", help=MANIFEST_OUTPUT_HELP),
+) -> None:
+    """Plan image units for ``generate-images-from-docs``."""
+    _emit_manifest(lambda: plan_docs(docs_folder, model, size), output)
+
+
+@plan_app.command("image")
+def plan_image_cmd(
+    prompt_file: Path = typer.Argument(
+        ..., exists=True, file_okay=True, dir_okay=False, readable=True
+    ),
+    model: str = typer.Option("dall-e-3", "--model"),
+    size: str = typer.Option("1024x1024", "--size"),
+    output: Path = typer.Option(None, "--output", "-o", help=MANIFEST_OUTPUT_HELP),
+) -> None:
+    """Plan the image unit for a ``generate-image`` prompt file."""
+    _emit_manifest(lambda: plan_prompt_file(prompt_file, model, size), output)
+
+
+@plan_app.command("merge")
+def plan_merge_cmd(
+    manifests: List[Path] = typer.Argument(
+        ..., exists=True, file_okay=True, dir_okay=False, readable=True
+    ),
+    output: Path = typer.Option(None, "--output", "-o", help=MANIFEST_OUTPUT_HELP),
+) -> None:
+    """Combine manifests, linking units to the units that write their sources."""
+    merged = Manifest()
+    for path in manifests:
+        merged = merged.extend(_load_manifest(path))
+    _emit_manifest(lambda: merged, output)
+
+
+@plan_app.command("show")
+def plan_show_cmd(
+    manifest_path: Path = typer.Argument(
+        ..., exists=True, file_okay=True, dir_okay=False, readable=True
+    ),
+) -> None:
+    """List the units of a manifest with their estimated cost and dependencies."""
+    manifest = _load_manifest(manifest_path)
+    totals: dict = {}
+    for unit in manifest.units:
+        deps = f" after {', '.join(unit.deps)}" if unit.deps else ""
+        typer.echo(f"{unit.id}\t{unit.kind}\t{unit.cost:g}{deps}")
+        totals[unit.kind] = totals.get(unit.kind, 0) + unit.cost
+    labels = {"prompt": "estimated tokens", "image": "images"}
+    for kind, total in totals.items():
+        typer.echo(f"Total {labels[kind]}: {total:g}")
+
+
+@plan_app.command("diff")
+def plan_diff_cmd(
+    old: Path = typer.Argument(..., exists=True, file_okay=True, dir_okay=False),
+    new: Path = typer.Argument(..., exists=True, file_okay=True, dir_okay=False),
+) -> None:
+    """Show units added, removed or changed between two manifests."""
+    diff = diff_manifests(_load_manifest(old), _load_manifest(new))
+    for marker, key in (("+", "added"), ("-", "removed"), ("~", "changed")):
+        for unit_id in diff[key]:
+            typer.echo(f"{marker} {unit_id}")
+
+
+@app.command("execute")
+def execute_cmd(
+    manifest_path: Path = typer.Argument(
+        ..., exists=True, file_okay=True, dir_okay=False, readable=True
+    ),
+    workers: int = typer.Option(4, "--workers", min=1, help="Units executed at once"),
+    state: Path = typer.Option(
+        None,
+        "--state",
+        help="Record finished units here and skip them when re-executing",
+    ),
+    report_path: Path = typer.Option(None, "--report", help=REPORT_HELP),
+    keep_going: bool = typer.Option(False, "--keep-going", help=KEEP_GOING_HELP),
+    durability: str = durability_option(),
+    schedule: str = schedule_option(),
+    verbose: bool = typer.Option(False, "--verbose", "-v"),
+) -> None:
+    """Execute the work units of a manifest written by ``mdgpt plan``."""
+    report = execute_manifest(
+        _load_manifest(manifest_path),
+        workers=workers,
+        keep_going=keep_going,
+        state_path=state,
+        durability=durability,
+        verbose=verbose,
+        schedule=schedule,
     )
+    _finish_report(report, report_path)
+
+
+QUEUE_HELP = "SQLite job queue shared by submit commands and serve"
+
+
+def _submit(queue_path: Path, kind: str, payload: dict) -> None:
+    queue = JobQueue(queue_path)
+    try:
+        job_id = queue.submit(kind, payload)
+    finally:
+        queue.close()
+    typer.echo(job_id)
+
+
+@app.command("serve")
+def serve_cmd(
+    queue_path: Path = typer.Option(DEFAULT_QUEUE_PATH, "--queue", help=QUEUE_HELP),
+    workers: int = typer.Option(2, "--workers", min=1, help="Jobs processed at once"),
+    max_requests: int | None = typer.Option(
+        None, "--max-requests", min=1, help="Cap on concurrent API calls across jobs"
+    ),
+    poll_interval: float = typer.Option(
+        1.0, "--poll-interval", help="Seconds between checks for new jobs"
+    ),
+    until_idle: bool = typer.Option(
+        False, "--until-idle", help="Exit once no job is left to claim"
+    ),
+    lease: float = typer.Option(
+        LEASE_SECONDS,
+        "--lease",
+        help="Seconds without a heartbeat after which another worker's running job is requeued",
+    ),
+    verbose: bool = typer.Option(False, "--verbose", "-v"),
+) -> None:
+    """Run a long-lived worker that processes jobs from the queue."""
+    if poll_interval >= lease:
+        raise typer.BadParameter("--poll-interval must be shorter than --lease")
+    queue = JobQueue(queue_path)
+    try:
+        serve(
+            queue,
+            workers=workers,
+            max_requests=max_requests,
+            poll_interval=poll_interval,
+            until_idle=until_idle,
+            verbose=verbose,
+            lease=lease,
+        )
+    except KeyboardInterrupt:  # pragma: no cover - interactive stop
+        pass
+    finally:
+        queue.close()
+
+
+@app.command("submit-run")
+def submit_run_cmd(
+    folder: Path = typer.Argument(..., exists=True, file_okay=False, dir_okay=True),
+    prompts: List[Path] = typer.Option(
+        ..., "--prompts", help="Prompt files", callback=validate_prompts
+    ),
+    model: str = typer.Option(DEFAULT_MODEL, "--model", help="Default OpenAI model"),
+    max_tokens: int | None = typer.Option(None, "--max-tokens"),
+    regex_json: Path = typer.Option(
+        None, "--regex-json", exists=True, file_okay=True, dir_okay=False
+    ),
+    workers: int = typer.Option(1, "--workers", min=1),
+    queue_path: Path = typer.Option(DEFAULT_QUEUE_PATH, "--queue", help=QUEUE_HELP),
+) -> None:
+    """Queue a ``run`` job for ``mdgpt serve`` and print its ID."""
+    _submit(
+        queue_path,
+        "run",
+        {
+            "folder": str(folder.resolve()),
+            "prompts": [str(p.resolve()) for p in prompts],
+            "model": model,
+            "max_tokens": max_tokens,
+            "regex_json": str(regex_json.resolve()) if regex_json else None,
+            "workers": workers,
+        },
+    )
+
+
+@app.command("submit-images")
+def submit_images_cmd(
+    json_files: List[Path] = typer.Argument(
+        ..., exists=True, file_okay=True, dir_okay=False, readable=True
+    ),
+    model: str = typer.Option("dall-e-3", "--model"),
+    size: str = typer.Option("1024x1024", "--size"),
+    queue_path: Path = typer.Option(DEFAULT_QUEUE_PATH, "--queue", help=QUEUE_HELP),
+) -> None:
+    """Queue a ``generate-images`` job for ``mdgpt serve`` and print its ID."""
+    _submit(
+        queue_path,
+        "images",
+        {
+            "json_files": [str(p.resolve()) for p in json_files],
+            "model": model,
+            "size": size,
+            "cwd": str(Path.cwd()),
+        },
+    )
+
+
+@app.command("submit-docs")
+def submit_docs_cmd(
+    docs_folder: Path = typer.Argument(
+        ..., exists=True, file_okay=False, dir_okay=True
+    ),
+    model: str = typer.Option("dall-e-3", "--model"),
+    size: str = typer.Option("1024x1024", "--size"),
+    queue_path: Path = typer.Option(DEFAULT_QUEUE_PATH, "--queue", help=QUEUE_HELP),
+) -> None:
+    """Queue a ``generate-images-from-docs`` job and print its ID."""
+    _submit(
+        queue_path,
+        "docs",
+        {
+            "folder": str(docs_folder.resolve()),
+            "model": model,
+            "size": size,
+            "cwd": str(Path.cwd()),
+        },
+    )
+
+
+@app.command("jobs")
+def jobs_cmd(
+    job_id: int | None = typer.Argument(None, help="Show one job in full"),
+    status: str | None = typer.Option(None, "--status", help="Filter by status"),
+    queue_path: Path = typer.Option(DEFAULT_QUEUE_PATH, "--queue", help=QUEUE_HELP),
+) -> None:
+    """Show the status of queued, running and finished jobs."""
+    queue = JobQueue(queue_path)
+    try:
+        if job_id is not None:
+            job = queue.get(job_id)
+            if job is None:
+                raise typer.BadParameter(f"No job {job_id}")
+            typer.echo(json.dumps(job.to_dict(), indent=2))
+            return
+        for job in queue.list(status):
+            detail = job.error or ""
+            if job.result:
+                detail = (
+                    f"{len(job.result.get('processed', []))} processed, "
+                    f"{len(job.result.get('failures', []))} failed"
+                )
+            typer.echo(f"{job.id}\t{job.kind}\t{job.status}\t{detail}")
+    finally:
+        queue.close()
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -1,29 +1,131 @@
 import os
 from pathlib import Path
+from typing import Dict, List, NamedTuple
 import tomllib
 from dotenv import load_dotenv
 
+from .key_pool import STRATEGIES
+
 load_dotenv()
 
+
+class ApiKeySpec(NamedTuple):
+    key: str
+    base_url: str | None = None
+    weight: int = 1
+
+
+def _parse_api_keys(value: str) -> List[ApiKeySpec]:
+    """Parse ``OPENAI_API_KEYS``: comma-separated ``key[@base_url][*weight]``."""
+    specs: List[ApiKeySpec] = []
+    for item in value.replace("\n", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        weight = 1
+        if "*" in item:
+            item, weight_text = item.rsplit("*", 1)
+            try:
+                weight = int(weight_text)
+            except ValueError as exc:
+                raise RuntimeError(f"Invalid weight in OPENAI_API_KEYS: {weight_text}") from exc
+        key, _, base_url = item.partition("@")
+        specs.append(ApiKeySpec(key.strip(), base_url.strip() or None, weight))
+    return specs
+
+
+OPENAI_API_KEYS = _parse_api_keys(os.getenv("OPENAI_API_KEYS", ""))
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+if not OPENAI_API_KEY and OPENAI_API_KEYS:
+    OPENAI_API_KEY = OPENAI_API_KEYS[0].key
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY not found in environment or .env file")
+if not OPENAI_API_KEYS:
+    OPENAI_API_KEYS = [ApiKeySpec(OPENAI_API_KEY)]
 
 
-def _load_defaults() -> tuple[str, float]:
-    """Return (model, temperature) defaults from pyproject.toml."""
+def _load_tool_config() -> dict:
+    """Return the ``[tool.md_batch_gpt]`` table from pyproject.toml."""
     pyproject = Path(__file__).resolve().parents[1] / "pyproject.toml"
     if not pyproject.exists():
-        return "o3", 0.2
+        return {}
     try:
         with pyproject.open("rb") as f:
             data = tomllib.load(f)
-        tool_cfg = data.get("tool", {}).get("md_batch_gpt", {})
-        model = tool_cfg.get("model", "o3")
-        temperature = float(tool_cfg.get("temperature", 0.2))
+        return data.get("tool", {}).get("md_batch_gpt", {})
+    except Exception:
+        return {}
+
+
+def _load_defaults() -> tuple[str, float]:
+    """Return (model, temperature) defaults from pyproject.toml."""
+    try:
+        model = TOOL_CONFIG.get("model", "o3")
+        temperature = float(TOOL_CONFIG.get("temperature", 0.2))
         return model, temperature
     except Exception:
         return "o3", 0.2
 
 
+TOOL_CONFIG = _load_tool_config()
 DEFAULT_MODEL, DEFAULT_TEMPERATURE = _load_defaults()
+
+# API key pool behaviour, see :mod:`md_batch_gpt.key_pool`
+def _key_selection(value: object) -> str:
+    if value not in STRATEGIES:
+        raise ValueError(
+            f"[tool.md_batch_gpt] key_selection must be one of {', '.join(STRATEGIES)}, "
+            f"not {value!r}"
+        )
+    return str(value)
+
+
+def _key_failure_threshold(value: object) -> int:
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(
+            f"[tool.md_batch_gpt] key_failure_threshold must be a positive integer, "
+            f"not {value!r}"
+        )
+    return value
+
+
+KEY_SELECTION = _key_selection(TOOL_CONFIG.get("key_selection", "round-robin"))
+KEY_FAILURE_THRESHOLD = _key_failure_threshold(TOOL_CONFIG.get("key_failure_threshold", 5))
+
+# Model routing rules and per-model fallback chains, see :mod:`md_batch_gpt.routing`
+ROUTES_CONFIG = TOOL_CONFIG.get("routes", [])
+
+
+def _parse_fallbacks(table: object) -> Dict[str, List[str]]:
+    """Return the ``[tool.md_batch_gpt.fallbacks]`` chains; each model maps
+    to one fallback model name or a list of them."""
+    if not isinstance(table, dict):
+        raise ValueError("[tool.md_batch_gpt.fallbacks] must be a table")
+    chains: Dict[str, List[str]] = {}
+    for model, chain in table.items():
+        if isinstance(chain, str):
+            chain = [chain]
+        if not isinstance(chain, list) or not all(isinstance(m, str) for m in chain):
+            raise ValueError(
+                f"[tool.md_batch_gpt.fallbacks] {model} must be a model name "
+                "or a list of model names"
+            )
+        chains[str(model)] = chain
+    return chains
+
+
+FALLBACK_MODELS = _parse_fallbacks(TOOL_CONFIG.get("fallbacks", {}))
+
+# Default for --durability, see :class:`md_batch_gpt.file_io.AtomicBatchWriter`
+DURABILITY = str(TOOL_CONFIG.get("durability", "file"))
+
+# Request hedging defaults, see :mod:`md_batch_gpt.hedging`; unset disables it
+_HEDGE = TOOL_CONFIG.get("hedging", {})
+HEDGE_PERCENTILE = float(_HEDGE["percentile"]) if "percentile" in _HEDGE else None
+HEDGE_MAX_RATE = float(_HEDGE.get("max_rate", 0.05))
+
+# httpx connection pool, HTTP/2 and timeout settings, see :mod:`md_batch_gpt.http_client`
+HTTP_CONFIG = dict(TOOL_CONFIG.get("http", {}))
+
+# Share one request between identical concurrent calls, see :mod:`md_batch_gpt.single_flight`
+SINGLE_FLIGHT = bool(TOOL_CONFIG.get("single_flight", True))
@@ -0,0 +1,58 @@
+"""Structured edit lists returned by the model instead of full documents."""
+
+from __future__ import annotations
+
+from typing import Dict, List
+import json
+
+EDIT_INSTRUCTIONS = """\
+Do not return the whole document. Return only a JSON array of edits to apply
+to the user's text, in order, and nothing else:
+[{"find": "<exact text copied from the document>", "replace": "<new text>"}]
+Each "find" must appear exactly once in the document at the time it is
+applied; include enough surrounding text to make it unique. Return [] if no
+changes are needed."""
+
+
+class EditError(ValueError):
+    """Raised when an edit list cannot be parsed or applied cleanly."""
+
+
+def parse_edits(response: str | None) -> List[Dict[str, str]]:
+    """Return the edit list in the model *response*, tolerating a code fence."""
+    if response is None:
+        raise EditError("Model returned no edit list")
+    text = response.strip()
+    if text.startswith("```"):
+        first_nl = text.find("\n")
+        end = text.rfind("```")
+        if first_nl == -1 or end <= first_nl:
+            raise EditError("Malformed code block around edit list")
+        text = text[first_nl + 1 : end]
+    try:
+        edits = json.loads(text)
+    except json.JSONDecodeError as exc:
+        raise EditError(f"Edit list is not valid JSON: {exc}") from exc
+    if not isinstance(edits, list):
+        raise EditError("Edit list must be a JSON array")
+    for idx, edit in enumerate(edits):
+        if (
+            not isinstance(edit, dict)
+            or not isinstance(edit.get("find"), str)
+            or not isinstance(edit.get("replace"), str)
+            or not edit["find"]
+        ):
+            raise EditError(f"Edit {idx} must have non-empty find and a replace string")
+    return edits
+
+
+def apply_edits(original: str, edits: List[Dict[str, str]]) -> str:
+    """Apply *edits* to *original* in order, requiring each find to be unique."""
+    text = original
+    for idx, edit in enumerate(edits):
+        find = edit["find"]
+        count = text.count(find)
+        if count != 1:
+            raise EditError(f"Edit {idx} find text occurs {count} times, expected 1")
+        text = text.replace(find, edit["replace"], 1)
+    return text
@@ -3,7 +3,16 @@ from __future__ import annotations
 from pathlib import Path
 from tempfile import NamedTemporaryFile
 import os
-from typing import Iterator
+import shutil
+import stat
+from typing import Container, Iterable, Iterator, List, Tuple
+import time
+
+from . import metrics
+
+# "none": rename only, "file": fsync file contents, "dir": also fsync the
+# parent directory so the rename itself survives a crash
+DURABILITY_LEVELS = ("none", "file", "dir")
 
 
 def read_text(path: Path) -> str:
@@ -12,26 +21,248 @@ def read_text(path: Path) -> str:
     return path.read_text(encoding="utf-8")
 
 
+def is_markdown_file(folder: Path, path: Path) -> bool:
+    """Return True if *path* is a ``*.md`` file :func:`iter_markdown_files` would yield."""
+    path = Path(path)
+    if path.suffix != ".md":
+        return False
+    try:
+        relative_parts = path.relative_to(folder).parts
+    except ValueError:
+        return False
+    # Skip any file or directory that starts with a dot
+    return not any(part.startswith(".") for part in relative_parts)
+
+
 def iter_markdown_files(folder: Path) -> Iterator[Path]:
     """Yield paths to Markdown files under *folder* skipping dotfiles."""
     folder = Path(folder)
     for path in folder.rglob("*.md"):
-        # Skip any file or directory that starts with a dot
-        relative_parts = path.relative_to(folder).parts
-        if any(part.startswith(".") for part in relative_parts):
-            continue
-        yield path
+        if is_markdown_file(folder, path):
+            yield path
+
+
+def _umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# Mode of newly created files, as open() would give them; temporary files
+# are created 0600
+NEW_FILE_MODE = 0o666 & ~_umask()
+
+
+def _target_mode(path: Path) -> int:
+    """Return the mode a write to *path* should leave: the existing one, if any."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return NEW_FILE_MODE
+
+
+def _fsync_dir(path: Path) -> None:
+    """Flush the directory entry table of *path* to disk where supported."""
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    except OSError:  # pragma: no cover - e.g. Windows cannot open directories
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class PartialWriteError(OSError):
+    """Raised when committing a batch fails after some files were replaced.
+
+    *written* are the targets already renamed into place; the writes to the
+    other targets were discarded. The original error is the ``__cause__``.
+    """
+
+    def __init__(self, message: str, written: List[Path]) -> None:
+        super().__init__(message)
+        self.written = written
+
+
+class AtomicBatchWriter:
+    """Stage many atomic writes and commit them as a group.
 
+    :meth:`stage` writes each payload to a temporary file next to its target.
+    :meth:`commit` then fsyncs all staged files, renames them into place and
+    fsyncs every affected directory once, according to *durability*. Used as
+    a context manager the batch is committed on success and discarded if an
+    exception escapes.
+    """
 
-def write_atomic(path: Path, data: str) -> None:
+    def __init__(self, durability: str = "file") -> None:
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(
+                f"Unknown durability {durability!r}; use one of {', '.join(DURABILITY_LEVELS)}"
+            )
+        self.durability = durability
+        self._staged: List[Tuple[str, Path]] = []
+        self._staged_bytes = 0
+
+    def stage(self, path: Path, data: str | bytes) -> None:
+        """Write *data* to a temporary file that will replace *path* on commit."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(data, bytes):
+            tmp = NamedTemporaryFile("wb", dir=path.parent, delete=False)
+        else:
+            tmp = NamedTemporaryFile(
+                "w", encoding="utf-8", dir=path.parent, delete=False
+            )
+        with tmp:
+            self._staged.append((tmp.name, path))
+            os.chmod(tmp.name, _target_mode(path))
+            tmp.write(data)
+            tmp.flush()
+            self._staged_bytes += os.fstat(tmp.fileno()).st_size
+
+    def commit(self) -> List[Path]:
+        """Make every staged write durable and visible; return the target paths.
+
+        If a rename fails after others succeeded, :class:`PartialWriteError`
+        reports which targets were replaced; other errors leave every target
+        untouched.
+        """
+        staged, self._staged = self._staged, []
+        staged_bytes, self._staged_bytes = self._staged_bytes, 0
+        started = time.perf_counter()
+        renamed = 0
+        try:
+            if self.durability != "none":
+                for tmp_name, _ in staged:
+                    fd = os.open(tmp_name, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+            for tmp_name, path in staged:
+                os.replace(tmp_name, path)
+                renamed += 1
+        except BaseException as exc:
+            self._staged = staged[renamed:]
+            self.abort()
+            if renamed and isinstance(exc, OSError):
+                written = [path for _, path in staged[:renamed]]
+                raise PartialWriteError(
+                    f"{exc} (after writing {renamed} of {len(staged)} files)", written
+                ) from exc
+            raise
+        if self.durability == "dir":
+            for directory in dict.fromkeys(path.parent for _, path in staged):
+                _fsync_dir(directory)
+        metrics.BYTES_WRITTEN.inc(staged_bytes)
+        metrics.WRITE_SECONDS.observe(time.perf_counter() - started)
+        return [path for _, path in staged]
+
+    def abort(self) -> None:
+        """Remove any staged temporary files without touching the targets."""
+        staged, self._staged = self._staged, []
+        self._staged_bytes = 0
+        for tmp_name, _ in staged:
+            try:
+                os.unlink(tmp_name)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self) -> "AtomicBatchWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def write_atomic_batch(
+    items: Iterable[Tuple[Path, str | bytes]], durability: str = "file"
+) -> List[Path]:
+    """Atomically write every ``(path, data)`` pair in *items* as one group.
+
+    Each file is replaced atomically, but a failure can leave the group
+    partly written (see :class:`PartialWriteError`).
+    """
+    batch = AtomicBatchWriter(durability)
+    try:
+        for path, data in items:
+            batch.stage(path, data)
+    except BaseException:
+        batch.abort()
+        raise
+    return batch.commit()
+
+
+def write_atomic(path: Path, data: str, durability: str = "file") -> None:
     """Atomically write *data* to *path* using a temporary file."""
-    path = Path(path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with NamedTemporaryFile(
-        "w", encoding="utf-8", dir=path.parent, delete=False
-    ) as tmp:
-        tmp.write(data)
-        tmp.flush()
-        os.fsync(tmp.fileno())
-        tmp_name = tmp.name
-    os.replace(tmp_name, path)
+    write_atomic_batch([(path, data)], durability)
+
+
+def write_atomic_bytes(path: Path, data: bytes, durability: str = "file") -> None:
+    """Atomically write binary *data* (e.g. an image) to *path*."""
+    write_atomic_batch([(path, data)], durability)
+
+
+def link_or_copy(src: Path, dst: Path, replace: bool = False) -> bool:
+    """Make *dst* a hard link to *src*, or a copy where links are impossible.
+
+    An existing *dst* is left alone (returning False) unless *replace* is
+    set, in which case it is swapped out atomically. Because every write in
+    this package replaces files by rename, a linked *dst* that is later
+    processed never changes *src*.
+    """
+    src, dst = Path(src), Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if not replace:
+        try:
+            os.link(src, dst)
+            return True
+        except FileExistsError:
+            return False
+        except OSError:
+            # other filesystem, or no hard link support
+            if dst.exists():
+                return False
+    with NamedTemporaryFile(dir=dst.parent, delete=False) as tmp:
+        pass
+    try:
+        os.unlink(tmp.name)
+        try:
+            os.link(src, tmp.name)
+        except OSError:
+            shutil.copy2(src, tmp.name)
+        os.replace(tmp.name, dst)
+    except BaseException:
+        try:
+            os.unlink(tmp.name)
+        except FileNotFoundError:
+            pass
+        raise
+    return True
+
+
+def mirror_tree(folder: Path, output_dir: Path, skip: Container[str] = ()) -> int:
+    """Link every visible file under *folder* into *output_dir* unless present.
+
+    Dot files and directories are skipped, as is *output_dir* itself when
+    it lies inside *folder*, and files whose *folder*-relative POSIX path is
+    in *skip*. Return the number of files linked or copied.
+    """
+    folder, output_dir = Path(folder), Path(output_dir)
+    inside = output_dir.resolve()
+    linked = 0
+    for dirpath, dirnames, filenames in os.walk(folder):
+        directory = Path(dirpath)
+        dirnames[:] = [
+            d for d in dirnames
+            if not d.startswith(".") and (directory / d).resolve() != inside
+        ]
+        rel_dir = directory.relative_to(folder)
+        for name in filenames:
+            if not name.startswith(".") and (rel_dir / name).as_posix() not in skip:
+                linked += link_or_copy(directory / name, output_dir / rel_dir / name)
+    return linked
@@ -0,0 +1,143 @@
+"""Selecting the files that changed since a git commit.
+
+Instead of reading or hashing every file, ``--since <ref>`` asks git which
+files under a folder differ from *ref* (committed, staged or not) and which
+are untracked. ``--since last`` uses the commit recorded under
+``<folder>/.mdgpt/since.json`` by the previous run of the same command.
+
+A run rewrites the files it processes, so until those results are committed
+they also show up as changed. The record therefore keeps a hash of every
+file the run wrote; a changed file whose content still has that hash is not
+selected again.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+import hashlib
+import json
+import subprocess
+
+from .file_io import write_atomic
+
+LAST = "last"
+STATE_DIR = ".mdgpt"
+STATE_FILE = "since.json"
+
+
+class GitError(RuntimeError):
+    """Raised when a git command fails, e.g. outside a repository."""
+
+
+def _git(folder: Path, *args: str) -> str:
+    try:
+        proc = subprocess.run(
+            ["git", "-C", str(folder), *args], capture_output=True, check=False
+        )
+    except FileNotFoundError as exc:
+        raise GitError("git is not installed") from exc
+    if proc.returncode != 0:
+        message = proc.stderr.decode("utf-8", "replace").strip()
+        raise GitError(message or f"git {args[0]} failed")
+    return proc.stdout.decode("utf-8", "surrogateescape")
+
+
+def head_commit(folder: Path) -> str:
+    """Return the commit checked out in the repository containing *folder*."""
+    return _git(folder, "rev-parse", "--verify", "HEAD").strip()
+
+
+def changed_files(folder: Path, since: str) -> List[Path]:
+    """Return existing files under *folder* that differ from *since* or are untracked.
+
+    Deleted files are left out; a renamed file is listed under its new name.
+    Untracked files are subject to the repository's ignore rules.
+    """
+    folder = Path(folder)
+    diff = _git(
+        folder, "diff", "--name-only", "-z", "--diff-filter=ACMRT", "--relative",
+        since, "--", ".",
+    )
+    untracked = _git(folder, "ls-files", "--others", "--exclude-standard", "-z", "--", ".")
+    names = sorted({n for n in (diff + untracked).split("\0") if n})
+    return [folder / name for name in names if (folder / name).is_file()]
+
+
+def content_hash(path: Path) -> str:
+    """Return the SHA-256 of the bytes in *path*."""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def _state_path(folder: Path) -> Path:
+    return Path(folder) / STATE_DIR / STATE_FILE
+
+
+def _load_state(folder: Path) -> Dict[str, Dict]:
+    path = _state_path(folder)
+    if not path.exists():
+        return {}
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Invalid JSON in {path}: {exc}") from exc
+    if not isinstance(state, dict):
+        raise ValueError(f"{path} does not contain an object")
+    return state
+
+
+def select_since(
+    folder: Path, since: str, key: str, accept: Callable[[Path], bool]
+) -> Tuple[List[Path] | None, Dict[str, str]]:
+    """Return the files accepted by *accept* that changed since *since*.
+
+    *since* is a git ref, or ``"last"`` for the commit :func:`remember`
+    recorded for *key*; without a record the first item is ``None``, meaning
+    every file. With ``"last"``, changed files still holding the content the
+    recorded run wrote are left out and returned, with their hashes, as the
+    second item so the next record can keep them.
+    """
+    folder = Path(folder)
+    record: Dict = {}
+    if since == LAST:
+        record = _load_state(folder).get(key) or {}
+        if not record.get("commit"):
+            return None, {}
+        since = record["commit"]
+    written: Dict[str, str] = record.get("written", {})
+    selected: List[Path] = []
+    ours: Dict[str, str] = {}
+    for path in changed_files(folder, since):
+        if not accept(path):
+            continue
+        rel = path.relative_to(folder).as_posix()
+        if rel in written and content_hash(path) == written[rel]:
+            ours[rel] = written[rel]
+            continue
+        selected.append(path)
+    return selected, ours
+
+
+def remember(
+    folder: Path,
+    key: str,
+    commit: str,
+    written: Iterable[str] = (),
+    kept: Dict[str, str] | None = None,
+) -> None:
+    """Record *commit* as processed for *key* in *folder*'s state file.
+
+    *written* are the folder-relative paths the run wrote; their current
+    hashes are stored along with the *kept* ones from :func:`select_since`.
+    """
+    folder = Path(folder)
+    hashes = dict(kept or {})
+    for rel in written:
+        path = folder / rel
+        if path.is_file():
+            hashes[rel] = content_hash(path)
+    state = _load_state(folder)
+    state[key] = {"commit": commit, "written": dict(sorted(hashes.items()))}
+    path = _state_path(folder)
+    path.parent.mkdir(exist_ok=True)
+    write_atomic(path, json.dumps(state, indent=2) + "\n", "none")
@@ -0,0 +1,137 @@
+"""Hedged API calls: duplicate a slow call and keep whichever finishes first."""
+
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Callable, Deque, Dict, TypeVar
+import contextvars
+import threading
+import time
+
+T = TypeVar("T")
+
+
+def _spawn(fn: Callable[[], T]) -> "Future[T]":
+    """Run *fn* on a new daemon thread and return a future for its result.
+
+    *fn* runs in a copy of the caller's :mod:`contextvars` context.
+    """
+    future: Future = Future()
+    context = contextvars.copy_context()
+
+    def run() -> None:
+        try:
+            future.set_result(context.run(fn))
+        except BaseException as exc:  # propagated through the future
+            future.set_exception(exc)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+class Hedger:
+    """Send a second copy of a call that is slower than usual.
+
+    Latencies of successful calls are kept per *kind* (the last *window*
+    of them). Once *min_samples* are known, a call still running after the
+    *percentile* latency is duplicated, and the first successful result
+    wins. At most *max_rate* of all calls are hedged, which bounds the extra
+    cost. The losing call cannot be aborted; it finishes in the background
+    and its result is passed to ``on_discard`` so usage can still be
+    counted.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        max_rate: float = 0.05,
+        min_samples: int = 20,
+        window: int = 500,
+    ) -> None:
+        if not 0 < percentile < 100:
+            raise ValueError("Hedge percentile must be between 0 and 100")
+        if not 0 <= max_rate <= 1:
+            raise ValueError("Hedge max rate must be between 0 and 1")
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.window = window
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+
+    def observe(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(kind, deque(maxlen=self.window)).append(seconds)
+
+    def threshold(self, kind: str) -> float | None:
+        """Return the hedge delay for *kind*, or None until enough samples exist."""
+        with self._lock:
+            samples = sorted(self._latencies.get(kind, ()))
+        if len(samples) < self.min_samples:
+            return None
+        idx = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return samples[idx]
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            if self.fired + 1 > self.max_rate * self.calls:
+                return False
+            self.fired += 1
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "hedges": self.fired, "hedges_won": self.won}
+
+    def _timed(self, kind: str, fn: Callable[[], T]) -> Callable[[], T]:
+        def run() -> T:
+            started = time.perf_counter()
+            result = fn()
+            self.observe(kind, time.perf_counter() - started)
+            return result
+
+        return run
+
+    def call(
+        self,
+        kind: str,
+        fn: Callable[[], T],
+        on_discard: Callable[[T], None] | None = None,
+        on_hedge: Callable[[bool], None] | None = None,
+    ) -> T:
+        """Return ``fn()``, hedging it if it runs past the latency threshold.
+
+        *on_hedge* is called with whether the hedge won each time one fires.
+        """
+        with self._lock:
+            self.calls += 1
+        delay = self.threshold(kind)
+        if delay is None:
+            return self._timed(kind, fn)()
+        primary = _spawn(self._timed(kind, fn))
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._may_hedge():
+            return primary.result()
+        hedge = _spawn(fn)
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        # Prefer a successful result; a failed first call waits for the other
+        winner = primary if primary in done else hedge
+        if winner.exception() is not None:
+            winner = hedge if winner is primary else primary
+        loser = hedge if winner is primary else primary
+        result = winner.result()
+        hedge_won = winner is hedge
+        if hedge_won:
+            with self._lock:
+                self.won += 1
+        if on_hedge is not None:
+            on_hedge(hedge_won)
+        if on_discard is not None:
+            loser.add_done_callback(
+                lambda f: f.exception() is None and on_discard(f.result())
+            )
+        return result
@@ -0,0 +1,121 @@
+"""Connection pool, HTTP/2 and timeout settings for API and download traffic."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict
+
+import httpx
+import openai
+
+H2_HINT = "HTTP/2 needs the h2 package: pip install 'md-batch-gpt[http2]'"
+
+
+@dataclass(frozen=True)
+class HttpSettings:
+    """Settings for the shared httpx client; ``None`` keeps the OpenAI default.
+
+    The defaults of the openai library are 1000 connections, 100 kept
+    alive for 5 seconds, a 5 second connect and a 600 second read timeout,
+    over HTTP/1.1. *read_timeout* also bounds sending a request and waiting
+    for a free pooled connection. With *http2* many concurrent requests
+    share a few multiplexed connections.
+    """
+
+    max_connections: int | None = None
+    max_keepalive: int | None = None
+    keepalive_expiry: float | None = None
+    connect_timeout: float | None = None
+    read_timeout: float | None = None
+    http2: bool = False
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "HttpSettings":
+        """Return settings from a ``[tool.md_batch_gpt.http]`` table.
+
+        Raise ValueError for unknown keys or values of the wrong type.
+        """
+        known = {f.name for f in fields(cls)}
+        unknown = sorted(set(config) - known)
+        if unknown:
+            raise ValueError(f"Unknown http settings: {', '.join(unknown)}")
+        if not isinstance(config.get("http2", False), bool):
+            raise ValueError("Invalid http setting: http2 must be true or false")
+        try:
+            values = {
+                name: (value if name == "http2" else _number(name, value))
+                for name, value in config.items()
+            }
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f"Invalid http setting: {exc}") from exc
+        return cls(**values)
+
+    def merged(self, **overrides: Any) -> "HttpSettings":
+        """Return a copy with the non-``None`` *overrides* applied."""
+        return replace(self, **{k: v for k, v in overrides.items() if v is not None})
+
+    def is_default(self) -> bool:
+        return self == HttpSettings()
+
+    def limits(self) -> httpx.Limits:
+        default = openai.DEFAULT_CONNECTION_LIMITS
+        return httpx.Limits(
+            max_connections=_pick(self.max_connections, default.max_connections),
+            max_keepalive_connections=_pick(
+                self.max_keepalive, default.max_keepalive_connections
+            ),
+            keepalive_expiry=_pick(self.keepalive_expiry, default.keepalive_expiry),
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        default = openai.DEFAULT_TIMEOUT
+        read = _pick(self.read_timeout, default.read)
+        return httpx.Timeout(
+            connect=_pick(self.connect_timeout, default.connect),
+            read=read,
+            write=_pick(self.read_timeout, default.write),
+            pool=_pick(self.read_timeout, default.pool),
+        )
+
+
+def _number(name: str, value: Any) -> float | int:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"{name} must be a positive number")
+    if name.startswith("max_"):
+        if int(value) != value:
+            raise ValueError(f"{name} must be a whole number")
+        return int(value)
+    return float(value)
+
+
+def _pick(value, default):
+    return default if value is None else value
+
+
+def require_h2() -> None:
+    """Raise RuntimeError with an install hint if HTTP/2 support is missing."""
+    try:
+        import h2  # noqa: F401
+    except ImportError as exc:
+        raise RuntimeError(H2_HINT) from exc
+
+
+def build_client(settings: HttpSettings) -> httpx.Client:
+    """Return an httpx client for the OpenAI SDK configured by *settings*."""
+    if settings.http2:
+        require_h2()
+    return openai.DefaultHttpxClient(
+        limits=settings.limits(), timeout=settings.timeout(), http2=settings.http2
+    )
+
+
+def build_download_client(settings: HttpSettings) -> httpx.Client:
+    """Return an httpx client for fetching generated images from their URLs."""
+    if settings.http2:
+        require_h2()
+    return httpx.Client(
+        limits=settings.limits(),
+        timeout=settings.timeout(),
+        http2=settings.http2,
+        follow_redirects=True,
+    )
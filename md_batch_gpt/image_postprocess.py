@@ -0,0 +1,158 @@
+"""Optional re-encoding of generated images (requires Pillow).
+
+The API returns large PNGs. :func:`postprocess_image` re-encodes them in the
+format given by the target file extension (``.webp``, ``.jpg``, ``.avif``,
+...), writes smaller responsive variants next to them and drops metadata.
+:class:`ImagePostProcessor` runs it in a process pool so the CPU-bound
+encoding overlaps with the following API calls.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Tuple
+import io
+import time
+
+from .file_io import write_atomic_batch
+
+INSTALL_HINT = "Image post-processing needs Pillow: pip install 'md-batch-gpt[images]'"
+
+
+@dataclass(frozen=True)
+class PostProcessOptions:
+    """Settings for :func:`postprocess_image`.
+
+    *thumbnails* are widths in pixels; each one narrower than the image is
+    written as ``name-<width>w.ext``. With *strip_metadata* only the ICC
+    colour profile is kept.
+    """
+
+    quality: int = 85
+    thumbnails: Tuple[int, ...] = ()
+    strip_metadata: bool = True
+    optimize: bool = True
+
+
+def require_pillow() -> None:
+    """Raise RuntimeError with an install hint if Pillow is missing."""
+    try:
+        import PIL  # noqa: F401
+    except ImportError as exc:
+        raise RuntimeError(INSTALL_HINT) from exc
+
+
+def variant_path(path: Path, width: int) -> Path:
+    """Return the path of the *width* pixel wide variant of *path*."""
+    return path.with_name(f"{path.stem}-{width}w{path.suffix}")
+
+
+def _format_for(path: Path) -> str:
+    from PIL import Image
+
+    fmt = Image.registered_extensions().get(path.suffix.lower())
+    if fmt is None:
+        raise ValueError(
+            f"Cannot encode {path.name}: no image format for "
+            f"{path.suffix or 'files without an extension'!r}"
+        )
+    return fmt
+
+
+def _encode(img, fmt: str, options: PostProcessOptions) -> bytes:
+    from PIL import Image
+
+    params: Dict[str, object] = {}
+    keep = ("icc_profile",) if options.strip_metadata else ("icc_profile", "exif", "dpi")
+    for key in keep:
+        if img.info.get(key):
+            params[key] = img.info[key]
+    if fmt == "JPEG":
+        if img.mode not in ("RGB", "L"):
+            # JPEG has no alpha channel; flatten onto white
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        params.update(quality=options.quality, optimize=options.optimize, progressive=True)
+    elif fmt == "WEBP":
+        params.update(quality=options.quality, method=6 if options.optimize else 4)
+    elif fmt == "AVIF":
+        params.update(quality=options.quality)
+    elif fmt == "PNG":
+        params.update(optimize=options.optimize)
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **params)
+    return buf.getvalue()
+
+
+def postprocess_image(
+    data: bytes,
+    path: str | Path,
+    options: PostProcessOptions = PostProcessOptions(),
+    durability: str = "file",
+) -> Dict[str, int]:
+    """Re-encode image *data* for *path*, write it and its variants atomically.
+
+    Return byte counts (``bytes_in``, ``bytes_out`` for the main image,
+    ``variant_bytes``), the number of ``variants`` written and the CPU time
+    spent in ``cpu_ms``.
+    """
+    from PIL import Image
+
+    started = time.process_time()
+    path = Path(path)
+    fmt = _format_for(path)
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        outputs = [(path, _encode(img, fmt, options))]
+        for width in sorted(set(options.thumbnails)):
+            if width >= img.width:
+                continue
+            height = max(1, round(img.height * width / img.width))
+            resized = img.resize((width, height), Image.Resampling.LANCZOS)
+            resized.info = dict(img.info)
+            outputs.append((variant_path(path, width), _encode(resized, fmt, options)))
+    write_atomic_batch(outputs, durability)
+    return {
+        "bytes_in": len(data),
+        "bytes_out": len(outputs[0][1]),
+        "variant_bytes": sum(len(out) for _, out in outputs[1:]),
+        "variants": len(outputs) - 1,
+        "cpu_ms": round((time.process_time() - started) * 1000),
+    }
+
+
+class ImagePostProcessor:
+    """Run :func:`postprocess_image` in a pool of *workers* processes.
+
+    Used as a context manager the pool is shut down, waiting for queued
+    images, on exit.
+    """
+
+    def __init__(
+        self,
+        options: PostProcessOptions = PostProcessOptions(),
+        workers: int | None = None,
+        durability: str = "file",
+    ) -> None:
+        require_pillow()
+        self.options = options
+        self.durability = durability
+        self._pool = ProcessPoolExecutor(max_workers=workers)
+
+    def submit(self, data: bytes, path: str | Path) -> "Future[Dict[str, int]]":
+        """Queue *data* to be post-processed and written to *path*."""
+        return self._pool.submit(
+            postprocess_image, data, str(path), self.options, self.durability
+        )
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self) -> "ImagePostProcessor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.shutdown()
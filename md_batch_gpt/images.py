@@ -0,0 +1,322 @@
+"""Loading image entries and writing generated images for the image commands."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, TypeVar
+import json
+
+import typer
+
+from .file_io import is_markdown_file, write_atomic_bytes
+from .image_postprocess import ImagePostProcessor
+from .json_stream import NotAnArray, iter_json_array
+from .markdown_parser import parse_markdown_image_entries
+from .openai_client import (
+    generate_image,
+    generate_images,
+    max_images_per_request,
+    track_usage,
+)
+from .progress import Progress
+from .report import RunReport
+
+T = TypeVar("T")
+
+# Entries handed to write_image_entries at a time when streaming spec files;
+# identical prompts are only requested together within one batch
+STREAM_BATCH_SIZE = 256
+
+
+def image_outputs(entry: Dict[str, str]) -> List[str]:
+    """Return the files to write for *entry*.
+
+    Without ``variants`` that is ``expected_filename``. ``"variants": 3``
+    asks for ``name-1.ext`` to ``name-3.ext``; a list of file names gives
+    the outputs explicitly, relative to the directory of
+    ``expected_filename``. Raise ValueError for any other value.
+    """
+    filename = entry["expected_filename"]
+    variants = entry.get("variants")
+    if variants is None:
+        return [filename]
+    path = Path(filename)
+    if isinstance(variants, int) and not isinstance(variants, bool) and variants >= 1:
+        return [
+            str(path.with_name(f"{path.stem}-{i}{path.suffix}"))
+            for i in range(1, variants + 1)
+        ]
+    if (
+        isinstance(variants, list)
+        and variants
+        and all(isinstance(name, str) and name for name in variants)
+    ):
+        return [str(path.parent / name) for name in variants]
+    raise ValueError(
+        f"variants of {filename} must be a positive count or a list of file names"
+    )
+
+
+def _check_spec(entry: Dict[str, str], where: str) -> None:
+    """Raise ValueError unless *entry* is a valid image entry."""
+    if not isinstance(entry, dict):
+        raise ValueError(f"{where} is not an object")
+    if not entry.get("expected_filename") or not entry.get("summary"):
+        raise ValueError(f"{where} missing expected_filename or summary")
+    try:
+        image_outputs(entry)
+    except ValueError as exc:
+        raise ValueError(f"{where}: {exc}") from exc
+
+
+def iter_spec_file(json_file: Path) -> Iterator[Dict[str, str]]:
+    """Yield the validated entries of a ``generate-images`` JSON file.
+
+    The file is decoded incrementally (see
+    :func:`~md_batch_gpt.json_stream.iter_json_array`), so entries are
+    yielded while the rest is still being read. A ValueError for a bad entry
+    or malformed JSON is raised when the decoder gets there.
+    """
+    with open(json_file, encoding="utf-8", errors="replace") as handle:
+        try:
+            for idx, entry in enumerate(iter_json_array(handle)):
+                _check_spec(entry, f"Entry {idx} in {json_file}")
+                yield entry
+        except NotAnArray:
+            raise ValueError(f"{json_file} does not contain a list") from None
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Invalid JSON in {json_file}: {exc}") from exc
+
+
+def load_spec_file(json_file: Path) -> List[Dict[str, str]]:
+    """Return the validated list of entries in a ``generate-images`` JSON file."""
+    return list(iter_spec_file(json_file))
+
+
+def iter_doc_json(json_path: Path) -> Iterator[Dict[str, str]]:
+    """Yield the validated spec object(s) in a docs folder ``*.json`` file.
+
+    Like :func:`iter_spec_file`, but the file may also hold a single object.
+    """
+    with open(json_path, encoding="utf-8", errors="replace") as handle:
+        try:
+            for spec in iter_json_array(handle, allow_single=True):
+                _check_spec(spec, f"{json_path} entry")
+                yield spec
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Invalid JSON in {json_path}: {exc}") from exc
+
+
+def load_doc_json(json_path: Path) -> List[Dict[str, str]]:
+    """Return the validated spec object(s) in a docs folder ``*.json`` file."""
+    return list(iter_doc_json(json_path))
+
+
+def check_entries(
+    entries: Iterable[Dict[str, str]], select: Callable[[Dict[str, str]], bool]
+) -> int:
+    """Consume *entries*, validating them, and return how many images the
+    ones passing *select* produce, without keeping any of them."""
+    return sum(len(image_outputs(entry)) for entry in entries if select(entry))
+
+
+def is_doc_file(docs_folder: Path, path: Path) -> bool:
+    """Return True if *path* is read by :func:`load_doc_entries`."""
+    if path.suffix == ".json":
+        return path.parent == docs_folder and not path.name.startswith(".")
+    return is_markdown_file(docs_folder, path)
+
+
+def iter_doc_entries(
+    docs_folder: Path, paths: Iterable[Path] | None = None
+) -> Iterator[Dict[str, str]]:
+    """Yield entries from Markdown files and ``*.json`` specs in *docs_folder*.
+
+    The JSON specs are decoded incrementally. With *paths* only those files
+    are read (see :func:`is_doc_file`).
+    """
+    if paths is None:
+        md_paths = None
+        json_paths = list(docs_folder.glob("*.json"))
+    else:
+        paths = [p for p in paths if is_doc_file(docs_folder, p)]
+        md_paths = [p for p in paths if p.suffix == ".md"]
+        json_paths = [p for p in paths if p.suffix == ".json"]
+    yield from parse_markdown_image_entries(docs_folder, md_paths)
+    for json_path in json_paths:
+        yield from iter_doc_json(json_path)
+
+
+def load_doc_entries(
+    docs_folder: Path, paths: Iterable[Path] | None = None
+) -> List[Dict[str, str]]:
+    """Return the entries :func:`iter_doc_entries` yields for *docs_folder*."""
+    return list(iter_doc_entries(docs_folder, paths))
+
+
+def iter_batches(items: Iterable[T], size: int = STREAM_BATCH_SIZE) -> Iterator[List[T]]:
+    """Yield lists of up to *size* consecutive *items*."""
+    batch: List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def doc_prompt(entry: Dict[str, str]) -> str:
+    """Return the image prompt for a docs *entry*, including alt text context."""
+    if entry.get("alt_text"):
+        prompt = (
+            f"Create a file named `{entry['expected_filename']}` with alt text \"{entry['alt_text']}\".\n"
+            f"Description:\n{entry['summary']}"
+        )
+        if entry.get("lesson_number") or entry.get("lesson_title"):
+            prompt += (
+                f"\n(Lesson {entry.get('lesson_number')}: {entry.get('lesson_title')})"
+            )
+        return prompt
+    return entry["summary"]
+
+
+def _add_postprocess_stats(report: RunReport, stats: Dict[str, int]) -> None:
+    for key in ("bytes_in", "bytes_out", "variant_bytes", "cpu_ms"):
+        name = f"postprocess_{key}"
+        report.usage[name] = report.usage.get(name, 0) + stats[key]
+
+
+def plan_image_requests(
+    entries: List[Dict[str, str]],
+    build_prompt: Callable[[Dict[str, str]], str],
+    max_per_request: int,
+) -> Tuple[List[Tuple[str, List[str]]], List[Tuple[str, Exception]]]:
+    """Group the outputs of *entries* into ``(prompt, filenames)`` requests.
+
+    Outputs sharing a prompt are requested together, at most
+    *max_per_request* per request. Entries whose prompt or variants cannot
+    be built are returned separately with their error.
+    """
+    by_prompt: Dict[str, List[str]] = {}
+    errors: List[Tuple[str, Exception]] = []
+    for entry in entries:
+        try:
+            prompt = build_prompt(entry)
+            outputs = image_outputs(entry)
+        except Exception as exc:
+            errors.append((entry["expected_filename"], exc))
+            continue
+        by_prompt.setdefault(prompt, []).extend(outputs)
+    step = max(1, max_per_request)
+    requests = [
+        (prompt, filenames[i : i + step])
+        for prompt, filenames in by_prompt.items()
+        for i in range(0, len(filenames), step)
+    ]
+    return requests, errors
+
+
+def write_image_entries(
+    entries: List[Dict[str, str]],
+    model: str,
+    size: str,
+    report: RunReport,
+    verbose: bool = False,
+    keep_going: bool = False,
+    build_prompt: Callable[[Dict[str, str]], str] = lambda e: e["summary"],
+    indent: str = "",
+    durability: str = "file",
+    generate: Callable[..., bytes] | None = None,
+    progress: Progress | None = None,
+    postprocessor: ImagePostProcessor | None = None,
+    generate_many: Callable[..., List[bytes]] | None = None,
+) -> None:
+    """Generate and write the images for *entries*, recording results.
+
+    Outputs with the same prompt (an entry's ``variants``, or entries with
+    identical summaries) are fetched with as few requests as *model* allows
+    (see :func:`~md_batch_gpt.openai_client.max_images_per_request`).
+
+    *generate* defaults to :func:`~md_batch_gpt.openai_client.generate_image`
+    and is called as ``generate(prompt, model=..., size=...)`` for single
+    images; *generate_many* defaults to
+    :func:`~md_batch_gpt.openai_client.generate_images` and is called with
+    an additional ``n``. Each finished or failed image advances *progress*;
+    callers add the count :func:`check_entries` returns to its total up
+    front.
+
+    With a *postprocessor* the images are handed to its process pool instead
+    of being written directly, so encoding overlaps with the next API calls;
+    the byte counts and CPU time it reports are added to ``report.usage``.
+    """
+    generate = generate or generate_image
+    generate_many = generate_many or generate_images
+    pending: List[Tuple[str, Future]] = []
+
+    def failed(filename: str, exc: Exception) -> None:
+        if progress is not None:
+            progress.advance(failed=True)
+        if not keep_going:
+            raise exc
+        report.record_failure(filename, exc)
+
+    def wrote(filename: str, detail: str = "") -> None:
+        report.processed.append(filename)
+        if verbose:
+            typer.echo(f"{indent}Wrote {filename}{detail}")
+
+    with track_usage() as usage:
+        try:
+            requests, errors = plan_image_requests(
+                entries, build_prompt, max_images_per_request(model)
+            )
+            for filename, exc in errors:
+                failed(filename, exc)
+            for prompt, filenames in requests:
+                try:
+                    if verbose:
+                        typer.echo(f"{indent}Generating {', '.join(filenames)}")
+                    if len(filenames) == 1:
+                        images = [generate(prompt, model=model, size=size)]
+                    else:
+                        images = generate_many(prompt, model=model, size=size, n=len(filenames))
+                    if len(images) < len(filenames):
+                        raise RuntimeError(
+                            f"API returned {len(images)} of {len(filenames)} images"
+                        )
+                except Exception as exc:
+                    for filename in filenames:
+                        failed(filename, exc)
+                    continue
+                for filename, image_bytes in zip(filenames, images):
+                    if postprocessor is not None:
+                        future = postprocessor.submit(image_bytes, filename)
+                        if progress is not None:
+                            future.add_done_callback(
+                                lambda f: progress.advance(failed=f.exception() is not None)
+                            )
+                        pending.append((filename, future))
+                        continue
+                    try:
+                        write_atomic_bytes(Path(filename), image_bytes, durability)
+                    except Exception as exc:
+                        failed(filename, exc)
+                        continue
+                    if progress is not None:
+                        progress.advance()
+                    wrote(filename)
+            for filename, future in pending:
+                try:
+                    stats = future.result()
+                except Exception as exc:
+                    if not keep_going:
+                        raise
+                    report.record_failure(filename, exc)
+                    continue
+                _add_postprocess_stats(report, stats)
+                wrote(filename, f" ({stats['bytes_in']} -> {stats['bytes_out']} bytes)")
+        finally:
+            for key, value in usage.items():
+                report.usage[key] = report.usage.get(key, 0) + value
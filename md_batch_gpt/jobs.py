@@ -0,0 +1,326 @@
+"""SQLite-backed job queue and the long-running ``mdgpt serve`` worker."""
+
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import typer
+
+from .config import DEFAULT_MODEL
+from .images import doc_prompt, load_doc_entries, load_spec_file, write_image_entries
+from .openai_client import set_request_limit
+from .orchestrator import process_folder
+from .report import RunReport
+
+JOB_KINDS = ("run", "images", "docs")
+DEFAULT_QUEUE_PATH = Path(".mdgpt") / "jobs.sqlite3"
+# A running job whose worker has not renewed its lease for this many
+# seconds is considered abandoned and put back in the queue
+LEASE_SECONDS = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    result TEXT,
+    error TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    worker TEXT,
+    heartbeat_at REAL
+)
+"""
+# Columns added after the first release, for queues created before them
+_ADDED_COLUMNS = {"worker": "TEXT", "heartbeat_at": "REAL"}
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    status: str
+    result: Dict[str, Any] | None = None
+    error: str | None = None
+    submitted_at: float | None = None
+    started_at: float | None = None
+    finished_at: float | None = None
+    worker: str | None = None
+    heartbeat_at: float | None = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class JobQueue:
+    """Persistent FIFO of jobs shared by submitters and ``serve`` workers.
+
+    Several processes may use the same database; claiming a job happens in
+    an immediate transaction so each job runs once. A claimed job is leased
+    to the claiming worker, which renews the lease with :meth:`heartbeat`
+    while the job runs; :meth:`requeue_expired` only takes back jobs whose
+    lease ran out, so several servers can share a queue.
+    """
+
+    def __init__(self, path: Path = DEFAULT_QUEUE_PATH) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(_SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for name, kind in _ADDED_COLUMNS.items():
+                if name not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> int:
+        """Queue a job of *kind* and return its ID."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind {kind!r}; use one of {', '.join(JOB_KINDS)}")
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO jobs (kind, payload, submitted_at) VALUES (?, ?, ?)",
+                (kind, json.dumps(payload), time.time()),
+            )
+            return int(cur.lastrowid)
+
+    def claim(self, worker: str | None = None) -> Job | None:
+        """Mark the oldest queued job as running under *worker* and return it."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    now = time.time()
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ?, worker = ?,"
+                        " heartbeat_at = ? WHERE id = ?",
+                        (now, worker, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return None if row is None else self.get(row["id"])
+
+    def heartbeat(self, worker: str, job_ids: Iterable[int]) -> None:
+        """Renew *worker*'s lease on the running jobs *job_ids*."""
+        ids = list(job_ids)
+        if not ids:
+            return
+        marks = ", ".join("?" * len(ids))
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE status = 'running'"
+                f" AND worker = ? AND id IN ({marks})",
+                (time.time(), worker, *ids),
+            )
+
+    def finish(self, job_id: int, result: Dict[str, Any], worker: str | None = None) -> None:
+        self._set_final(job_id, "done", worker, result=json.dumps(result))
+
+    def fail(self, job_id: int, error: str, worker: str | None = None) -> None:
+        self._set_final(job_id, "failed", worker, error=error)
+
+    def _set_final(
+        self,
+        job_id: int,
+        status: str,
+        worker: str | None,
+        result: str | None = None,
+        error: str | None = None,
+    ) -> None:
+        """Record the outcome of *job_id*; with *worker*, only if it still holds the lease."""
+        query = "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?"
+        params: tuple = (status, result, error, time.time(), job_id)
+        if worker is not None:
+            query += " AND status = 'running' AND worker = ?"
+            params += (worker,)
+        with self._lock:
+            self._conn.execute(query, params)
+
+    def requeue_expired(self, lease: float = LEASE_SECONDS) -> int:
+        """Put running jobs whose lease was not renewed for *lease* seconds back in the queue."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, worker = NULL,"
+                " heartbeat_at = NULL WHERE status = 'running'"
+                " AND COALESCE(heartbeat_at, started_at, 0) < ?",
+                (time.time() - lease,),
+            )
+            return cur.rowcount
+
+    def get(self, job_id: int) -> Job | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else _row_to_job(row)
+
+    def list(self, status: str | None = None) -> List[Job]:
+        query = "SELECT * FROM jobs"
+        params: tuple = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id", params).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+    def pending(self) -> int:
+        """Return how many jobs are queued or running."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()
+        return int(row[0])
+
+
+def _row_to_job(row: sqlite3.Row) -> Job:
+    return Job(
+        id=row["id"],
+        kind=row["kind"],
+        payload=json.loads(row["payload"]),
+        status=row["status"],
+        result=json.loads(row["result"]) if row["result"] else None,
+        error=row["error"],
+        submitted_at=row["submitted_at"],
+        started_at=row["started_at"],
+        finished_at=row["finished_at"],
+        worker=row["worker"],
+        heartbeat_at=row["heartbeat_at"],
+    )
+
+
+def _resolve_outputs(entries: List[Dict[str, str]], cwd: str | None) -> List[Dict[str, str]]:
+    """Make relative ``expected_filename`` values relative to the submitter's *cwd*."""
+    if not cwd:
+        return entries
+    return [
+        {**entry, "expected_filename": str(Path(cwd) / entry["expected_filename"])}
+        for entry in entries
+    ]
+
+
+def run_job(job: Job) -> Dict[str, Any]:
+    """Execute *job* in this process and return its report as a dict."""
+    payload = job.payload
+    if job.kind == "run":
+        report = process_folder(
+            Path(payload["folder"]),
+            [Path(p) for p in payload["prompts"]],
+            model=payload.get("model", DEFAULT_MODEL),
+            max_tokens=payload.get("max_tokens"),
+            regex_json=Path(payload["regex_json"]) if payload.get("regex_json") else None,
+            keep_going=True,
+            workers=payload.get("workers", 1),
+        )
+        return report.to_dict()
+
+    report = RunReport()
+    if job.kind == "images":
+        entries = list(payload.get("entries", []))
+        for json_file in payload.get("json_files", []):
+            entries.extend(load_spec_file(Path(json_file)))
+        build_prompt = lambda e: e["summary"]  # noqa: E731
+    elif job.kind == "docs":
+        entries = load_doc_entries(Path(payload["folder"]))
+        build_prompt = doc_prompt
+    else:
+        raise ValueError(f"Unknown job kind {job.kind!r}")
+    write_image_entries(
+        _resolve_outputs(entries, payload.get("cwd")),
+        payload.get("model", "dall-e-3"),
+        payload.get("size", "1024x1024"),
+        report,
+        keep_going=True,
+        build_prompt=build_prompt,
+    )
+    return report.to_dict()
+
+
+def new_worker_id() -> str:
+    """Return an ID naming this ``serve`` process in the queue."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _execute(queue: JobQueue, job: Job, worker: str, verbose: bool) -> None:
+    if verbose:
+        typer.echo(f"Job {job.id} ({job.kind}) started")
+    try:
+        result = run_job(job)
+    except Exception as exc:
+        queue.fail(job.id, f"{type(exc).__name__}: {exc}", worker)
+        if verbose:
+            typer.echo(f"Job {job.id} failed: {exc}")
+        return
+    queue.finish(job.id, result, worker)
+    if verbose:
+        typer.echo(f"Job {job.id} done")
+
+
+def serve(
+    queue: JobQueue,
+    workers: int = 2,
+    max_requests: int | None = None,
+    poll_interval: float = 1.0,
+    until_idle: bool = False,
+    verbose: bool = False,
+    lease: float = LEASE_SECONDS,
+) -> None:
+    """Process jobs from *queue* until interrupted (or, with *until_idle*,
+    until this worker has no job running and none it can claim).
+
+    Up to *workers* jobs run at once in this process, sharing one set of API
+    clients and connection pools. *max_requests* caps concurrent API calls
+    across all running jobs. The leases of running jobs are renewed every
+    *poll_interval* seconds, which must be well below *lease*; jobs of
+    workers that stopped renewing theirs for *lease* seconds are requeued.
+    """
+    if poll_interval >= lease:
+        raise ValueError("poll_interval must be shorter than the lease")
+    set_request_limit(max_requests)
+    worker = new_worker_id()
+    active: Dict[Future, int] = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mdgpt-job") as pool:
+        while True:
+            active = {f: job_id for f, job_id in active.items() if not f.done()}
+            queue.heartbeat(worker, active.values())
+            requeued = queue.requeue_expired(lease)
+            if verbose and requeued:
+                typer.echo(f"Requeued {requeued} abandoned job(s)")
+            while len(active) < workers:
+                job = queue.claim(worker)
+                if job is None:
+                    break
+                active[pool.submit(_execute, queue, job, worker, verbose)] = job.id
+            # nothing running here and nothing left to claim: jobs leased by
+            # live workers elsewhere are theirs to finish
+            if until_idle and not active:
+                return
+            if active:
+                wait(active, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(poll_interval)
@@ -0,0 +1,143 @@
+"""Decoding the elements of a large JSON array one at a time."""
+
+from __future__ import annotations
+
+from typing import Any, Iterator, TextIO
+import json
+
+# Characters read at a time; a value larger than this is read in growing steps
+READ_CHUNK = 1 << 16
+
+# A decode error this close to the end of the buffer may just mean the value
+# continues in the next chunk (e.g. a literal or \uXXXX escape cut in half)
+_TAIL = 16
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class NotAnArray(ValueError):
+    """Raised when the JSON document is not an array."""
+
+
+def iter_json_array(
+    handle: TextIO, allow_single: bool = False, chunk_size: int = READ_CHUNK
+) -> Iterator[Any]:
+    """Yield the elements of the JSON array in *handle* as they are decoded.
+
+    Only the element being decoded and about one chunk of lookahead are held
+    in memory, so long arrays are read in bounded memory and the caller can
+    act on the first elements before the rest is read. With *allow_single*
+    a document that is not an array is decoded whole and yielded as the only
+    element; otherwise NotAnArray is raised. Malformed JSON raises
+    :class:`json.JSONDecodeError`, possibly after earlier elements were
+    yielded; its position, line and column count from the start of the
+    document, while its ``doc`` is only the text still buffered.
+    """
+    buf = ""
+    pos = 0
+    eof = False
+    # characters dropped from the front of buf, the newlines among them and
+    # the document offset of the line buf[0] is on
+    offset = 0
+    lines = 0
+    line_start = 0
+
+    def drop() -> None:
+        """Discard the decoded text before pos from buf."""
+        nonlocal buf, pos, offset, lines, line_start
+        newlines = buf.count("\n", 0, pos)
+        if newlines:
+            lines += newlines
+            line_start = offset + buf.rfind("\n", 0, pos) + 1
+        offset += pos
+        buf = buf[pos:]
+        pos = 0
+
+    def error(msg: str, at: int) -> json.JSONDecodeError:
+        """Return a decode error at *at* in buf, positioned in the document."""
+        exc = json.JSONDecodeError(msg, buf, at)
+        newlines = buf.count("\n", 0, at)
+        start = offset + buf.rfind("\n", 0, at) + 1 if newlines else line_start
+        exc.pos = offset + at
+        exc.lineno = lines + newlines + 1
+        exc.colno = exc.pos - start + 1
+        exc.args = (f"{msg}: line {exc.lineno} column {exc.colno} (char {exc.pos})",)
+        return exc
+
+    def fill(minimum: int = 0) -> bool:
+        nonlocal buf, eof
+        if eof:
+            return False
+        chunk = handle.read(max(minimum, chunk_size))
+        if not chunk:
+            eof = True
+            return False
+        drop()
+        buf += chunk
+        return True
+
+    def next_char() -> str:
+        """Skip whitespace and return the next character ("" at the end)."""
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not fill():
+                return ""
+
+    def decode() -> Any:
+        nonlocal pos
+        while True:
+            try:
+                value, end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as exc:
+                truncated = exc.pos >= len(buf) - _TAIL or exc.msg.startswith(
+                    "Unterminated string"
+                )
+                # read at least as much again, so retries stay linear overall
+                if truncated and fill(len(buf) - pos):
+                    continue
+                raise error(exc.msg, exc.pos) from None
+            # a number near the end of the buffer may continue in the next
+            # chunk ("1.5e" decodes as 1.5)
+            if (
+                isinstance(value, (int, float))
+                and end > len(buf) - _TAIL
+                and fill(len(buf) - pos)
+            ):
+                continue
+            pos = end
+            return value
+
+    first = next_char()
+    if not first:
+        raise error("Expecting value", pos)
+    if first != "[":
+        if not allow_single:
+            raise NotAnArray("JSON document is not an array")
+        drop()
+        buf += handle.read()
+        try:
+            value = json.loads(buf)
+        except json.JSONDecodeError as exc:
+            raise error(exc.msg, exc.pos) from None
+        yield value
+        return
+    pos += 1
+    if next_char() == "]":
+        pos += 1
+    else:
+        while True:
+            yield decode()
+            char = next_char()
+            pos += 1
+            if char == "]":
+                break
+            if char != ",":
+                raise error("Expecting ',' delimiter", pos - 1)
+            next_char()
+    if next_char():
+        raise error("Extra data", pos)
@@ -0,0 +1,128 @@
+"""Load balancing of API requests over a pool of keys/organizations."""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Deque, Dict, List, Sequence
+import threading
+import time
+
+STRATEGIES = ("round-robin", "least-loaded")
+# Status codes that count towards disabling a key
+FAILURE_STATUSES = {401, 429}
+
+
+class PooledKey:
+    """One API key (and client) in a :class:`KeyPool` with its counters."""
+
+    def __init__(self, label: str, client: Any, weight: int = 1) -> None:
+        if weight < 1:
+            raise ValueError(f"Weight for {label} must be at least 1")
+        self.label = label
+        self.client = client
+        self.weight = weight
+        self.in_flight = 0
+        self.requests = 0
+        self.failures: Dict[int, int] = {}
+        self.consecutive_failures = 0
+        self.disabled = False
+        self._current = 0
+        self._recent: Deque[float] = deque()
+
+    def requests_per_minute(self, now: float | None = None) -> int:
+        """Return how many requests this key started in the last minute."""
+        now = time.monotonic() if now is None else now
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+        return len(self._recent)
+
+
+class KeyPool:
+    """Select a key per request and retire keys that keep failing.
+
+    ``round-robin`` is smooth weighted round-robin, so a key with weight 2
+    receives twice the requests of a key with weight 1. ``least-loaded``
+    picks the key with the fewest in-flight requests relative to its weight.
+    A key returning 401/429 *failure_threshold* times in a row is disabled,
+    except that the last active key is never removed.
+    """
+
+    def __init__(
+        self,
+        members: Sequence[PooledKey],
+        strategy: str = "round-robin",
+        failure_threshold: int = 5,
+    ) -> None:
+        if not members:
+            raise ValueError("KeyPool requires at least one key")
+        if strategy not in STRATEGIES:
+            raise ValueError(
+                f"Unknown key selection {strategy!r}; use one of {', '.join(STRATEGIES)}"
+            )
+        self.members: List[PooledKey] = list(members)
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self) -> PooledKey:
+        return self.members[0]
+
+    def active(self) -> List[PooledKey]:
+        return [m for m in self.members if not m.disabled]
+
+    def acquire(self) -> PooledKey:
+        """Return the key to use for the next request and mark it in flight."""
+        with self._lock:
+            active = self.active()
+            if self.strategy == "least-loaded":
+                member = min(active, key=lambda m: (m.in_flight / m.weight, m.requests))
+            else:
+                total = sum(m.weight for m in active)
+                for m in active:
+                    m._current += m.weight
+                member = max(active, key=lambda m: m._current)
+                member._current -= total
+            member.in_flight += 1
+            member.requests += 1
+            member._recent.append(time.monotonic())
+            return member
+
+    def release(self, member: PooledKey, status: int | None = None) -> None:
+        """Mark a request on *member* finished with HTTP *status* (``None`` = ok)."""
+        with self._lock:
+            member.in_flight -= 1
+            if status is not None:
+                member.failures[status] = member.failures.get(status, 0) + 1
+            if status in FAILURE_STATUSES:
+                member.consecutive_failures += 1
+                if (
+                    member.consecutive_failures >= self.failure_threshold
+                    and not member.disabled
+                    and len(self.active()) > 1
+                ):
+                    member.disabled = True
+            else:
+                member.consecutive_failures = 0
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Return per-key counters suitable for logging or reports."""
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    "key": m.label,
+                    "weight": m.weight,
+                    "in_flight": m.in_flight,
+                    "requests": m.requests,
+                    "requests_per_minute": m.requests_per_minute(now),
+                    "failures": dict(m.failures),
+                    "disabled": m.disabled,
+                }
+                for m in self.members
+            ]
+
+
+def mask_key(key: str) -> str:
+    """Return a printable label for *key* that does not reveal the secret."""
+    return f"...{key[-4:]}" if len(key) > 4 else "..."
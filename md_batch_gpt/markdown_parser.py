@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterable, List
 import yaml
 import json
 import re
@@ -10,45 +10,104 @@ JSON_BLOCK_RE = re.compile(r"```(?:json)?\n(.*?)```", re.DOTALL)
 
 from .file_io import iter_markdown_files
 
+# Characters read at a time while looking for the end of front matter
+READ_CHUNK = 8192
 
-def parse_markdown_image_entries(folder: Path) -> List[Dict[str, str]]:
+
+def find_json_block(text: str) -> str | None:
+    """Return the body of the first fenced JSON block in *text*, or None.
+
+    Matches exactly what ``JSON_BLOCK_RE.search`` would, with plain
+    substring searches instead of a regex over the whole document.
+    """
+    fence = text.find("```")
+    while fence != -1:
+        start = fence + 3
+        if text.startswith("json\n", start):
+            start += 5
+        elif text.startswith("\n", start):
+            start += 1
+        else:
+            fence = text.find("```", fence + 1)
+            continue
+        end = text.find("```", start)
+        return None if end == -1 else text[start:end]
+    return None
+
+
+def _read_head(handle) -> tuple[str, int]:
+    """Read *handle* past leading whitespace up to the end of front matter.
+
+    Return the text read, without the leading whitespace, and the index of
+    the ``---`` closing the front matter, which is -1 if the text does not
+    start with ``---`` or the closing ``---`` is missing. Only as much of
+    the file is read as needed to decide that.
+    """
+    head = ""
+    while True:
+        chunk = handle.read(READ_CHUNK)
+        head = (head + chunk).lstrip()
+        if len(head) >= 3 or not chunk:
+            break
+    if not head.startswith("---"):
+        return head, -1
+    searched = 3
+    while True:
+        end = head.find("---", searched)
+        if end != -1:
+            return head, end
+        chunk = handle.read(READ_CHUNK)
+        if not chunk:
+            return head, -1
+        searched = max(3, len(head) - 2)
+        head += chunk
+
+
+def parse_markdown_image_entries(
+    folder: Path, paths: Iterable[Path] | None = None
+) -> List[Dict[str, str]]:
     """Return a list of image generation entries from Markdown files in *folder*.
 
     Each Markdown file may either begin with YAML front matter containing
     ``expected_filename`` and ``summary`` keys or contain a JSON block with one
     or more such entries. Additional fields are preserved. The function uses
-    :func:`iter_markdown_files` to locate ``*.md`` files under *folder*. JSON
-    blocks may appear anywhere in the document.
+    :func:`iter_markdown_files` to locate ``*.md`` files under *folder*
+    unless explicit *paths* are given. JSON blocks may appear anywhere in the
+    document.
+
+    Files are read incrementally: for a file with valid front matter only
+    the leading block up to its closing ``---`` is read from disk.
     """
     entries: List[Dict[str, str]] = []
-    for md_path in sorted(iter_markdown_files(folder)):
-        text = md_path.read_text(encoding="utf-8", errors="replace")
-        stripped = text.lstrip()
-        if stripped.startswith("---"):
-            parts = stripped.split("---", 2)
-            if len(parts) < 3:
-                raise ValueError(f"{md_path} missing closing YAML delimiter")
-            fm_text = parts[1]
-            data = yaml.safe_load(fm_text) or {}
-            if (
-                isinstance(data, dict)
-                and data.get("expected_filename")
-                and data.get("summary")
-            ):
-                entries.append(data)
-                continue
-            if isinstance(data, dict):
-                # Detected YAML front matter but required keys missing
-                raise ValueError(
-                    f"{md_path} front matter missing expected_filename or summary"
-                )
-            # Not valid YAML front matter; fall through treating remainder as text
-            stripped = parts[2].lstrip()
+    for md_path in sorted(iter_markdown_files(folder) if paths is None else paths):
+        with md_path.open(encoding="utf-8", errors="replace") as handle:
+            stripped, fm_end = _read_head(handle)
+            if stripped.startswith("---"):
+                if fm_end == -1:
+                    raise ValueError(f"{md_path} missing closing YAML delimiter")
+                data = yaml.safe_load(stripped[3:fm_end]) or {}
+                if (
+                    isinstance(data, dict)
+                    and data.get("expected_filename")
+                    and data.get("summary")
+                ):
+                    # the rest of the document is never read
+                    entries.append(data)
+                    continue
+                if isinstance(data, dict):
+                    # Detected YAML front matter but required keys missing
+                    raise ValueError(
+                        f"{md_path} front matter missing expected_filename or summary"
+                    )
+                # Not valid YAML front matter; fall through treating remainder as text
+                stripped = (stripped[fm_end + 3 :] + handle.read()).lstrip()
+            else:
+                stripped += handle.read()
 
         json_text = stripped
-        match = JSON_BLOCK_RE.search(json_text)
-        if match:
-            json_text = match.group(1)
+        block = find_json_block(json_text)
+        if block is not None:
+            json_text = block
         elif json_text.startswith("```"):
             first_nl = json_text.find("\n")
             if first_nl == -1:
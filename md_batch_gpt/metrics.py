@@ -0,0 +1,304 @@
+"""Process-wide counters and histograms in the Prometheus text format.
+
+Metrics are always collected (updates are a lock and an addition); they are
+only exported when asked to, either by :func:`serve_http` (a ``/metrics``
+listener for Prometheus to scrape) or :func:`start_textfile_writer` (a file
+for node-exporter's textfile collector).
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+import bisect
+import os
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; spans quick local steps up to slow image generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        if set(labels) != set(self.labels):
+            raise ValueError(
+                f"{self.name} expects labels {list(self.labels)}, got {sorted(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _samples(self) -> List[str]:  # pragma: no cover - overridden
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.kind}",
+            *self._samples(),
+        ]
+
+
+class Counter(_Metric):
+    """A monotonically increasing value per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}"
+            for key, v in values
+        ]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative ``le`` buckets per label combination."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per key: per-bucket counts (last slot is +Inf), sum, count
+        self._series: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, totals = self._series.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0, 0])
+            )
+            counts[idx] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the wall-clock duration of the ``with`` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return int(series[1][1]) if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = sorted(
+                (key, list(counts), list(totals))
+                for key, (counts, totals) in self._series.items()
+            )
+        lines = []
+        for key, counts, (total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(float(total))}")
+            lines.append(f"{self.name}_count{labels} {int(count)}")
+        return lines
+
+
+class Registry:
+    """A named set of metrics rendered together."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter(
+    "mdgpt_api_requests_total",
+    "API calls by kind (chat, image) and outcome (ok, HTTP status or error)",
+    ["kind", "status"],
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "mdgpt_api_request_duration_seconds", "Latency of single API calls", ["kind"]
+)
+TOKENS = REGISTRY.counter(
+    "mdgpt_tokens_total", "Tokens reported by chat completions", ["type"]
+)
+RETRIES = REGISTRY.counter("mdgpt_api_retries_total", "API calls retried after a failure")
+HEDGES = REGISTRY.counter(
+    "mdgpt_api_hedges_total", "Duplicate calls sent for slow calls, by outcome", ["outcome"]
+)
+COALESCED = REGISTRY.counter(
+    "mdgpt_api_coalesced_total",
+    "Calls answered by an identical call already in flight",
+    ["kind"],
+)
+RATE_LIMITED = REGISTRY.counter(
+    "mdgpt_api_rate_limited_total", "API calls rejected with HTTP 429"
+)
+IMAGES = REGISTRY.counter("mdgpt_images_generated_total", "Images returned by the API")
+BYTES_WRITTEN = REGISTRY.counter(
+    "mdgpt_bytes_written_total", "Bytes committed by atomic writes"
+)
+WRITE_SECONDS = REGISTRY.histogram(
+    "mdgpt_write_commit_duration_seconds", "Time to fsync and rename a write batch"
+)
+FILES = REGISTRY.counter(
+    "mdgpt_files_total",
+    "Markdown files finished by process_folder, by result (processed, skipped, failed)",
+    ["result"],
+)
+FILE_SECONDS = REGISTRY.histogram(
+    "mdgpt_file_process_duration_seconds", "Time to run all prompt passes on one file"
+)
+
+
+def serve_http(
+    port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY
+) -> ThreadingHTTPServer:
+    """Serve ``GET /metrics`` on *host*:*port* from a daemon thread.
+
+    Port 0 picks a free port (see ``server.server_address``). Call
+    ``shutdown()`` on the returned server to stop it.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802 - http.server API
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_textfile(path: Path, registry: Registry = REGISTRY) -> None:
+    """Atomically replace *path* with the current metrics.
+
+    Uses its own temporary file rather than :mod:`md_batch_gpt.file_io` so the
+    export does not count towards the bytes-written metric. The file is made
+    world-readable, since the exporter collecting it usually runs as another
+    user.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile(
+        "w", encoding="utf-8", dir=path.parent, suffix=".tmp", delete=False
+    ) as tmp:
+        tmp.write(registry.render())
+    # NamedTemporaryFile creates the file as 0600
+    os.chmod(tmp.name, 0o644)
+    os.replace(tmp.name, path)
+
+
+def start_textfile_writer(
+    path: Path, interval: float = 15.0, registry: Registry = REGISTRY
+) -> Callable[[], None]:
+    """Rewrite *path* every *interval* seconds; return a function that stops
+    the writer after one final write."""
+    stop = threading.Event()
+
+    def loop() -> None:
+        while not stop.wait(interval):
+            write_textfile(path, registry)
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+
+    def close() -> None:
+        stop.set()
+        thread.join()
+        write_textfile(path, registry)
+
+    return close
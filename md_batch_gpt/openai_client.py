@@ -2,16 +2,346 @@
 
 from __future__ import annotations
 
-from typing import Iterable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List
 import base64
+import threading
 import time
 
 import openai
 
-from .config import OPENAI_API_KEY
+from .config import (
+    FALLBACK_MODELS,
+    SINGLE_FLIGHT,
+    HEDGE_MAX_RATE,
+    HEDGE_PERCENTILE,
+    HTTP_CONFIG,
+    KEY_FAILURE_THRESHOLD,
+    KEY_SELECTION,
+    OPENAI_API_KEYS,
+)
+from .edits import EDIT_INSTRUCTIONS
+from .hedging import Hedger
+from .http_client import HttpSettings, build_client, build_download_client
+from .key_pool import KeyPool, PooledKey, mask_key
+from .packing import PACK_INSTRUCTIONS
+from .single_flight import SingleFlight
+from . import metrics
 
-# Instantiate a single client for reuse
-_client = openai.OpenAI(api_key=OPENAI_API_KEY)
+# Connection settings shared by every API client and image downloads; read
+# from ``[tool.md_batch_gpt.http]`` on first use, see http_settings()
+_http_settings: HttpSettings | None = None
+_http_client = None
+_download_client = None
+_download_lock = threading.Lock()
+_http_config_lock = threading.Lock()
+
+# One reusable client per configured API key; ``_client`` is the first one
+_pool = KeyPool(
+    [
+        PooledKey(
+            mask_key(spec.key),
+            openai.OpenAI(api_key=spec.key, base_url=spec.base_url),
+            spec.weight,
+        )
+        for spec in OPENAI_API_KEYS
+    ],
+    strategy=KEY_SELECTION,
+    failure_threshold=KEY_FAILURE_THRESHOLD,
+)
+_client = _pool.primary.client
+
+
+def set_http_settings(settings: HttpSettings) -> None:
+    """Rebuild the API clients and the image download client with *settings*.
+
+    All keys share one connection pool. The replaced clients are closed, so
+    call this before sending requests. Raise RuntimeError if *settings* ask
+    for HTTP/2 without the h2 package.
+    """
+    global _client, _http_settings, _http_client, _download_client
+    http_client = None if settings.is_default() else build_client(settings)
+    old_clients = [member.client for member in _pool.members]
+    for member, spec in zip(_pool.members, OPENAI_API_KEYS):
+        member.client = openai.OpenAI(
+            api_key=spec.key, base_url=spec.base_url, http_client=http_client
+        )
+    with _download_lock:
+        old_download = _download_client
+        _http_settings, _http_client, _download_client = settings, http_client, None
+    _client = _pool.primary.client
+    for client in old_clients:
+        client.close()
+    if old_download is not None:
+        old_download.close()
+
+
+def http_settings() -> HttpSettings:
+    """Return the connection settings in use, applying the config on first use.
+
+    Raise ValueError for an invalid ``[tool.md_batch_gpt.http]`` table and
+    RuntimeError if it enables HTTP/2 without the h2 package.
+    """
+    global _http_settings
+    if _http_settings is not None:
+        return _http_settings
+    with _http_config_lock:
+        if _http_settings is None:
+            settings = HttpSettings.from_config(HTTP_CONFIG)
+            if settings.is_default():
+                # the clients below were built with the defaults already
+                _http_settings = settings
+            else:
+                set_http_settings(settings)
+    return _http_settings
+
+
+def _downloader():
+    global _download_client
+    settings = http_settings()
+    with _download_lock:
+        if _download_client is None:
+            _download_client = build_download_client(settings)
+        return _download_client
+
+
+# Process-wide request and token counters, reported per run/shard
+_usage_lock = threading.Lock()
+_usage: Dict[str, int] = {
+    "requests": 0,
+    "prompt_tokens": 0,
+    "completion_tokens": 0,
+    "images": 0,
+    "retries": 0,
+    "hedges": 0,
+    "hedges_won": 0,
+    "coalesced": 0,
+}
+# Counters of the runs in progress in the current context, see track_usage
+_usage_sinks: ContextVar[tuple[Dict[str, int], ...]] = ContextVar(
+    "mdgpt_usage_sinks", default=()
+)
+# API calls currently waiting on a response
+_in_flight = 0
+
+
+def _record_usage(
+    requests: int = 0,
+    images: int = 0,
+    usage=None,
+    retries: int = 0,
+    hedges: int = 0,
+    hedges_won: int = 0,
+    coalesced: int = 0,
+) -> None:
+    """Add a finished request (and its token *usage*, if any) to the counters."""
+    prompt_tokens = completion_tokens = 0
+    if usage is not None:
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    counts = {
+        "requests": requests,
+        "images": images,
+        "retries": retries,
+        "hedges": hedges,
+        "hedges_won": hedges_won,
+        "coalesced": coalesced,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+    }
+    with _usage_lock:
+        for sink in (_usage, *_usage_sinks.get()):
+            for key, value in counts.items():
+                sink[key] = sink.get(key, 0) + value
+    if images:
+        metrics.IMAGES.inc(images)
+    if retries:
+        metrics.RETRIES.inc(retries)
+    if hedges:
+        metrics.HEDGES.inc(hedges - hedges_won, outcome="lost")
+        metrics.HEDGES.inc(hedges_won, outcome="won")
+    if prompt_tokens:
+        metrics.TOKENS.inc(prompt_tokens, type="prompt")
+    if completion_tokens:
+        metrics.TOKENS.inc(completion_tokens, type="completion")
+
+
+def _record_call(kind: str, status: int | None, error: bool, seconds: float) -> None:
+    """Count one API call in :mod:`md_batch_gpt.metrics`."""
+    label = "error" if error and status is None else str(status or "ok")
+    metrics.REQUESTS.inc(kind=kind, status=label)
+    metrics.REQUEST_SECONDS.observe(seconds, kind=kind)
+    if status == 429:
+        metrics.RATE_LIMITED.inc()
+
+
+# Optional cap on concurrent API calls shared by every caller in the process
+_request_slots: threading.BoundedSemaphore | None = None
+
+
+def set_request_limit(limit: int | None) -> None:
+    """Allow at most *limit* concurrent API calls process-wide (``None``: no cap)."""
+    global _request_slots
+    _request_slots = threading.BoundedSemaphore(limit) if limit else None
+
+
+@contextmanager
+def _in_flight_call() -> Iterator[None]:
+    global _in_flight
+    with _usage_lock:
+        _in_flight += 1
+    try:
+        yield
+    finally:
+        with _usage_lock:
+            _in_flight -= 1
+
+
+@contextmanager
+def _request_slot() -> Iterator[None]:
+    slots = _request_slots
+    if slots is None:
+        with _in_flight_call():
+            yield
+        return
+    with slots, _in_flight_call():
+        yield
+
+
+# Optional hedging of slow calls shared by every caller in the process
+_hedger: Hedger | None = None
+
+
+def set_hedging(percentile: float | None, max_rate: float = 0.05) -> None:
+    """Duplicate calls slower than the *percentile* latency (``None``: off).
+
+    At most *max_rate* of calls are duplicated; see :class:`Hedger`.
+    """
+    global _hedger
+    _hedger = Hedger(percentile, max_rate) if percentile else None
+
+
+set_hedging(HEDGE_PERCENTILE, HEDGE_MAX_RATE)
+
+
+def hedging_stats() -> Dict[str, int]:
+    """Return hedged call counters (all zero when hedging is off)."""
+    if _hedger is None:
+        return {"calls": 0, "hedges": 0, "hedges_won": 0}
+    return _hedger.stats()
+
+
+class _Superseded(Exception):
+    """A hedge copy that got a request slot only after the call was settled."""
+
+
+def _api_call(kind: str, model: str, fn, on_discard=None):
+    """Return ``fn(client)`` for a pooled API client, hedged when enabled.
+
+    Every copy of the call, including a hedge, takes its own request slot
+    (see :func:`set_request_limit`) and pool key, and is counted in
+    :mod:`md_batch_gpt.metrics`. A hedge still waiting for a slot when the
+    call is settled is dropped. Latencies are tracked per *kind* and
+    *model*, so slow models do not set the hedge delay for fast ones.
+    """
+    settled = threading.Event()
+
+    http_settings()
+
+    def attempt():
+        with _request_slot():
+            if settled.is_set():
+                raise _Superseded()
+            member = _pool.acquire()
+            status: int | None = None
+            error = True
+            started = time.perf_counter()
+            try:
+                result = fn(member.client)
+                error = False
+                # before the slot is freed, so a waiting hedge sees it
+                settled.set()
+                return result
+            except openai.APIStatusError as exc:
+                status = exc.status_code
+                raise
+            finally:
+                _pool.release(member, status)
+                _record_call(kind, status, error, time.perf_counter() - started)
+
+    hedger = _hedger
+    if hedger is None:
+        return attempt()
+    try:
+        return hedger.call(
+            f"{kind}:{model}",
+            attempt,
+            on_discard=on_discard,
+            on_hedge=lambda won: _record_usage(hedges=1, hedges_won=int(won)),
+        )
+    finally:
+        settled.set()
+
+
+# Identical calls in flight at the same time share one request
+_single_flight: SingleFlight | None = None
+
+
+def set_single_flight(enabled: bool) -> None:
+    """Turn coalescing of identical concurrent requests on or off."""
+    global _single_flight
+    _single_flight = SingleFlight() if enabled else None
+
+
+set_single_flight(SINGLE_FLIGHT)
+
+
+def _coalesce(kind: str, key: tuple, fn):
+    """Return ``fn()``, sharing the result with identical concurrent calls."""
+    flight = _single_flight
+    if flight is None:
+        return fn()
+    leader = []
+
+    def run():
+        leader.append(True)
+        return fn()
+
+    result = flight.do((kind, *key), run)
+    if not leader:
+        _record_usage(coalesced=1)
+        metrics.COALESCED.inc(kind=kind)
+    return result
+
+
+def usage_snapshot() -> Dict[str, int]:
+    """Return a copy of the request and token counters for this process."""
+    with _usage_lock:
+        return dict(_usage)
+
+
+@contextmanager
+def track_usage() -> Iterator[Dict[str, int]]:
+    """Yield counters of the usage of calls made within the block.
+
+    Unlike the difference of two :func:`usage_snapshot` calls, calls made
+    at the same time by other jobs in the process are not counted. The
+    counters follow the current :mod:`contextvars` context, so threads doing
+    the work must be started in a copy of it. Blocks may be nested.
+    """
+    counts = dict.fromkeys(_usage, 0)
+    token = _usage_sinks.set((*_usage_sinks.get(), counts))
+    try:
+        yield counts
+    finally:
+        _usage_sinks.reset(token)
+
+
+def in_flight_requests() -> int:
+    """Return the number of API calls currently awaiting a response."""
+    with _usage_lock:
+        return _in_flight
 
 
 def _chat_request(
@@ -21,23 +351,34 @@ def _chat_request(
     max_tokens: int | None = None,
 ):
     """Send a chat completion request with retry logic."""
+    params = dict(model=model, messages=list(messages), temperature=temperature)
+    if max_tokens is not None:
+        params["max_tokens"] = max_tokens
     last_exc: Exception | None = None
     for attempt in range(4):
         try:
-            params = dict(model=model, messages=list(messages), temperature=temperature)
-            if max_tokens is not None:
-                params["max_tokens"] = max_tokens
-            response = _client.chat.completions.create(**params)
+            response = _api_call(
+                "chat",
+                model,
+                lambda client: client.chat.completions.create(**params),
+                on_discard=lambda r: _record_usage(
+                    requests=1, usage=getattr(r, "usage", None)
+                ),
+            )
+            _record_usage(requests=1, usage=getattr(response, "usage", None))
             return response.choices[0].message.content
         except openai.RateLimitError as exc:
             last_exc = exc
         except openai.APIStatusError as exc:
             last_exc = exc
-            if exc.status_code not in {429, 502}:
+            # Another key may still be valid, so retry 401s when pooling
+            retry = {429, 502} | ({401} if len(_pool.active()) > 1 else set())
+            if exc.status_code not in retry:
                 raise
         except openai.APIConnectionError as exc:
             last_exc = exc
         if attempt < 3:
+            _record_usage(retries=1)
             time.sleep(2**attempt)
     # If we fall through, raise the last captured exception
     if last_exc:
@@ -45,33 +386,160 @@ def _chat_request(
     raise RuntimeError("Unknown error sending prompt")
 
 
+# Statuses meaning "this model is busy", which trigger the fallback chain
+FALLBACK_STATUSES = {429, 503, 529}
+
+
+def _chat_with_fallback(
+    messages: Iterable[dict],
+    model: str,
+    temperature: float,
+    max_tokens: int | None = None,
+):
+    """Call :func:`_chat_request`, moving down ``FALLBACK_MODELS[model]`` when busy.
+
+    Concurrent calls with identical messages and settings share one request.
+    """
+    messages = list(messages)
+    key = (
+        model,
+        temperature,
+        max_tokens,
+        tuple((m["role"], m["content"]) for m in messages),
+    )
+    return _coalesce(
+        "chat", key, lambda: _chat_chain(messages, model, temperature, max_tokens)
+    )
+
+
+def _chat_chain(
+    messages: List[dict],
+    model: str,
+    temperature: float,
+    max_tokens: int | None,
+):
+    chain = [model, *FALLBACK_MODELS.get(model, [])]
+    for idx, candidate in enumerate(chain):
+        try:
+            return _chat_request(
+                messages, model=candidate, temperature=temperature, max_tokens=max_tokens
+            )
+        except openai.APIStatusError as exc:
+            if idx == len(chain) - 1 or exc.status_code not in FALLBACK_STATUSES:
+                raise
+    raise RuntimeError("Unknown error sending prompt")  # pragma: no cover
+
+
 def send_prompt(
     prompt: str,
     content: str,
     model: str,
     max_tokens: int | None,
 ) -> str:
-    """Send `content` with a system `prompt` and return the assistant message text."""
+    """Send `content` with a system `prompt` and return the assistant message text.
+
+    If *model* is rate limited or overloaded, the models configured under
+    ``[tool.md_batch_gpt.fallbacks]`` for it are tried in order.
+    """
     messages = [
         {"role": "system", "content": prompt},
         {"role": "user", "content": content},
     ]
-    return _chat_request(messages, model=model, temperature=1, max_tokens=max_tokens)
+    return _chat_with_fallback(
+        messages, model=model, temperature=1, max_tokens=max_tokens
+    )
 
 
-def generate_image(
-    prompt: str, model: str = "dall-e-3", size: str = "1024x1024"
-) -> bytes:
-    """Return image bytes generated from *prompt* using the OpenAI image API."""
-    resp = _client.images.generate(
-        prompt=prompt,
-        model=model,
-        size=size,
+def send_prompt_edits(
+    prompt: str,
+    content: str,
+    model: str,
+    max_tokens: int | None,
+) -> str:
+    """Like :func:`send_prompt`, but ask for a JSON edit list instead of full text.
+
+    The reply is meant for :func:`md_batch_gpt.edits.parse_edits`; its size
+    scales with the edits rather than with *content*.
+    """
+    messages = [
+        {"role": "system", "content": f"{prompt}\n\n{EDIT_INSTRUCTIONS}"},
+        {"role": "user", "content": content},
+    ]
+    return _chat_with_fallback(
+        messages, model=model, temperature=1, max_tokens=max_tokens
     )
-    node = resp.data[0]
+
+
+def send_prompt_packed(
+    prompt: str,
+    content: str,
+    model: str,
+    max_tokens: int | None,
+) -> str:
+    """Like :func:`send_prompt` for *content* built by
+    :func:`~md_batch_gpt.packing.pack_documents`, asking for the documents
+    back in the same markers."""
+    messages = [
+        {"role": "system", "content": f"{prompt}\n\n{PACK_INSTRUCTIONS}"},
+        {"role": "user", "content": content},
+    ]
+    return _chat_with_fallback(
+        messages, model=model, temperature=1, max_tokens=max_tokens
+    )
+
+
+# Most images one request may ask for (``n``); unknown models get one
+IMAGE_BATCH_LIMITS = {"dall-e-2": 10, "dall-e-3": 1, "gpt-image-1": 10}
+
+
+def max_images_per_request(model: str) -> int:
+    """Return how many images a single request for *model* may return."""
+    return IMAGE_BATCH_LIMITS.get(model, 1)
+
+
+def _image_bytes(node) -> bytes:
     if getattr(node, "url", None):
-        import requests
-        return requests.get(node.url).content
+        response = _downloader().get(node.url)
+        response.raise_for_status()
+        return response.content
     if getattr(node, "b64_json", None):
         return base64.b64decode(node.b64_json)
     raise RuntimeError("No image data in API response")
+
+
+def generate_images(
+    prompt: str, model: str = "dall-e-3", size: str = "1024x1024", n: int = 1
+) -> List[bytes]:
+    """Return *n* images generated from *prompt* in a single API request.
+
+    *n* must not exceed :func:`max_images_per_request` for *model*.
+    Image generation samples at random, so unlike chat calls identical
+    concurrent calls are never coalesced: each must get its own images.
+    """
+    return _generate_images(prompt, model, size, n)
+
+
+def _generate_images(prompt: str, model: str, size: str, n: int) -> List[bytes]:
+    limit = max_images_per_request(model)
+    if not 1 <= n <= limit:
+        raise ValueError(f"{model} returns 1 to {limit} images per request, not {n}")
+    params = dict(prompt=prompt, model=model, size=size)
+    if n != 1:
+        params["n"] = n
+    resp = _api_call(
+        "image",
+        model,
+        lambda client: client.images.generate(**params),
+        on_discard=lambda r: _record_usage(requests=1, images=len(r.data)),
+    )
+    _record_usage(requests=1, images=len(resp.data))
+    if not resp.data:
+        raise RuntimeError("No image data in API response")
+    return [_image_bytes(node) for node in resp.data]
+
+
+def generate_image(
+    prompt: str, model: str = "dall-e-3", size: str = "1024x1024"
+) -> bytes:
+    """Return image bytes generated from *prompt* using the OpenAI image API."""
+    return generate_images(prompt, model=model, size=size)[0]
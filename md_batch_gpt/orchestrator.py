@@ -1,12 +1,35 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, List, Sequence
 import json
-import re
+import time
 
-from .file_io import iter_markdown_files, write_atomic
-from .openai_client import send_prompt
+from . import cleanup, metrics
+from .config import ROUTES_CONFIG
+from .file_io import (
+    PartialWriteError,
+    iter_markdown_files,
+    link_or_copy,
+    mirror_tree,
+    write_atomic_batch,
+)
+from .edits import EditError, apply_edits, parse_edits
+from .openai_client import (
+    send_prompt,
+    send_prompt_edits,
+    send_prompt_packed,
+    track_usage,
+)
+from .packing import PackError, new_key, pack_documents, plan_packs, unpack_documents
+from .pipeline import run_pipeline
+from .progress import Progress
+from .prompts import load_prompt
+from .regex_rules import RegexEngine, RegexRule, load_rules
+from .report import RunReport
+from .routing import Route, choose_model, load_routes
+from .scheduling import markdown_cost, order_by_cost, top_level_group
+from .sharding import format_shard, relative_key, select_shard
 import typer
 
 
@@ -18,42 +41,351 @@ def process_folder(
     regex_json: Path | None = None,
     dry_run: bool = False,
     verbose: bool = False,
-) -> None:
+    shard: tuple[int, int] | None = None,
+    keep_going: bool = False,
+    routes: Sequence[Route] | None = None,
+    workers: int = 1,
+    prefetch: int = 4,
+    durability: str = "file",
+    edit_mode: bool = False,
+    files: Iterable[Path] | None = None,
+    progress: Progress | None = None,
+    pack_tokens: int | None = None,
+    schedule: str = "input",
+    output_dir: Path | None = None,
+    strip_wrappers: bool = False,
+    rename_by_heading: bool = False,
+) -> RunReport:
     """Process Markdown files in *folder* using prompts from *prompt_paths*.
 
     When *dry_run* is True, print the files that would be processed and the
-    number of prompts, but make no changes.
+    number of prompts, but make no changes. *files* restricts the run to
+    the given Markdown files under *folder*. When *shard* is ``(i, N)`` only
+    the files whose relative path hashes to shard ``i`` are processed. With
+    *keep_going* a failing file is recorded in the returned report instead of
+    aborting the run.
+
+    With *edit_mode* the model is asked for a list of find/replace edits that
+    are applied to the current text; if the list is invalid or does not apply
+    cleanly, that pass is repeated asking for the full text.
+
+    Prompt files may start with selector front matter (see
+    :func:`~md_batch_gpt.prompts.load_prompt`); a pass whose selectors do not
+    match the file is skipped, and a file no prompt applies to is left
+    untouched and listed as skipped in the report.
+
+    Rules from *regex_json* are applied once to the final text, or after
+    every pass for rules marked ``per_pass``.
+
+    Each pass is sent to the model of the first matching entry in *routes*
+    (by default ``[[tool.md_batch_gpt.routes]]``), falling back to *model*.
+
+    Files flow through a pipeline: a reader prefetches up to *prefetch* files,
+    *workers* threads send them through the prompts concurrently, and a
+    writer stage commits finished files in groups with the given
+    *durability* (see :class:`~md_batch_gpt.file_io.AtomicBatchWriter`), so
+    disk and network I/O overlap and fsyncs are batched.
+
+    With *pack_tokens*, small files are grouped into packs of up to that many
+    estimated tokens. Files in a pack that share a pass and model are sent in
+    one request between numbered markers (see :mod:`~md_batch_gpt.packing`);
+    if the reply does not split back into every file, that pass is resent
+    per file. Edit mode only applies to files sent on their own.
+
+    *schedule* sets the order files enter the pipeline (see
+    :func:`~md_batch_gpt.scheduling.order_by_cost`): ``largest`` starts the files
+    with the most estimated tokens times applicable passes first, ``fair``
+    also takes turns between top-level subfolders.
+
+    With *output_dir* the files are not changed in place: results are
+    written to the same relative paths under *output_dir*, which is first
+    filled with hard links (see :func:`~md_batch_gpt.file_io.mirror_tree`)
+    to every visible file of *folder* it does not hold yet, so files left
+    out of this run keep earlier results or mirror the source. Selected
+    files no prompt applies to are re-linked to their source.
+
+    With *strip_wrappers* a code-fence wrapper around the model output is
+    removed before writing (see :func:`~md_batch_gpt.cleanup.strip_wrappers`).
+    With *rename_by_heading* every selected file is renamed after its first
+    ``# `` heading once the run is done; the slug is taken from the text
+    already in memory, and clashing names are recorded as failures instead
+    (see :func:`~md_batch_gpt.cleanup.plan_renames`). Renames in *output_dir*
+    are recorded there, so a rerun replaces a file it renamed before
+    instead of mirroring the source under its old name again.
+
+    The selected files are added to *progress*, which is advanced as each
+    file is written, skipped or fails.
     """
-    prompts = [
-        Path(p).read_text(encoding="utf-8", errors="replace") for p in prompt_paths
-    ]
-    files = list(iter_markdown_files(folder))
+    report = RunReport(shards=[format_shard(shard)] if shard else [])
+    try:
+        prompts = [load_prompt(p) for p in prompt_paths]
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc)) from exc
+    if output_dir is not None and Path(output_dir).resolve() == Path(folder).resolve():
+        raise typer.BadParameter("The output directory must differ from the folder")
+    candidates = iter_markdown_files(folder) if files is None else files
+    if output_dir is not None:
+        inside = Path(output_dir).resolve()
+        candidates = [p for p in candidates if inside not in p.resolve().parents]
+    files = select_shard(candidates, lambda p: relative_key(folder, p), shard)
+    files = order_by_cost(
+        files,
+        lambda p: markdown_cost(p, relative_key(folder, p), prompts),
+        schedule,
+        group=lambda p: top_level_group(relative_key(folder, p)),
+    )
     if not files:
         print(f"No markdown files found under {folder}")
-        return
+        return report
     if dry_run:
         for f in files:
             print(f)
         print(f"Prompt count: {len(prompts)}")
-        return
+        return report
+    if progress is not None:
+        progress.add_total(len(files))
+    # earlier renames in the output tree: source path -> renamed path there
+    previous: Dict[Path, Path] = {}
+    if output_dir is not None:
+        renamed: Dict[str, str] = {}
+        if rename_by_heading:
+            try:
+                renamed = cleanup.load_renamed(output_dir)
+            except ValueError as exc:
+                raise typer.BadParameter(str(exc)) from exc
+            renamed = {
+                src: dst for src, dst in renamed.items() if (Path(output_dir) / dst).exists()
+            }
+            previous = {
+                Path(output_dir) / src: Path(output_dir) / dst
+                for src, dst in renamed.items()
+            }
+        mirror_tree(folder, output_dir, skip=renamed)
+
+    def target(md_file: Path) -> Path:
+        if output_dir is None:
+            return md_file
+        return Path(output_dir) / Path(md_file).relative_to(folder)
+
+    if routes is None:
+        try:
+            routes = load_routes(ROUTES_CONFIG)
+        except ValueError as exc:
+            raise typer.BadParameter(f"Invalid routing config: {exc}") from exc
 
-    patterns: list[tuple[re.Pattern[str], str]] = []
+    rules: list[RegexRule] = []
     if regex_json:
         try:
-            raw = json.loads(regex_json.read_text(encoding="utf-8"))
+            rules = load_rules(regex_json)
         except json.JSONDecodeError as exc:  # pragma: no cover - invalid input
             raise typer.BadParameter(f"Invalid JSON in {regex_json}: {exc}") from exc
-        if not isinstance(raw, dict):  # pragma: no cover - wrong structure
-            raise typer.BadParameter(f"{regex_json} must contain an object mapping patterns to replacements")
-        for pat, repl in raw.items():
-            patterns.append((re.compile(pat), str(repl)))
+        except ValueError as exc:  # pragma: no cover - wrong structure
+            raise typer.BadParameter(str(exc)) from exc
+    per_pass_rules = RegexEngine([r for r in rules if r.per_pass])
+    final_rules = RegexEngine([r for r in rules if not r.per_pass])
+
+    # first-heading slugs of the files as read, and as written
+    read_slugs: Dict[Path, str | None] = {}
+    slugs: Dict[Path, str | None] = {}
 
-    for md_file in files:
+    def read(md_file: Path) -> str:
         text = md_file.read_text(encoding="utf-8", errors="replace")
-        for idx, prompt in enumerate(prompts):
+        if rename_by_heading:
+            read_slugs[md_file] = cleanup.heading_slug(text)
+        return text
+
+    def process(md_file: Path, text: str) -> str | None:
+        with metrics.FILE_SECONDS.time():
+            return run_passes(md_file, text)
+
+    def send_one(md_file: Path, prompt: str, text: str, pass_model: str) -> str:
+        if edit_mode:
+            try:
+                raw = send_prompt_edits(prompt, text, pass_model, max_tokens)
+                return apply_edits(text, parse_edits(raw))
+            except EditError as exc:
+                if verbose:
+                    typer.echo(f"{md_file}: edit list rejected ({exc}), resending")
+        return send_prompt(prompt, text, pass_model, max_tokens)
+
+    def finish(text: str, applied: int) -> str | None:
+        if not applied:
+            return None
+        if final_rules:
+            text = final_rules.apply(text)
+        return cleanup.strip_wrappers(text) if strip_wrappers else text
+
+    def run_passes(md_file: Path, text: str) -> str | None:
+        rel = relative_key(folder, md_file)
+        applied = 0
+        for idx, spec in enumerate(prompts):
+            if not spec.applies(rel, text):
+                if verbose:
+                    typer.echo(f"{md_file}: pass {idx + 1}/{len(prompts)} skipped")
+                continue
+            applied += 1
+            pass_model = choose_model(
+                routes, rel, prompt_paths[idx], text, default=model
+            )
+            if verbose:
+                suffix = f" [{pass_model}]" if pass_model != model else ""
+                typer.echo(f"{md_file}: pass {idx + 1}/{len(prompts)}{suffix}")
+            text = send_one(md_file, spec.text, text, pass_model)
+            if per_pass_rules:
+                text = per_pass_rules.apply(text)
+        return finish(text, applied)
+
+    def send_packed(
+        pack: List[Path], prompt: str, texts: List[str], pass_model: str
+    ) -> List[str] | None:
+        """Send *texts* in one request; None if the reply does not split cleanly."""
+        key = new_key(texts)
+        limit = max_tokens * len(texts) if max_tokens else None
+        raw = send_prompt_packed(prompt, pack_documents(texts, key), pass_model, limit)
+        try:
+            return unpack_documents(raw, len(texts), key)
+        except PackError as exc:
             if verbose:
-                typer.echo(f"{md_file}: pass {idx + 1}/{len(prompts)}")
-            text = send_prompt(prompt, text, model, max_tokens)
-            for pat, repl in patterns:
-                text = pat.sub(repl, text)
-        write_atomic(md_file, text)
+                names = ", ".join(str(f) for f in pack)
+                typer.echo(f"{names}: packed reply rejected ({exc}), resending per file")
+            return None
+
+    def process_pack(pack: tuple[Path, ...], texts: List[str]) -> List[str | None]:
+        if len(pack) == 1:
+            return [process(pack[0], texts[0])]
+        started = time.perf_counter()
+        texts = list(texts)
+        rels = [relative_key(folder, f) for f in pack]
+        applied = [0] * len(pack)
+        for idx, spec in enumerate(prompts):
+            groups: Dict[str, List[int]] = {}
+            for i, md_file in enumerate(pack):
+                if not spec.applies(rels[i], texts[i]):
+                    if verbose:
+                        typer.echo(f"{md_file}: pass {idx + 1}/{len(prompts)} skipped")
+                    continue
+                applied[i] += 1
+                pass_model = choose_model(
+                    routes, rels[i], prompt_paths[idx], texts[i], default=model
+                )
+                groups.setdefault(pass_model, []).append(i)
+            for pass_model, members in groups.items():
+                if verbose:
+                    suffix = f" [{pass_model}]" if pass_model != model else ""
+                    packed = f" (packed with {len(members) - 1} more)" if len(members) > 1 else ""
+                    for i in members:
+                        typer.echo(f"{pack[i]}: pass {idx + 1}/{len(prompts)}{suffix}{packed}")
+                replies = None
+                if len(members) > 1:
+                    replies = send_packed(
+                        [pack[i] for i in members],
+                        spec.text,
+                        [texts[i] for i in members],
+                        pass_model,
+                    )
+                if replies is None:
+                    replies = [
+                        send_one(pack[i], spec.text, texts[i], pass_model) for i in members
+                    ]
+                for i, reply in zip(members, replies):
+                    texts[i] = per_pass_rules.apply(reply) if per_pass_rules else reply
+        per_file = (time.perf_counter() - started) / len(pack)
+        for _ in pack:
+            metrics.FILE_SECONDS.observe(per_file)
+        return [finish(text, count) for text, count in zip(texts, applied)]
+
+    def write(batch: list[tuple[Path, str | None]]) -> None:
+        if rename_by_heading:
+            for md_file, text in batch:
+                slug = read_slugs.pop(md_file, None)
+                if text is not None:
+                    slug = cleanup.heading_slug(text)
+                slugs[target(md_file)] = slug
+        done = 0
+        for md_file, text in batch:
+            if text is None:
+                if output_dir is not None:
+                    try:
+                        link_or_copy(md_file, target(md_file), replace=True)
+                    except OSError as exc:
+                        write_failed(md_file, exc)
+                        continue
+                report.skipped.append(relative_key(folder, md_file))
+                metrics.FILES.inc(result="skipped")
+                done += 1
+        changed = {target(md_file): md_file for md_file, text in batch if text is not None}
+        error = None
+        try:
+            written = write_atomic_batch(
+                [(target(md_file), text) for md_file, text in batch if text is not None],
+                durability,
+            )
+        except PartialWriteError as exc:
+            written, error = exc.written, exc
+        except OSError as exc:
+            written, error = [], exc
+        for path in written:
+            report.processed.append(relative_key(Path(output_dir or folder), path))
+            metrics.FILES.inc(result="processed")
+            done += 1
+        if progress is not None:
+            progress.advance(done)
+        if error is not None:
+            # only the files that were not renamed into place failed
+            for path in sorted(set(changed) - set(written)):
+                write_failed(changed[path], error.__cause__ or error)
+
+    def write_failed(md_file: Path, exc: BaseException) -> None:
+        if not keep_going:
+            raise exc
+        slugs.pop(target(md_file), None)
+        record_failure(md_file, exc)
+
+    def record_failure(md_file: Path, exc: BaseException) -> None:
+        report.record_failure(relative_key(folder, md_file), exc)
+        metrics.FILES.inc(result="failed")
+        if progress is not None:
+            progress.advance(failed=True)
+
+    def read_pack(pack: tuple[Path, ...]) -> List[str]:
+        return [read(f) for f in pack]
+
+    def write_packs(batch: list[tuple[tuple[Path, ...], List[str | None]]]) -> None:
+        write([(f, t) for pack, texts in batch for f, t in zip(pack, texts)])
+
+    def record_pack_failure(pack: tuple[Path, ...], exc: BaseException) -> None:
+        for md_file in pack:
+            record_failure(md_file, exc)
+
+    if pack_tokens:
+        packs = [tuple(pack) for pack in plan_packs(files, pack_tokens)]
+        stages = (packs, read_pack, process_pack, write_packs, record_pack_failure)
+    else:
+        stages = (files, read, process, write, record_failure)
+    items, read_item, process_item, write_item, on_error = stages
+
+    with track_usage() as usage:
+        try:
+            run_pipeline(
+                items,
+                read_item,
+                process_item,
+                write_item,
+                workers=workers,
+                prefetch=prefetch,
+                on_error=on_error if keep_going else None,
+            )
+        finally:
+            report.usage = usage
+    if slugs:
+        renames, conflicts = cleanup.plan_renames(slugs.items(), previous)
+        cleanup.apply_renames(
+            renames, conflicts, Path(output_dir or folder), report, previous=previous
+        )
+        if output_dir is not None and report.renamed:
+            recorded = {
+                src.relative_to(output_dir).as_posix(): dst.relative_to(output_dir).as_posix()
+                for src, dst in previous.items()
+            }
+            cleanup.save_renamed(output_dir, {**recorded, **report.renamed})
+    return report
@@ -0,0 +1,114 @@
+"""Sending several small documents to the model in one request."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Iterable, List, Sequence
+import re
+import secrets
+
+from .routing import CHARS_PER_TOKEN
+
+PACK_INSTRUCTIONS = """\
+The user message contains several separate documents. Each one starts with a
+line <<<doc N KEY>>> and ends with a line <<<end N KEY>>>. Apply the
+instructions above to every document independently. Reply with every
+document, in the same order, wrapped in exactly the same marker lines, and
+nothing outside the markers."""
+
+# Upper bound on documents per request, however small they are
+MAX_PACK_FILES = 32
+
+_MARKER_RE = r"<<<(doc|end) (\d+) {key}>>>"
+
+
+class PackError(ValueError):
+    """Raised when a packed reply cannot be split back into its documents."""
+
+
+def new_key(texts: Sequence[str]) -> str:
+    """Return a random marker key that occurs in none of *texts*."""
+    while True:
+        key = secrets.token_hex(4)
+        if not any(key in text for text in texts):
+            return key
+
+
+def pack_documents(texts: Sequence[str], key: str) -> str:
+    """Join *texts* into one message wrapped in numbered markers."""
+    return "\n".join(
+        f"<<<doc {i} {key}>>>\n{text}\n<<<end {i} {key}>>>"
+        for i, text in enumerate(texts, start=1)
+    )
+
+
+def unpack_documents(reply: str, count: int, key: str) -> List[str]:
+    """Split a packed *reply* into *count* documents.
+
+    Every document must come back exactly once, in order, non-empty and with
+    nothing but whitespace between the markers; otherwise PackError is
+    raised.
+    """
+    marker = re.compile(_MARKER_RE.format(key=re.escape(key)))
+    docs: List[str] = []
+    pos = 0
+    expected = 1
+    start = None
+    for match in marker.finditer(reply):
+        kind, number = match.group(1), int(match.group(2))
+        if number != expected:
+            raise PackError(f"Expected document {expected}, found marker {number}")
+        if kind == "doc":
+            if start is not None or reply[pos : match.start()].strip():
+                raise PackError(f"Unexpected text before document {number}")
+            start = match.end()
+        else:
+            if start is None:
+                raise PackError(f"End marker {number} without a start marker")
+            body = reply[start : match.start()]
+            body = body[1:] if body.startswith("\n") else body
+            body = body[:-1] if body.endswith("\n") else body
+            if not body.strip():
+                raise PackError(f"Document {number} came back empty")
+            docs.append(body)
+            start = None
+            pos = match.end()
+            expected += 1
+    if start is not None or reply[pos:].strip():
+        raise PackError("Unterminated document or text after the last marker")
+    if len(docs) != count:
+        raise PackError(f"Expected {count} documents, got {len(docs)}")
+    return docs
+
+
+def file_tokens(path: Path) -> int:
+    """Estimate the token count of *path* from its size, without reading it."""
+    return Path(path).stat().st_size // CHARS_PER_TOKEN + 1
+
+
+def plan_packs(
+    files: Iterable[Path],
+    budget: int | None,
+    size_of: Callable[[Path], int] = file_tokens,
+) -> List[List[Path]]:
+    """Group *files* into packs of at most *budget* estimated tokens.
+
+    Files larger than half the budget are sent on their own. Without a
+    *budget* every file is its own pack.
+    """
+    packs: List[List[Path]] = []
+    current: List[Path] = []
+    used = 0
+    for path in files:
+        size = size_of(path) if budget else 0
+        if not budget or size > budget // 2:
+            packs.append([path])
+            continue
+        if current and (used + size > budget or len(current) >= MAX_PACK_FILES):
+            packs.append(current)
+            current, used = [], 0
+        current.append(path)
+        used += size
+    if current:
+        packs.append(current)
+    return packs
@@ -0,0 +1,146 @@
+"""Staged reader -> worker -> writer pipeline connected by bounded queues."""
+
+from __future__ import annotations
+
+from typing import Callable, Iterable, List, Tuple, TypeVar
+import contextvars
+import queue
+import threading
+
+T = TypeVar("T")
+
+_DONE = object()
+# How often blocked stages re-check whether the pipeline was aborted
+_POLL_SECONDS = 0.1
+
+
+def run_pipeline(
+    items: Iterable[T],
+    read: Callable[[T], object],
+    process: Callable[[T, object], object],
+    write: Callable[[List[Tuple[T, object]]], None],
+    workers: int = 1,
+    prefetch: int = 4,
+    batch_size: int = 16,
+    on_error: Callable[[T, BaseException], None] | None = None,
+) -> None:
+    """Run *items* through read, process and write stages concurrently.
+
+    A single reader thread calls ``read(item)`` up to *prefetch* items ahead
+    of the *workers* threads calling ``process(item, data)``. A single writer
+    thread receives up to *batch_size* finished ``(item, result)`` pairs at a
+    time, so it can amortize per-write costs such as fsync. Bounded queues
+    between the stages provide backpressure.
+
+    If *on_error* is given, an item whose read or process step raises is
+    passed to it and dropped, and a failed write batch reports every item in
+    it. Otherwise the first exception stops all stages and is re-raised.
+    """
+    workers = max(1, workers)
+    read_q: queue.Queue = queue.Queue(maxsize=max(1, prefetch))
+    write_q: queue.Queue = queue.Queue(maxsize=max(1, prefetch) + workers)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+
+    def put(q: queue.Queue, value: object) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q: queue.Queue) -> object:
+        while not stop.is_set():
+            try:
+                return q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def fail(item: T, exc: BaseException) -> None:
+        if on_error is None:
+            raise exc
+        on_error(item, exc)
+
+    def reader() -> None:
+        for item in items:
+            try:
+                data = read(item)
+            except Exception as exc:
+                fail(item, exc)
+                continue
+            if not put(read_q, (item, data)):
+                return
+        for _ in range(workers):
+            put(read_q, _DONE)
+
+    def worker() -> None:
+        while True:
+            job = get(read_q)
+            if job is _DONE:
+                break
+            item, data = job
+            try:
+                result = process(item, data)
+            except Exception as exc:
+                fail(item, exc)
+                continue
+            if not put(write_q, (item, result)):
+                return
+        put(write_q, _DONE)
+
+    def writer() -> None:
+        remaining = workers
+        while remaining:
+            job = get(write_q)
+            if job is _DONE:
+                if stop.is_set():
+                    return
+                remaining -= 1
+                continue
+            batch = [job]
+            while len(batch) < batch_size:
+                try:
+                    extra = write_q.get_nowait()
+                except queue.Empty:
+                    break
+                if extra is _DONE:
+                    remaining -= 1
+                    continue
+                batch.append(extra)
+            try:
+                write(batch)
+            except Exception as exc:
+                if on_error is None:
+                    raise
+                for item, _ in batch:
+                    on_error(item, exc)
+
+    def guarded(fn: Callable[[], None]) -> Callable[[], None]:
+        # Stages run in a copy of the caller's context, e.g. its usage counters
+        context = contextvars.copy_context()
+
+        def run() -> None:
+            try:
+                context.run(fn)
+            except BaseException as exc:
+                errors.append(exc)
+                stop.set()
+
+        return run
+
+    threads = [threading.Thread(target=guarded(reader), name="mdgpt-reader")]
+    threads += [
+        threading.Thread(target=guarded(worker), name=f"mdgpt-worker-{i}")
+        for i in range(workers)
+    ]
+    threads.append(threading.Thread(target=guarded(writer), name="mdgpt-writer"))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
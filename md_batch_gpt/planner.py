@@ -0,0 +1,515 @@
+"""Compile command inputs into a manifest of work units and execute it.
+
+A :class:`Manifest` lists :class:`WorkUnit` objects: one prompt unit per
+Markdown file for ``run`` and one image unit per image request for the image
+commands. Units record the files they read (``sources``) and write
+(``outputs``); a unit depends on every other unit writing one of its
+sources, so e.g. images planned from docs wait for the prompt passes over
+those docs. Manifests are plain JSON so they can be saved, inspected and
+diffed before :func:`execute_manifest` runs them concurrently.
+
+Only ``mdgpt plan`` and ``mdgpt execute`` go through manifests; the direct
+commands keep their own pipelines, which support options (sharding,
+packing, streamed specs, ``--since``, ``--output-dir``) manifests do not
+describe. Planning reuses their building blocks, such as
+:func:`~md_batch_gpt.images.plan_image_requests`.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+import contextvars
+import hashlib
+import json
+
+import typer
+
+from .file_io import iter_markdown_files, write_atomic, write_atomic_bytes
+from .images import (
+    doc_prompt,
+    image_outputs,
+    load_doc_json,
+    load_spec_file,
+    plan_image_requests,
+)
+from .markdown_parser import parse_markdown_image_entries
+from .openai_client import generate_images, max_images_per_request, track_usage
+from .orchestrator import process_folder
+from .prompts import load_prompt
+from .report import RunReport
+from .routing import estimate_tokens
+from .scheduling import order_by_cost
+from .sharding import relative_key
+
+MANIFEST_VERSION = 1
+UNIT_KINDS = ("prompt", "image")
+
+
+def _sha1(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+@dataclass
+class WorkUnit:
+    """One independently executable piece of work.
+
+    ``cost`` is an estimate in the unit's natural currency: tokens for
+    ``prompt`` units, images for ``image`` units.
+    """
+
+    id: str
+    kind: str
+    params: Dict[str, Any]
+    sources: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    deps: List[str] = field(default_factory=list)
+    cost: float = 0
+
+    def fingerprint(self) -> str:
+        """Return a hash of everything that determines this unit's result."""
+        data = {"kind": self.kind, "params": self.params, "outputs": self.outputs}
+        return _sha1(json.dumps(data, sort_keys=True).encode("utf-8"))
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": dict(self.params),
+            "sources": list(self.sources),
+            "outputs": list(self.outputs),
+            "deps": list(self.deps),
+            "cost": self.cost,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "WorkUnit":
+        if data.get("kind") not in UNIT_KINDS:
+            raise ValueError(f"Unknown work unit kind {data.get('kind')!r}")
+        return cls(
+            id=str(data["id"]),
+            kind=data["kind"],
+            params=dict(data.get("params", {})),
+            sources=list(data.get("sources", [])),
+            outputs=list(data.get("outputs", [])),
+            deps=list(data.get("deps", [])),
+            cost=data.get("cost", 0),
+        )
+
+
+@dataclass
+class Manifest:
+    """An ordered list of work units with dependencies between them."""
+
+    units: List[WorkUnit] = field(default_factory=list)
+    version: int = MANIFEST_VERSION
+
+    def to_dict(self) -> dict:
+        return {"version": self.version, "units": [u.to_dict() for u in self.units]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Manifest":
+        if not isinstance(data, dict) or not isinstance(data.get("units"), list):
+            raise ValueError("Manifest must be an object with a list of units")
+        if data.get("version", MANIFEST_VERSION) != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version {data.get('version')}")
+        manifest = cls([WorkUnit.from_dict(u) for u in data["units"]])
+        manifest.validate()
+        return manifest
+
+    def validate(self) -> None:
+        """Raise ValueError for duplicate IDs, unknown deps or dependency cycles."""
+        ids = [u.id for u in self.units]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Manifest contains duplicate unit IDs")
+        known = set(ids)
+        for unit in self.units:
+            missing = [d for d in unit.deps if d not in known]
+            if missing:
+                raise ValueError(f"{unit.id} depends on unknown units {missing}")
+        _topological_order(self.units)
+
+    def save(self, path: Path) -> None:
+        write_atomic(path, json.dumps(self.to_dict(), indent=2) + "\n")
+
+    def extend(self, other: "Manifest") -> "Manifest":
+        """Return a manifest with the units of both, dependencies relinked."""
+        return Manifest(link_dependencies([*self.units, *other.units]))
+
+
+def load_manifest(path: Path) -> Manifest:
+    """Load a manifest written by :meth:`Manifest.save`."""
+    return Manifest.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+
+def link_dependencies(units: List[WorkUnit]) -> List[WorkUnit]:
+    """Make every unit depend on the units writing one of its sources."""
+    writers: Dict[str, List[str]] = {}
+    for unit in units:
+        for output in unit.outputs:
+            writers.setdefault(str(Path(output).resolve()), []).append(unit.id)
+    for unit in units:
+        deps = list(unit.deps)
+        for source in unit.sources:
+            for writer in writers.get(str(Path(source).resolve()), []):
+                if writer != unit.id and writer not in deps:
+                    deps.append(writer)
+        unit.deps = deps
+    return units
+
+
+def _topological_order(units: Sequence[WorkUnit]) -> List[WorkUnit]:
+    by_id = {u.id: u for u in units}
+    order: List[WorkUnit] = []
+    state: Dict[str, int] = {}  # 1: visiting, 2: done
+    for root in units:
+        stack = [(root, iter(root.deps))]
+        if state.get(root.id):
+            continue
+        state[root.id] = 1
+        while stack:
+            unit, deps = stack[-1]
+            dep = next(deps, None)
+            if dep is None:
+                stack.pop()
+                state[unit.id] = 2
+                order.append(unit)
+            elif state.get(dep) == 1:
+                raise ValueError(f"Dependency cycle through {dep}")
+            elif not state.get(dep):
+                state[dep] = 1
+                stack.append((by_id[dep], iter(by_id[dep].deps)))
+    return order
+
+
+def diff_manifests(old: Manifest, new: Manifest) -> Dict[str, List[str]]:
+    """Return unit IDs ``added``, ``removed`` and ``changed`` from *old* to *new*."""
+    before = {u.id: u.fingerprint() for u in old.units}
+    after = {u.id: u.fingerprint() for u in new.units}
+    return {
+        "added": [i for i in after if i not in before],
+        "removed": [i for i in before if i not in after],
+        "changed": [i for i in after if i in before and before[i] != after[i]],
+    }
+
+
+def plan_run(
+    folder: Path,
+    prompt_paths: List[Path],
+    model: str,
+    max_tokens: int | None = None,
+    regex_json: Path | None = None,
+    edit_mode: bool = False,
+    files: Iterable[Path] | None = None,
+) -> Manifest:
+    """Plan one prompt unit per Markdown file under *folder* (or in *files*).
+
+    The cost estimate assumes every pass sends and receives the whole file.
+    """
+    folder = Path(folder).resolve()
+    prompt_paths = [Path(p).resolve() for p in prompt_paths]
+    specs = [load_prompt(p) for p in prompt_paths]
+    prompt_hashes = [_sha1(spec.text.encode("utf-8")) for spec in specs]
+    regex_hash = _sha1(Path(regex_json).read_bytes()) if regex_json else None
+    units = []
+    for md_file in sorted(iter_markdown_files(folder) if files is None else files):
+        md_file = Path(md_file).resolve()
+        data = md_file.read_bytes()
+        text = data.decode("utf-8", errors="replace")
+        rel = relative_key(folder, md_file)
+        passes = sum(1 for spec in specs if spec.applies(rel, text))
+        units.append(
+            WorkUnit(
+                id=f"prompt:{rel}",
+                kind="prompt",
+                params={
+                    "folder": str(folder),
+                    "prompts": [str(p) for p in prompt_paths],
+                    "prompt_sha1": prompt_hashes,
+                    "model": model,
+                    "max_tokens": max_tokens,
+                    "regex_json": str(Path(regex_json).resolve()) if regex_json else None,
+                    "regex_sha1": regex_hash,
+                    "edit_mode": edit_mode,
+                    "sha1": _sha1(data),
+                },
+                sources=[str(md_file)],
+                outputs=[str(md_file)],
+                cost=2 * estimate_tokens(text) * passes,
+            )
+        )
+    return Manifest(link_dependencies(units))
+
+
+def plan_images(
+    entries: Iterable[Tuple[Dict[str, Any], str | None]],
+    model: str,
+    size: str,
+    build_prompt: Callable[[Dict[str, Any]], str] = lambda e: e["summary"],
+) -> Manifest:
+    """Plan image units for ``(entry, source_file)`` pairs.
+
+    Requests are grouped as by ``generate-images`` (see
+    :func:`~md_batch_gpt.images.plan_image_requests`): outputs with the same
+    prompt share requests, as many per request as *model* allows.
+    """
+    pairs = list(entries)
+    requests, errors = plan_image_requests(
+        [entry for entry, _ in pairs], build_prompt, max_images_per_request(model)
+    )
+    if errors:
+        filename, exc = errors[0]
+        raise ValueError(f"{filename}: {exc}") from exc
+    sources: Dict[str, set[str]] = {}
+    for entry, source in pairs:
+        if source:
+            for output in image_outputs(entry):
+                sources.setdefault(output, set()).add(str(Path(source).resolve()))
+    units = []
+    for prompt, outputs in requests:
+        units.append(
+            WorkUnit(
+                id=f"image:{Path(outputs[0]).resolve()}",
+                kind="image",
+                params={"prompt": prompt, "model": model, "size": size, "n": len(outputs)},
+                sources=sorted(set().union(*(sources.get(o, ()) for o in outputs))),
+                outputs=[str(Path(out).resolve()) for out in outputs],
+                cost=len(outputs),
+            )
+        )
+    return Manifest(link_dependencies(units))
+
+
+def plan_spec_files(json_files: Iterable[Path], model: str, size: str) -> Manifest:
+    """Plan the entries of ``generate-images`` JSON files."""
+    pairs = []
+    for json_file in json_files:
+        pairs.extend((entry, None) for entry in load_spec_file(json_file))
+    return plan_images(pairs, model, size)
+
+
+def plan_docs(docs_folder: Path, model: str, size: str) -> Manifest:
+    """Plan the image entries of Markdown files and ``*.json`` specs in *docs_folder*."""
+    pairs = []
+    for md_path in sorted(iter_markdown_files(docs_folder)):
+        entries = parse_markdown_image_entries(docs_folder, [md_path])
+        pairs.extend((entry, str(md_path)) for entry in entries)
+    for json_path in sorted(Path(docs_folder).glob("*.json")):
+        pairs.extend((spec, str(json_path)) for spec in load_doc_json(json_path))
+    return plan_images(pairs, model, size, build_prompt=doc_prompt)
+
+
+def plan_prompt_file(prompt_file: Path, model: str, size: str) -> Manifest:
+    """Plan a ``generate-image`` prompt file (filename line, then prompt)."""
+    lines = Path(prompt_file).read_text(encoding="utf-8", errors="replace").splitlines()
+    filename = lines[0].strip() if lines else ""
+    prompt = "\n".join(lines[1:]).strip()
+    if not filename or not prompt:
+        raise ValueError(f"{prompt_file} needs a filename line followed by a prompt")
+    return plan_images(
+        [({"expected_filename": filename, "summary": prompt}, str(prompt_file))],
+        model,
+        size,
+    )
+
+
+def _batch_key(unit: WorkUnit) -> str | None:
+    """Return the key of the prompt units that can run in one batch with *unit*.
+
+    Prompt units planned with the same prompts and settings share a key;
+    image units are never batched (``None``).
+    """
+    if unit.kind != "prompt":
+        return None
+    params = {k: v for k, v in unit.params.items() if k != "sha1"}
+    return json.dumps(params, sort_keys=True)
+
+
+def run_batch(units: List[WorkUnit], durability: str) -> Dict[str, BaseException]:
+    """Run *units* and return the exceptions of those that failed, by unit ID.
+
+    A batch of prompt units (see :func:`_batch_key`) is one
+    :func:`~md_batch_gpt.orchestrator.process_folder` call over their files,
+    so prompts are loaded and rules compiled once per batch, not per file.
+    Raising fails every unit in the batch.
+    """
+    params = units[0].params
+    if units[0].kind == "prompt":
+        report = process_folder(
+            Path(params["folder"]),
+            [Path(p) for p in params["prompts"]],
+            model=params["model"],
+            max_tokens=params.get("max_tokens"),
+            regex_json=Path(params["regex_json"]) if params.get("regex_json") else None,
+            durability=durability,
+            edit_mode=params.get("edit_mode", False),
+            files=[Path(s) for unit in units for s in unit.sources],
+            keep_going=True,
+        )
+        ids = {unit.id for unit in units}
+        return {
+            f"prompt:{failure['item']}": RuntimeError(failure["error"])
+            for failure in report.failures
+            if f"prompt:{failure['item']}" in ids
+        }
+    failed: Dict[str, BaseException] = {}
+    for unit in units:
+        try:
+            _run_image(unit, durability)
+        except Exception as exc:
+            failed[unit.id] = exc
+    return failed
+
+
+def _run_image(unit: WorkUnit, durability: str) -> None:
+    params = unit.params
+    images = generate_images(
+        params["prompt"], model=params["model"], size=params["size"], n=params["n"]
+    )
+    if len(images) < len(unit.outputs):
+        raise RuntimeError(f"API returned {len(images)} of {len(unit.outputs)} images")
+    for output, data in zip(unit.outputs, images):
+        write_atomic_bytes(Path(output), data, durability)
+
+
+def _load_state(path: Path | None) -> Dict[str, str]:
+    if path is None or not Path(path).exists():
+        return {}
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def execute_manifest(
+    manifest: Manifest,
+    workers: int = 4,
+    keep_going: bool = False,
+    state_path: Path | None = None,
+    durability: str = "file",
+    verbose: bool = False,
+    run_units: Callable[[List[WorkUnit], str], Dict[str, BaseException]] = run_batch,
+    schedule: str = "input",
+) -> RunReport:
+    """Run the units of *manifest* on *workers* threads in dependency order.
+
+    A unit starts once all its dependencies succeeded; units depending on a
+    failed unit fail too. Without *keep_going* no new units start after a
+    failure. The report lists unit IDs.
+
+    With *state_path* the fingerprints of finished units are recorded there,
+    and units whose fingerprint is recorded and whose outputs exist are
+    skipped, so an interrupted or partly failed execution can be resumed.
+
+    *schedule* orders the units that are ready to start (see
+    :func:`~md_batch_gpt.scheduling.order_by_cost`). Their cost is the
+    unit's own ``cost`` plus the most expensive chain of units waiting on
+    it, so long dependency chains start early; ``fair`` takes turns between
+    prompt and image units.
+
+    Ready prompt units sharing prompts and settings are handed to
+    *run_units* together (see :func:`run_batch`), split into as many batches
+    as there are idle workers; image units go one at a time.
+    """
+    manifest.validate()
+    report = RunReport()
+    state = _load_state(state_path)
+    by_id = {u.id: u for u in manifest.units}
+    waiting = {u.id: set(u.deps) for u in manifest.units}
+    dependents: Dict[str, List[str]] = {}
+    for unit in manifest.units:
+        for dep in unit.deps:
+            dependents.setdefault(dep, []).append(unit.id)
+    order = {u.id: i for i, u in enumerate(manifest.units)}
+    chain: Dict[str, float] = {}
+    for unit in reversed(_topological_order(manifest.units)):
+        uid = unit.id
+        chain[uid] = unit.cost + max(
+            (chain[child] for child in dependents.get(uid, [])), default=0
+        )
+    ready = [uid for uid, deps in waiting.items() if not deps]
+    running: Dict[Future, List[str]] = {}
+    failed_ids: set[str] = set()
+    stopped = False
+
+    def settle(uid: str) -> None:
+        for child in dependents.get(uid, []):
+            waiting[child].discard(uid)
+            if not waiting[child] and child not in failed_ids:
+                ready.append(child)
+
+    def fail(uid: str, exc: BaseException) -> None:
+        pending = [uid]
+        report.record_failure(uid, exc)
+        failed_ids.add(uid)
+        while pending:
+            for child in dependents.get(pending.pop(), []):
+                if child not in failed_ids:
+                    failed_ids.add(child)
+                    report.record_failure(child, RuntimeError(f"dependency {uid} failed"))
+                    pending.append(child)
+
+    def finished_before(uid: str) -> bool:
+        unit = by_id[uid]
+        return state.get(uid) == unit.fingerprint() and all(
+            Path(o).exists() for o in unit.outputs
+        )
+
+    def next_batch() -> List[WorkUnit]:
+        """Pop the next ready unit and the ready units batched with it."""
+        unit = by_id[ready.pop(0)]
+        key = _batch_key(unit)
+        if key is None:
+            return [unit]
+        same = [uid for uid in ready if _batch_key(by_id[uid]) == key]
+        idle = max(1, workers - len(running))
+        size = -(-(len(same) + 1) // idle)
+        taken = same[: size - 1]
+        taken_ids = set(taken)
+        ready[:] = [uid for uid in ready if uid not in taken_ids]
+        return [unit, *(by_id[uid] for uid in taken)]
+
+    with track_usage() as usage, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while ready or running:
+            # units finished by an earlier execution may make others ready
+            skipped = [] if stopped else [uid for uid in ready if finished_before(uid)]
+            while skipped:
+                for uid in skipped:
+                    ready.remove(uid)
+                    report.skipped.append(uid)
+                    settle(uid)
+                skipped = [uid for uid in ready if finished_before(uid)]
+            ready.sort(key=order.__getitem__)
+            ready[:] = order_by_cost(
+                ready, chain.__getitem__, schedule, group=lambda u: by_id[u].kind
+            )
+            while ready and not stopped:
+                batch = next_batch()
+                if verbose:
+                    typer.echo(f"Starting {', '.join(u.id for u in batch)}")
+                context = contextvars.copy_context()
+                running[pool.submit(context.run, run_units, batch, durability)] = [
+                    u.id for u in batch
+                ]
+            if stopped:
+                ready.clear()
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                uids = running.pop(future)
+                exc = future.exception()
+                failed = dict.fromkeys(uids, exc) if exc is not None else future.result()
+                for uid in uids:
+                    if uid in failed:
+                        fail(uid, failed[uid])
+                        stopped = stopped or not keep_going
+                        continue
+                    report.processed.append(uid)
+                    if state_path is not None:
+                        state[uid] = by_id[uid].fingerprint()
+                        write_atomic(state_path, json.dumps(state, indent=2) + "\n", "none")
+                    if verbose:
+                        typer.echo(f"Finished {uid}")
+                    settle(uid)
+    report.usage = usage
+    return report
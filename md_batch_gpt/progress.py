@@ -0,0 +1,175 @@
+"""Live progress line and JSON progress stream for long-running commands."""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Callable, Dict, TextIO
+import json
+import threading
+import time
+
+from .openai_client import in_flight_requests, usage_snapshot
+from .report import usage_delta
+
+
+def format_duration(seconds: float | None) -> str:
+    """Return *seconds* as ``1h02m``, ``4m05s`` or ``12s`` (``?`` if unknown)."""
+    if seconds is None:
+        return "?"
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    if minutes:
+        return f"{minutes}m{secs:02d}s"
+    return f"{secs}s"
+
+
+def _format_count(value: int) -> str:
+    if value >= 1_000_000:
+        return f"{value / 1_000_000:.1f}M"
+    if value >= 1_000:
+        return f"{value / 1_000:.1f}k"
+    return str(value)
+
+
+class Progress:
+    """Count finished units of a run and report rate, usage and ETA.
+
+    Whoever selects the work calls :meth:`add_total`, stages call
+    :meth:`advance` as units finish (successfully or not). While started, a
+    background thread redraws a status line on *stream* and appends one JSON
+    object per tick to *json_stream* every *interval* seconds; a final
+    ``"done"`` event is written by :meth:`close`.
+
+    The rate is averaged over the last *window* seconds, so the ETA follows
+    slowdowns (rate limits, long files) instead of the whole-run average.
+    API usage is taken from :mod:`md_batch_gpt.openai_client` relative to
+    the moment the progress was created.
+    """
+
+    def __init__(
+        self,
+        total: int = 0,
+        unit: str = "files",
+        stream: TextIO | None = None,
+        json_stream: TextIO | None = None,
+        interval: float = 1.0,
+        window: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.failed = 0
+        self.stream = stream
+        self.json_stream = json_stream
+        self.interval = interval
+        self.window = window
+        self._clock = clock
+        self._started = clock()
+        self._finished: deque[float] = deque()
+        self._usage_before = usage_snapshot()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._line_width = 0
+
+    def add_total(self, count: int) -> None:
+        """Add *count* units to the expected total."""
+        with self._lock:
+            self.total += count
+
+    def advance(self, count: int = 1, failed: bool = False) -> None:
+        """Mark *count* units as finished (*failed* ones are also counted)."""
+        now = self._clock()
+        with self._lock:
+            self.done += count
+            if failed:
+                self.failed += count
+            self._finished.extend([now] * count)
+
+    def snapshot(self) -> Dict[str, object]:
+        """Return the current counters, rate (units/s) and ETA in seconds."""
+        now = self._clock()
+        with self._lock:
+            while self._finished and self._finished[0] < now - self.window:
+                self._finished.popleft()
+            elapsed = now - self._started
+            span = min(self.window, elapsed)
+            rate = len(self._finished) / span if span > 0 else 0.0
+            done, failed, total = self.done, self.failed, self.total
+        usage = usage_delta(self._usage_before, usage_snapshot())
+        remaining = max(total - done, 0)
+        if remaining == 0:
+            eta: float | None = 0.0
+        else:
+            eta = remaining / rate if rate > 0 else None
+        return {
+            "unit": self.unit,
+            "done": done,
+            "failed": failed,
+            "total": total,
+            "in_flight": in_flight_requests(),
+            "rate": round(rate, 3),
+            "retries": usage.get("retries", 0),
+            "tokens": usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0),
+            "images": usage.get("images", 0),
+            "elapsed": round(elapsed, 1),
+            "eta": None if eta is None else round(eta, 1),
+        }
+
+    @staticmethod
+    def format_line(snap: Dict[str, object]) -> str:
+        """Return the one-line human readable form of a :meth:`snapshot`."""
+        parts = [f"{snap['done']}/{snap['total']} {snap['unit']}"]
+        if snap["failed"]:
+            parts[0] += f" ({snap['failed']} failed)"
+        parts += [
+            f"{snap['in_flight']} in flight",
+            f"{snap['rate']:.2f}/s",
+            f"{snap['retries']} retries",
+            f"{_format_count(snap['tokens'])} tokens",
+            f"ETA {format_duration(snap['eta'])}",
+        ]
+        return " | ".join(parts)
+
+    def emit(self, event: str = "progress") -> None:
+        """Redraw the status line and write one JSON record."""
+        snap = self.snapshot()
+        if self.stream is not None:
+            line = self.format_line(snap)
+            pad = max(self._line_width - len(line), 0)
+            self._line_width = len(line)
+            end = "\n" if event == "done" else ""
+            self.stream.write(f"\r{line}{' ' * pad}{end}")
+            self.stream.flush()
+        if self.json_stream is not None:
+            self.json_stream.write(json.dumps({"event": event, **snap}) + "\n")
+            self.json_stream.flush()
+
+    def _tick(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.emit()
+
+    def start(self) -> "Progress":
+        """Start reporting every *interval* seconds in a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._tick, daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self) -> None:
+        """Stop the reporting thread and write the final ``"done"`` record."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.emit("done")
+
+    def __enter__(self) -> "Progress":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
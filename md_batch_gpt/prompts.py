@@ -0,0 +1,104 @@
+"""Prompt files with optional front-matter selectors."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Tuple
+import re
+
+import yaml
+
+SELECTOR_KEYS = {"glob", "requires", "min_size", "max_size"}
+
+
+@dataclass(frozen=True)
+class PromptSpec:
+    """A prompt and the conditions a file must meet for it to be sent.
+
+    ``globs`` match the file path relative to the processed folder (any one
+    suffices), ``requires`` must be found in the current text, and
+    ``min_size``/``max_size`` bound the text length in characters.
+    """
+
+    path: Path
+    text: str
+    globs: Tuple[str, ...] = ()
+    requires: re.Pattern[str] | None = None
+    min_size: int | None = None
+    max_size: int | None = None
+
+    def applies(self, rel_path: str, text: str) -> bool:
+        """Return True if this prompt should run on *text* from *rel_path*."""
+        if self.globs and not any(fnmatchcase(rel_path, g) for g in self.globs):
+            return False
+        if self.min_size is not None and len(text) < self.min_size:
+            return False
+        if self.max_size is not None and len(text) > self.max_size:
+            return False
+        if self.requires is not None and not self.requires.search(text):
+            return False
+        return True
+
+    def may_apply(self, rel_path: str, size: int) -> bool:
+        """Return False if this prompt cannot run on a file of about *size*
+        characters at *rel_path*; ``requires`` is not checked."""
+        if self.globs and not any(fnmatchcase(rel_path, g) for g in self.globs):
+            return False
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        return True
+
+
+def load_prompt(path: Path) -> PromptSpec:
+    """Read a prompt file, splitting off selector front matter if present.
+
+    Front matter is a leading ``---`` YAML block using only the keys
+    ``glob`` (string or list), ``requires`` (regex), ``min_size`` and
+    ``max_size`` (non-negative integers). A file without such a block is
+    used verbatim; an invalid selector raises ValueError.
+    """
+    path = Path(path)
+    text = path.read_text(encoding="utf-8", errors="replace")
+    if not text.startswith("---"):
+        return PromptSpec(path, text)
+    parts = text.split("---", 2)
+    if len(parts) < 3:
+        return PromptSpec(path, text)
+    try:
+        data = yaml.safe_load(parts[1])
+    except yaml.YAMLError:
+        return PromptSpec(path, text)
+    if not isinstance(data, dict) or not SELECTOR_KEYS & set(data):
+        return PromptSpec(path, text)
+    unknown = set(data) - SELECTOR_KEYS
+    if unknown:
+        raise ValueError(f"{path} front matter has unknown keys: {', '.join(sorted(unknown))}")
+    globs = data.get("glob") or ()
+    if isinstance(globs, str):
+        globs = (globs,)
+    if not isinstance(globs, (list, tuple)) or not all(isinstance(g, str) for g in globs):
+        raise ValueError(f"{path} glob must be a string or a list of strings")
+    if data.get("requires") is not None and not isinstance(data["requires"], str):
+        raise ValueError(f"{path} requires must be a regular expression string")
+    try:
+        requires = re.compile(data["requires"]) if data.get("requires") else None
+    except re.error as exc:
+        raise ValueError(f"{path} has an invalid requires pattern: {exc}") from exc
+    for key in ("min_size", "max_size"):
+        value = data.get(key)
+        if value is not None and (
+            isinstance(value, bool) or not isinstance(value, int) or value < 0
+        ):
+            raise ValueError(f"{path} {key} must be a whole number of characters")
+    return PromptSpec(
+        path,
+        parts[2].lstrip("\n"),
+        globs=tuple(globs),
+        requires=requires,
+        min_size=data.get("min_size"),
+        max_size=data.get("max_size"),
+    )
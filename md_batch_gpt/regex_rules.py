@@ -0,0 +1,151 @@
+"""Post-processing of model output with ``--regex-json`` replacement rules."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Sequence
+import json
+import re
+
+
+@dataclass(frozen=True)
+class RegexRule:
+    """Replace *pattern* with *replacement* (``re.sub`` template syntax).
+
+    Rules run once on the final text unless *per_pass* is set, in which case
+    they run after every prompt pass so later prompts see the result.
+    """
+
+    pattern: re.Pattern[str]
+    replacement: str
+    per_pass: bool = False
+
+
+def load_rules(path: Path) -> List[RegexRule]:
+    """Load rules from a JSON object mapping patterns to replacements.
+
+    A value may be a replacement string or an object
+    ``{"replace": "...", "per_pass": true}``.
+    """
+    raw = json.loads(Path(path).read_text(encoding="utf-8"))
+    if not isinstance(raw, dict):
+        raise ValueError(f"{path} must contain an object mapping patterns to replacements")
+    rules: List[RegexRule] = []
+    for pat, value in raw.items():
+        per_pass = False
+        if isinstance(value, dict):
+            per_pass = bool(value.get("per_pass", False))
+            value = value.get("replace", "")
+        try:
+            compiled = re.compile(pat)
+        except re.error as exc:
+            raise ValueError(f"Invalid pattern {pat!r} in {path}: {exc}") from exc
+        rules.append(RegexRule(compiled, str(value), per_pass))
+    return rules
+
+
+# Source of a rule matching one whole word: ``\bword\b``
+_WORD_RULE_RE = re.compile(r"\\b(\w+)\\b")
+_WORD_RE = re.compile(r"\w+")
+
+
+def _whole_word(rule: RegexRule) -> str | None:
+    """Return the word *rule* replaces if it is a plain ``\\bword\\b`` rule.
+
+    Only rules without flags and with a replacement free of backslash
+    escapes qualify; anything else returns None.
+    """
+    if rule.pattern.flags != re.UNICODE or "\\" in rule.replacement:
+        return None
+    match = _WORD_RULE_RE.fullmatch(rule.pattern.pattern)
+    return match.group(1) if match else None
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Return a regex matching any of *words*, longest first, built as a trie.
+
+    Sharing prefixes keeps the number of alternatives tried at each text
+    position small even for hundreds of words.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        alternatives = [
+            re.escape(char) + build(child) for char, child in sorted(node.items()) if char
+        ]
+        if not alternatives:
+            return ""
+        if len(alternatives) == 1 and "" not in node:
+            return alternatives[0]
+        body = "(?:" + "|".join(alternatives) + ")"
+        return body + "?" if "" in node else body
+
+    return build(trie)
+
+
+class RegexEngine:
+    """Apply many :class:`RegexRule` objects with as few text scans as possible.
+
+    Rules run in order, each seeing the output of the ones before, exactly
+    like chained ``re.sub`` calls. The only shortcut taken is for runs of
+    consecutive whole-word rules (``\\bcolour\\b`` -> ``color``): a match of
+    such a rule is a complete word between non-word characters, so it can
+    neither overlap a match of another word nor change the word boundaries
+    around one. As long as no replacement contains a word a later rule in
+    the run replaces, applying the run in one scan over a trie of all its
+    words gives the same text as applying the rules one by one. Every other
+    rule is applied with ``re.sub`` on its own, and so is a whole-word rule
+    between two others: a rules file only gains from this when its
+    whole-word rules are kept together.
+    """
+
+    def __init__(self, rules: Sequence[RegexRule]) -> None:
+        self.rules = list(rules)
+        # Each step is a single rule or a group: a trigger pattern matching any
+        # of the group's words plus the rule for each word
+        self._steps: list[
+            tuple[re.Pattern[str], dict[str, RegexRule]] | RegexRule
+        ] = []
+        group: dict[str, RegexRule] = {}
+        produced: set[str] = set()
+        for rule in self.rules:
+            word = _whole_word(rule)
+            if word is None:
+                self._flush(group)
+                self._steps.append(rule)
+                group, produced = {}, set()
+                continue
+            if word in produced:
+                # an earlier replacement creates this word: start a new scan
+                self._flush(group)
+                group, produced = {}, set()
+            # a repeated word never matches again after the first rule for it
+            group.setdefault(word, rule)
+            produced.update(_WORD_RE.findall(rule.replacement))
+        self._flush(group)
+
+    def _flush(self, group: dict[str, RegexRule]) -> None:
+        if len(group) == 1:
+            self._steps.extend(group.values())
+        elif group:
+            trigger = re.compile(rf"\b{_trie_pattern(group)}\b")
+            self._steps.append((trigger, dict(group)))
+
+    def apply(self, text: str) -> str:
+        """Return *text* with every rule applied."""
+        for step in self._steps:
+            if isinstance(step, RegexRule):
+                text = step.pattern.sub(step.replacement, text)
+            else:
+                trigger, by_word = step
+                text = trigger.sub(lambda m: by_word[m.group()].replacement, text)
+        return text
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
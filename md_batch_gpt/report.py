@@ -0,0 +1,83 @@
+"""Per-run usage and failure reports that can be merged across shards."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List
+import json
+
+from .file_io import write_atomic
+
+
+@dataclass
+class RunReport:
+    """Summary of one run: processed/skipped items, failures and API usage.
+
+    ``renamed`` maps items renamed after processing to their new names.
+    """
+
+    shards: List[str] = field(default_factory=list)
+    processed: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    failures: List[Dict[str, str]] = field(default_factory=list)
+    usage: Dict[str, int] = field(default_factory=dict)
+    renamed: Dict[str, str] = field(default_factory=dict)
+
+    def record_failure(self, item: str, exc: BaseException) -> None:
+        """Record that *item* failed with *exc*."""
+        self.failures.append(
+            {"item": item, "error": f"{type(exc).__name__}: {exc}"}
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "shards": list(self.shards),
+            "processed": list(self.processed),
+            "skipped": list(self.skipped),
+            "failures": [dict(f) for f in self.failures],
+            "usage": dict(self.usage),
+            "renamed": dict(self.renamed),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RunReport":
+        return cls(
+            shards=list(data.get("shards", [])),
+            processed=list(data.get("processed", [])),
+            skipped=list(data.get("skipped", [])),
+            failures=[dict(f) for f in data.get("failures", [])],
+            usage={k: int(v) for k, v in data.get("usage", {}).items()},
+            renamed=dict(data.get("renamed", {})),
+        )
+
+    def write(self, path: Path) -> None:
+        """Write the report to *path* as JSON."""
+        write_atomic(path, json.dumps(self.to_dict(), indent=2) + "\n")
+
+
+def usage_delta(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    """Return the per-key difference between two usage snapshots."""
+    return {key: after.get(key, 0) - before.get(key, 0) for key in after}
+
+
+def load_report(path: Path) -> RunReport:
+    """Load a report previously written with :meth:`RunReport.write`."""
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} does not contain a report object")
+    return RunReport.from_dict(data)
+
+
+def merge_reports(reports: Iterable[RunReport]) -> RunReport:
+    """Combine per-shard *reports* into one, summing usage counters."""
+    merged = RunReport()
+    for report in reports:
+        merged.shards.extend(report.shards)
+        merged.processed.extend(report.processed)
+        merged.skipped.extend(report.skipped)
+        merged.failures.extend(report.failures)
+        merged.renamed.update(report.renamed)
+        for key, value in report.usage.items():
+            merged.usage[key] = merged.usage.get(key, 0) + value
+    return merged
@@ -0,0 +1,78 @@
+"""Per-file model routing rules loaded from ``[tool.md_batch_gpt]``."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterable, List, Sequence
+
+# Rough characters-per-token ratio for English Markdown
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Return a cheap local estimate of the token count of *text*."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+@dataclass(frozen=True)
+class Route:
+    """Send matching files to *model*.
+
+    ``glob`` matches the file path relative to the processed folder,
+    ``prompt`` matches the prompt file name, and ``min_tokens``/``max_tokens``
+    bound the estimated token count of the text being sent. All given
+    conditions must hold.
+    """
+
+    model: str
+    glob: str | None = None
+    prompt: str | None = None
+    min_tokens: int | None = None
+    max_tokens: int | None = None
+
+    def matches(self, rel_path: str, prompt_path: Path, tokens: int) -> bool:
+        if self.glob is not None and not fnmatchcase(rel_path, self.glob):
+            return False
+        if self.prompt is not None and not fnmatchcase(
+            Path(prompt_path).name, self.prompt
+        ):
+            return False
+        if self.min_tokens is not None and tokens < self.min_tokens:
+            return False
+        if self.max_tokens is not None and tokens > self.max_tokens:
+            return False
+        return True
+
+
+def load_routes(raw: Iterable[dict]) -> List[Route]:
+    """Build routes from the ``[[tool.md_batch_gpt.routes]]`` tables."""
+    if not isinstance(raw, (list, tuple)):
+        raise ValueError("[[tool.md_batch_gpt.routes]] must be an array of tables")
+    routes: List[Route] = []
+    for idx, item in enumerate(raw):
+        if not isinstance(item, dict) or not item.get("model"):
+            raise ValueError(f"Route {idx} must be a table with a model key")
+        unknown = set(item) - {"model", "glob", "prompt", "min_tokens", "max_tokens"}
+        if unknown:
+            raise ValueError(f"Route {idx} has unknown keys: {', '.join(sorted(unknown))}")
+        routes.append(Route(**item))
+    return routes
+
+
+def choose_model(
+    routes: Sequence[Route],
+    rel_path: str,
+    prompt_path: Path,
+    text: str,
+    default: str,
+) -> str:
+    """Return the model of the first route matching, or *default*."""
+    if not routes:
+        return default
+    tokens = estimate_tokens(text)
+    for route in routes:
+        if route.matches(rel_path, prompt_path, tokens):
+            return route.model
+    return default
@@ -0,0 +1,68 @@
+"""Ordering work by estimated cost so parallel runs finish sooner."""
+
+from __future__ import annotations
+
+from pathlib import Path, PurePosixPath
+from typing import Callable, Dict, Iterable, List, Sequence, TypeVar
+
+from .prompts import PromptSpec
+from .routing import CHARS_PER_TOKEN
+
+T = TypeVar("T")
+
+# "input": keep the given order, "largest": most expensive first,
+# "fair": most expensive first within each group, groups taking turns
+SCHEDULES = ("input", "largest", "fair")
+
+
+def top_level_group(rel_path: str) -> str:
+    """Return the first directory of *rel_path* ("" for top-level files)."""
+    parts = PurePosixPath(rel_path).parts
+    return parts[0] if len(parts) > 1 else ""
+
+
+def order_by_cost(
+    items: Iterable[T],
+    cost: Callable[[T], float],
+    mode: str = "largest",
+    group: Callable[[T], str] | None = None,
+) -> List[T]:
+    """Return *items* in the order given by *mode* (see ``SCHEDULES``).
+
+    Starting the most expensive work first keeps one worker from still
+    grinding through a large item after the others ran out (longest
+    processing time first). ``fair`` alternates between the groups returned
+    by *group* so that one huge folder cannot starve the rest; each group is
+    still served largest first, and groups holding larger items go first in
+    every round.
+    """
+    if mode not in SCHEDULES:
+        raise ValueError(f"Unknown schedule {mode!r}; use one of {', '.join(SCHEDULES)}")
+    items = list(items)
+    if mode == "input":
+        return items
+    costs = {id(item): cost(item) for item in items}
+    ranked = sorted(items, key=lambda item: costs[id(item)], reverse=True)
+    if mode == "largest" or group is None:
+        return ranked
+    queues: Dict[str, List[T]] = {}
+    for item in ranked:
+        queues.setdefault(group(item), []).append(item)
+    ordered: List[T] = []
+    lanes = [list(reversed(q)) for q in queues.values()]
+    while lanes:
+        for lane in lanes:
+            ordered.append(lane.pop())
+        lanes = [lane for lane in lanes if lane]
+    return ordered
+
+
+def markdown_cost(path: Path, rel_path: str, prompts: Sequence[PromptSpec]) -> int:
+    """Estimate the work for *path*: its token count times the passes that
+    may run on it, both judged from the file size without reading it."""
+    try:
+        size = path.stat().st_size
+    except OSError:
+        return 0
+    passes = sum(1 for spec in prompts if spec.may_apply(rel_path, size))
+    return (size // CHARS_PER_TOKEN + 1) * max(1, passes)
@@ -0,0 +1,72 @@
+"""Deterministic sharding of work items across processes or machines."""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, TypeVar
+import hashlib
+
+T = TypeVar("T")
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """Return ``(index, count)`` parsed from a ``"i/N"`` shard *spec*.
+
+    Shard indices are zero-based, so ``0/4`` through ``3/4`` cover a folder.
+    """
+    try:
+        index_text, count_text = spec.split("/", 1)
+        index, count = int(index_text), int(count_text)
+    except ValueError as exc:
+        raise ValueError(f"Invalid shard {spec!r}; expected i/N") from exc
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {spec!r}; need 0 <= i < N")
+    return index, count
+
+
+def format_shard(shard: tuple[int, int]) -> str:
+    """Return the ``"i/N"`` form of *shard*."""
+    return f"{shard[0]}/{shard[1]}"
+
+
+def shard_of(key: str, count: int) -> int:
+    """Return the shard index in ``range(count)`` that owns *key*.
+
+    The hash is stable across processes and machines, unlike :func:`hash`.
+    """
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def relative_key(folder: Path, path: Path) -> str:
+    """Return the POSIX relative path of *path* under *folder* used for hashing."""
+    return Path(path).relative_to(folder).as_posix()
+
+
+def in_shard(key: str, shard: tuple[int, int] | None) -> bool:
+    """Return True if *key* belongs to *shard* (always True if ``None``)."""
+    return shard is None or shard_of(key, shard[1]) == shard[0]
+
+
+def select_shard(
+    items: Iterable[T], key: Callable[[T], str], shard: tuple[int, int] | None
+) -> List[T]:
+    """Return the subset of *items* owned by *shard* (all items if ``None``)."""
+    return [item for item in items if in_shard(key(item), shard)]
+
+
+def run_local_shards(
+    count: int, fn: Callable[..., Any], *args: Any, **kwargs: Any
+) -> List[Any]:
+    """Run ``fn(*args, shard=(i, count), **kwargs)`` for every shard in a process pool.
+
+    Results are returned in shard order. This mirrors running one shard per
+    batch node and is mainly useful for testing a sharded setup locally.
+    """
+    with ProcessPoolExecutor(max_workers=count) as pool:
+        futures = [
+            pool.submit(fn, *args, shard=(index, count), **kwargs)
+            for index in range(count)
+        ]
+        return [future.result() for future in futures]
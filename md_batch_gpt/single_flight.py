@@ -0,0 +1,53 @@
+"""Coalescing of identical concurrent calls into one."""
+
+from __future__ import annotations
+
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, TypeVar
+import threading
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Let concurrent callers with the same key share one call.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for it and receive the same result or exception. Once
+    the call finishes the key is forgotten, so later callers run it again —
+    this is not a cache.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Return ``fn()``, or the result of an identical call already running."""
+        with self._lock:
+            self.calls += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared}
@@ -0,0 +1,189 @@
+"""Watch a docs folder and push new or modified Markdown files through a handler."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from .file_io import is_markdown_file, iter_markdown_files
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+
+def _is_visible_dir(folder: Path, path: Path) -> bool:
+    rel = path.relative_to(folder).parts
+    return not any(part.startswith(".") for part in rel)
+
+
+class InotifyWatcher:
+    """Report Markdown files written or moved into *folder* using Linux inotify."""
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, folder: Path) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self.folder = Path(folder)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, Path] = {}
+        try:
+            self._add_tree(self.folder)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, root: Path) -> List[Path]:
+        """Watch *root* and its visible subdirectories; return Markdown files inside."""
+        found: List[Path] = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            directory = Path(dirpath)
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+            self._dirs[wd] = directory
+            found.extend(directory / name for name in filenames if name.endswith(".md"))
+        return found
+
+    def poll(self, timeout: float) -> Set[Path]:
+        """Wait up to *timeout* seconds and return the paths that changed."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed: Set[Path] = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                raw_name = data[offset + _EVENT.size : offset + _EVENT.size + length]
+                offset += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost; treat every file as changed
+                    changed.update(iter_markdown_files(self.folder))
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None:
+                    continue
+                path = directory / os.fsdecode(raw_name.rstrip(b"\0"))
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and _is_visible_dir(self.folder, path):
+                        changed.update(self._add_tree(path))
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """Portable fallback that compares file sizes and mtimes every *interval*."""
+
+    def __init__(self, folder: Path, interval: float = 1.0) -> None:
+        self.folder = Path(folder)
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot = {}
+        for path in iter_markdown_files(self.folder):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def poll(self, timeout: float) -> Set[Path]:
+        time.sleep(min(timeout, self.interval))
+        current = self._scan()
+        changed = {p for p, sig in current.items() if self._snapshot.get(p) != sig}
+        self._snapshot = current
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+def open_watcher(folder: Path, interval: float = 1.0, force_polling: bool = False):
+    """Return an inotify watcher for *folder*, or a polling one if unavailable."""
+    if not force_polling:
+        try:
+            return InotifyWatcher(folder)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(folder, interval)
+
+
+def _signature(path: Path) -> Tuple[int, int, int] | None:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def watch(
+    folder: Path,
+    handle: Callable[[List[Path]], Iterable[Path]],
+    debounce: float = 1.0,
+    poll_interval: float = 1.0,
+    force_polling: bool = False,
+    stop: threading.Event | None = None,
+) -> None:
+    """Call ``handle(paths)`` for Markdown files created or modified under *folder*.
+
+    Events are collected until none arrive for *debounce* seconds, then the
+    batch is handed to *handle*. *handle* returns the files it wrote itself;
+    their next change notification is ignored unless the file changed again
+    afterwards, so rewriting a file in place does not trigger another run.
+    Runs until *stop* is set.
+    """
+    folder = Path(folder)
+    watcher = open_watcher(folder, poll_interval, force_polling)
+    own_writes: Dict[Path, Tuple[int, int, int] | None] = {}
+    pending: Set[Path] = set()
+    last_event = 0.0
+    try:
+        while stop is None or not stop.is_set():
+            timeout = min(debounce, poll_interval) if pending else poll_interval
+            changed = {p for p in watcher.poll(timeout) if is_markdown_file(folder, p)}
+            if changed:
+                pending |= changed
+                last_event = time.monotonic()
+            if not pending or time.monotonic() - last_event < debounce:
+                continue
+            batch = sorted(
+                p for p in pending if p.exists() and own_writes.get(p) != _signature(p)
+            )
+            pending.clear()
+            if batch:
+                for path in handle(batch):
+                    own_writes[Path(path)] = _signature(Path(path))
+    finally:
+        watcher.close()
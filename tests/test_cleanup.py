@@ -0,0 +1,63 @@
+from pathlib import Path
+
+from md_batch_gpt.cleanup import (
+    clean_folder,
+    heading_slug,
+    plan_renames,
+    slugify,
+    strip_wrappers,
+)
+
+
+def test_strip_wrappers():
+    assert strip_wrappers("```markdown\n# T\n\ntext\n```\n") == "# T\n\ntext\n"
+    assert strip_wrappers("'''\n# T\n") == "# T\n"
+    assert strip_wrappers("# T\ntext\n```") == "# T\ntext\n"
+    kept = "# T\n\n```python\nx = 1\n```\n"
+    assert strip_wrappers(kept) == kept
+
+
+def test_slugs():
+    assert slugify("1.2 Getting Started: Basics!") == "1-2-getting-started-basics"
+    assert slugify("Plain  -- title") == "plain-title"
+    assert heading_slug("intro\n## Sub\n# 3.1 Main\n# Other") == "3-1-main"
+    assert heading_slug("no heading") is None
+    assert heading_slug("# !!!") is None
+
+
+def test_plan_renames_detects_collisions(tmp_path: Path):
+    for name in ("a.md", "b.md", "c.md", "taken.md", "same.md"):
+        (tmp_path / name).write_text("x")
+    renames, conflicts = plan_renames(
+        [
+            (tmp_path / "a.md", "dup"),
+            (tmp_path / "b.md", "dup"),
+            (tmp_path / "c.md", "taken"),
+            (tmp_path / "same.md", "same"),
+            (tmp_path / "taken.md", None),
+        ]
+    )
+    assert renames == {}
+    assert sorted(p.name for p, _ in conflicts) == ["a.md", "b.md", "c.md"]
+
+
+def test_clean_folder_recursive(tmp_path: Path):
+    sub = tmp_path / "unit"
+    sub.mkdir()
+    (tmp_path / "x.md").write_text("```markdown\n# 1.1 Intro\n```\n")
+    (sub / "y.md").write_text("# Lesson\nbody\n")
+    (sub / "z.md").write_text("# Lesson\nother\n")
+    (tmp_path / ".hidden.md").write_text("```\n# Hidden\n```\n")
+
+    dry = clean_folder(tmp_path, workers=2, dry_run=True)
+    assert dry.renamed == {"x.md": "1-1-intro.md"}
+    assert (tmp_path / "x.md").exists()
+
+    report = clean_folder(tmp_path, workers=2)
+
+    assert report.processed == ["x.md"]
+    assert report.renamed == {"x.md": "1-1-intro.md"}
+    assert (tmp_path / "1-1-intro.md").read_text() == "# 1.1 Intro\n"
+    assert sorted(f["item"] for f in report.failures) == ["unit/y.md", "unit/z.md"]
+    assert (sub / "y.md").exists() and (sub / "z.md").exists()
+    assert (tmp_path / ".hidden.md").read_text().startswith("```")
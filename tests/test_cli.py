@@ -1,8 +1,12 @@
 import importlib
+import json
+import subprocess
 from pathlib import Path
 
 from typer.testing import CliRunner
 
+from md_batch_gpt.report import RunReport
+
 
 def import_cli():
     if "md_batch_gpt.cli" in importlib.sys.modules:
@@ -56,8 +60,10 @@ def test_run_max_tokens(monkeypatch, tmp_path: Path):
         regex_json: Path | None = None,
         dry_run: bool = False,
         verbose: bool = False,
-    ) -> None:
+        **kwargs,
+    ) -> RunReport:
         captured["max_tokens"] = max_tokens
+        return RunReport()
 
     monkeypatch.setattr(cli, "process_folder", fake_process_folder)
 
@@ -122,8 +128,10 @@ def test_run_regex_json(monkeypatch, tmp_path: Path):
         regex_json: Path | None = None,
         dry_run: bool = False,
         verbose: bool = False,
-    ) -> None:
+        **kwargs,
+    ) -> RunReport:
         captured["regex_json"] = regex_json
+        return RunReport()
 
     monkeypatch.setattr(cli, "process_folder", fake_process_folder)
 
@@ -222,6 +230,35 @@ def test_generate_images_command(monkeypatch, tmp_path: Path):
     assert all(call[1:] == ("m", "256x256") for call in calls)
 
 
+def test_generate_images_progress_json(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+
+    cli = import_cli()
+    monkeypatch.setattr(cli, "generate_image", lambda prompt, **kw: b"img")
+
+    j1 = tmp_path / "f1.json"
+    j1.write_text(
+        '[{"expected_filename": "a.png", "summary": "A"}, {"expected_filename": "b.png", "summary": "B"}]'
+    )
+    progress_file = tmp_path / "progress.jsonl"
+
+    runner = CliRunner()
+    with runner.isolated_filesystem(temp_dir=tmp_path):
+        result = runner.invoke(
+            cli.app,
+            ["generate-images", str(j1), "--progress-json", str(progress_file)],
+        )
+        assert result.exit_code == 0, result.stdout
+
+    final = json.loads(progress_file.read_text().splitlines()[-1])
+    assert final["event"] == "done"
+    assert (final["done"], final["total"], final["unit"]) == (2, 2, "images")
+
+    result = runner.invoke(cli.app, ["generate-images", str(j1), "--progress-json", "-"])
+    assert result.exit_code == 2
+    assert "stdout" in result.output
+
+
 def test_generate_images_extra_fields(monkeypatch, tmp_path: Path):
     """Extra fields in the JSON entries should be ignored."""
     monkeypatch.setenv("OPENAI_API_KEY", "dummy")
@@ -502,7 +539,7 @@ def test_docs_alias(monkeypatch, tmp_path: Path):
 
     called = {}
 
-    def fake_cmd(docs_folder: Path, model: str = "dall-e-3", size: str = "1024x1024", verbose: bool = False) -> None:
+    def fake_cmd(docs_folder: Path, model: str = "dall-e-3", size: str = "1024x1024", verbose: bool = False, **kwargs) -> None:
         called["folder"] = docs_folder
         called["model"] = model
         called["size"] = size
@@ -535,3 +572,289 @@ def test_docs_alias(monkeypatch, tmp_path: Path):
         "verbose": True,
     }
 
+
+
+def test_run_local_shards_report(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+
+    cli = import_cli()
+    monkeypatch.setattr(
+        "md_batch_gpt.orchestrator.send_prompt", lambda p, c, m, t=None: c + "!"
+    )
+
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(6):
+        (docs / f"f{i}.md").write_text(str(i))
+    report_path = tmp_path / "report.json"
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli.app,
+        [
+            "run",
+            str(docs),
+            "--prompts",
+            "tests/data/p1.txt",
+            "--local-shards",
+            "2",
+            "--report",
+            str(report_path),
+        ],
+    )
+
+    assert result.exit_code == 0, result.stdout
+    report = json.loads(report_path.read_text())
+    assert report["shards"] == ["0/2", "1/2"]
+    assert sorted(report["processed"]) == [f"f{i}.md" for i in range(6)]
+    assert all((docs / f"f{i}.md").read_text() == f"{i}!" for i in range(6))
+
+
+def test_generate_images_shard_and_merge(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+
+    cli = import_cli()
+    monkeypatch.setattr(cli, "generate_image", lambda prompt, model, size: b"img")
+
+    specs = [{"expected_filename": f"i{n}.png", "summary": str(n)} for n in range(8)]
+    spec_file = tmp_path / "specs.json"
+    spec_file.write_text(json.dumps(specs))
+
+    runner = CliRunner()
+    with runner.isolated_filesystem(temp_dir=tmp_path):
+        for i in range(2):
+            result = runner.invoke(
+                cli.app,
+                [
+                    "generate-images",
+                    str(spec_file),
+                    "--shard",
+                    f"{i}/2",
+                    "--report",
+                    f"r{i}.json",
+                ],
+            )
+            assert result.exit_code == 0, result.stdout
+        result = runner.invoke(cli.app, ["merge-reports", "r0.json", "r1.json"])
+        assert result.exit_code == 0, result.stdout
+        merged = json.loads(result.stdout)
+        assert sorted(merged["processed"]) == sorted(s["expected_filename"] for s in specs)
+        assert all(Path(s["expected_filename"]).exists() for s in specs)
+
+
+def test_run_invalid_shard(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+
+    cli = import_cli()
+    runner = CliRunner()
+    result = runner.invoke(
+        cli.app,
+        ["run", str(tmp_path), "--prompts", "tests/data/p1.txt", "--shard", "2/2"],
+    )
+    assert result.exit_code != 0
+
+
+def test_submit_and_list_jobs(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+
+    cli = import_cli()
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    queue = tmp_path / "q.sqlite3"
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli.app,
+        ["submit-run", str(docs), "--prompts", "tests/data/p1.txt", "--queue", str(queue)],
+    )
+    assert result.exit_code == 0, result.stdout
+    job_id = result.stdout.strip()
+
+    result = runner.invoke(cli.app, ["jobs", "--queue", str(queue)])
+    assert result.exit_code == 0, result.stdout
+    assert f"{job_id}\trun\tqueued" in result.stdout
+
+    result = runner.invoke(cli.app, ["jobs", job_id, "--queue", str(queue)])
+    payload = json.loads(result.stdout)["payload"]
+    assert payload["folder"] == str(docs.resolve())
+    assert payload["prompts"] == [str(Path("tests/data/p1.txt").resolve())]
+
+
+def test_run_since_last(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    cli = import_cli()
+    sent = []
+
+    def fake_send(prompt, content, model, max_tokens=None):
+        sent.append(content)
+        return content + "!"
+
+    monkeypatch.setattr("md_batch_gpt.orchestrator.send_prompt", fake_send)
+    git = lambda *args: subprocess.run(
+        ["git", "-C", str(tmp_path), "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        check=True,
+        capture_output=True,
+    )
+    (tmp_path / "a.md").write_text("A")
+    (tmp_path / "b.md").write_text("B")
+    git("init", "-q")
+    git("add", ".")
+    git("commit", "-qm", "init")
+
+    runner = CliRunner()
+    args = ["run", str(tmp_path), "--prompts", "tests/data/p1.txt", "--since", "last"]
+    assert runner.invoke(cli.app, args).exit_code == 0
+    assert sorted(sent) == ["A", "B"]
+
+    sent.clear()
+    (tmp_path / "b.md").write_text("B2")
+    (tmp_path / "c.md").write_text("C")
+    result = runner.invoke(cli.app, args)
+    assert result.exit_code == 0, result.stdout
+    assert sorted(sent) == ["B2", "C"]
+    assert (tmp_path / "a.md").read_text() == "A!"
+
+
+def test_generate_images_since_last_skips_unchanged_specs(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    cli = import_cli()
+    prompts = []
+    monkeypatch.setattr(cli, "generate_image", lambda p, **k: prompts.append(p) or b"x")
+    git = lambda *args: subprocess.run(
+        ["git", "-C", str(tmp_path), "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        check=True,
+        capture_output=True,
+    )
+    specs = tmp_path / "specs"
+    specs.mkdir()
+    for name in ("a", "b"):
+        (specs / f"{name}.json").write_text(
+            json.dumps([{"expected_filename": f"out/{name}.png", "summary": name}])
+        )
+    git("init", "-q")
+    git("add", ".")
+    git("commit", "-qm", "init")
+
+    runner = CliRunner()
+    args = ["generate-images", str(specs / "a.json"), str(specs / "b.json"), "--since", "last"]
+    with runner.isolated_filesystem(temp_dir=tmp_path):
+        assert runner.invoke(cli.app, args).exit_code == 0
+        assert sorted(prompts) == ["a", "b"]
+
+        prompts.clear()
+        (specs / "b.json").write_text(
+            json.dumps([{"expected_filename": "out/b.png", "summary": "b2"}])
+        )
+        result = runner.invoke(cli.app, args)
+        assert result.exit_code == 0, result.output
+        assert prompts == ["b2"]
+
+        # each shard keeps its own record, so shard 1 is not skipped because
+        # shard 0 already ran on the unchanged file
+        git("add", ".")
+        git("commit", "-qm", "b2")
+        prompts.clear()
+        spec = str(specs / "a.json")
+        (specs / "a.json").write_text(
+            json.dumps(
+                [{"expected_filename": f"out/{i}.png", "summary": str(i)} for i in range(8)]
+            )
+        )
+        git("commit", "-qam", "more")
+        for shard in ("0/2", "1/2"):
+            result = runner.invoke(
+                cli.app, ["generate-images", spec, "--since", "last", "--shard", shard]
+            )
+            assert result.exit_code == 0, result.output
+        assert sorted(prompts) == [str(i) for i in range(8)]
+
+
+def test_generate_images_validates_before_generating(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    cli = import_cli()
+    calls = []
+    monkeypatch.setattr(cli, "generate_image", lambda *a, **k: calls.append(a) or b"x")
+
+    entries = [{"expected_filename": f"{i}.png", "summary": str(i)} for i in range(300)]
+    entries.append({"expected_filename": "bad.png"})
+    spec = tmp_path / "spec.json"
+    spec.write_text(json.dumps(entries))
+
+    result = CliRunner().invoke(cli.app, ["generate-images", str(spec)])
+
+    assert result.exit_code != 0
+    assert "Entry 300" in result.output
+    assert calls == []
+
+    spec.write_text(json.dumps(entries[:-1]))
+    with CliRunner().isolated_filesystem(temp_dir=tmp_path):
+        result = CliRunner().invoke(cli.app, ["generate-images", str(spec)])
+        assert result.exit_code == 0, result.output
+        assert len(calls) == 300 and Path("299.png").exists()
+
+
+def test_generate_images_reports_spec_changed_during_run(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    cli = import_cli()
+    monkeypatch.setattr(cli, "generate_image", lambda *a, **k: b"x")
+    spec = tmp_path / "spec.json"
+    spec.write_text(json.dumps([{"expected_filename": "a.png", "summary": "a"}]))
+    passes = []
+
+    def changing_spec(json_file):
+        passes.append(json_file)
+        if len(passes) == 1:
+            yield {"expected_filename": "a.png", "summary": "a"}
+        else:
+            raise ValueError(f"Entry 0 in {json_file} missing expected_filename or summary")
+            yield
+
+    monkeypatch.setattr(cli, "iter_spec_file", changing_spec)
+    with CliRunner().isolated_filesystem(temp_dir=tmp_path):
+        result = CliRunner().invoke(cli.app, ["generate-images", str(spec)])
+
+    assert result.exit_code == 2
+    assert "Entry 0" in result.output
+    assert not isinstance(result.exception, ValueError)
+
+
+def test_hedge_max_rate_applies_to_configured_percentile(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    cli = import_cli()
+    monkeypatch.setattr(cli, "HEDGE_PERCENTILE", 90.0)
+    (tmp_path / "a.md").write_text("A")
+
+    result = CliRunner().invoke(
+        cli.app,
+        [
+            "--hedge-max-rate",
+            "0.5",
+            "run",
+            str(tmp_path),
+            "--dry-run",
+            "--prompts",
+            "tests/data/p1.txt",
+        ],
+    )
+
+    oc = importlib.import_module("md_batch_gpt.openai_client")
+    try:
+        assert result.exit_code == 0, result.stdout
+        assert (oc._hedger.percentile, oc._hedger.max_rate) == (90.0, 0.5)
+    finally:
+        oc.set_hedging(None)
+
+
+def test_invalid_http_config_is_a_clean_cli_error(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    monkeypatch.setattr("md_batch_gpt.config.HTTP_CONFIG", {"http2": "yes"})
+    importlib.sys.modules.pop("md_batch_gpt.openai_client", None)
+    cli = import_cli()
+
+    result = CliRunner().invoke(
+        cli.app, ["run", str(tmp_path), "--dry-run", "--prompts", "tests/data/p1.txt"]
+    )
+
+    assert result.exit_code == 2
+    assert "Invalid connection settings" in result.output
+    assert not isinstance(result.exception, ValueError)
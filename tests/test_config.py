@@ -34,3 +34,49 @@ def test_missing_api_key(monkeypatch):
         env_file.unlink()
     with pytest.raises(RuntimeError):
         import_config()
+
+
+def test_api_key_pool_from_env(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setenv(
+        "OPENAI_API_KEYS", "sk-one, sk-two@https://proxy.example/v1*3"
+    )
+    try:
+        config = import_config()
+        assert config.OPENAI_API_KEY == "sk-one"
+        assert config.OPENAI_API_KEYS == [
+            config.ApiKeySpec("sk-one", None, 1),
+            config.ApiKeySpec("sk-two", "https://proxy.example/v1", 3),
+        ]
+    finally:
+        # Don't leak the key pool into modules imported by later tests
+        del importlib.sys.modules["md_batch_gpt.config"]
+
+
+def test_fallbacks_accept_a_name_or_a_list(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    config = import_config()
+    assert config._parse_fallbacks({"o3": "gpt-4o", "gpt-4o": ["a", "b"]}) == {
+        "o3": ["gpt-4o"],
+        "gpt-4o": ["a", "b"],
+    }
+
+
+@pytest.mark.parametrize("table", [{"o3": 4}, {"o3": ["gpt-4o", 1]}, {"o3": {"m": "x"}}, ["o3"]])
+def test_fallbacks_reject_other_values(monkeypatch, table):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    config = import_config()
+    with pytest.raises(ValueError, match=r"\[tool.md_batch_gpt.fallbacks\]"):
+        config._parse_fallbacks(table)
+
+
+def test_key_pool_settings_are_validated(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    config = import_config()
+    assert config._key_selection("least-loaded") == "least-loaded"
+    assert config._key_failure_threshold(3) == 3
+    with pytest.raises(ValueError, match="key_selection"):
+        config._key_selection("random")
+    for value in ("5", 0, 2.5, True):
+        with pytest.raises(ValueError, match="key_failure_threshold"):
+            config._key_failure_threshold(value)
@@ -0,0 +1,25 @@
+import pytest
+
+from md_batch_gpt.edits import EditError, apply_edits, parse_edits
+
+
+def test_parse_and_apply_edits():
+    response = '```json\n[{"find": "teh cat", "replace": "the cat"}, {"find": "dgo", "replace": "dog"}]\n```'
+    assert apply_edits("teh cat and the dgo", parse_edits(response)) == "the cat and the dog"
+    assert apply_edits("unchanged", parse_edits("[]")) == "unchanged"
+
+
+@pytest.mark.parametrize(
+    "response",
+    [None, "not json", '{"find": "a"}', '[{"find": "", "replace": "x"}]', '[{"find": "a"}]'],
+)
+def test_parse_edits_rejects_malformed(response):
+    with pytest.raises(EditError):
+        parse_edits(response)
+
+
+def test_apply_edits_requires_unique_match():
+    with pytest.raises(EditError):
+        apply_edits("a a", [{"find": "a", "replace": "b"}])
+    with pytest.raises(EditError):
+        apply_edits("abc", [{"find": "zzz", "replace": "b"}])
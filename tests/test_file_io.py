@@ -1,6 +1,19 @@
 from pathlib import Path
+import os
 
-from md_batch_gpt.file_io import iter_markdown_files, write_atomic
+import pytest
+
+from md_batch_gpt import file_io
+from md_batch_gpt.file_io import (
+    AtomicBatchWriter,
+    PartialWriteError,
+    iter_markdown_files,
+    link_or_copy,
+    mirror_tree,
+    write_atomic,
+    write_atomic_batch,
+    write_atomic_bytes,
+)
 
 
 def test_iter_markdown_files(tmp_path: Path):
@@ -34,3 +47,94 @@ def test_write_atomic_creates_parents(tmp_path: Path):
     write_atomic(nested_target, "content")
     assert nested_target.read_text() == "content"
     assert (tmp_path / "subdir" / "nested").is_dir()
+
+
+def test_write_atomic_bytes(tmp_path: Path):
+    target = tmp_path / "img" / "a.png"
+    write_atomic_bytes(target, b"\x89PNG\x00")
+    assert target.read_bytes() == b"\x89PNG\x00"
+    assert list(target.parent.iterdir()) == [target]
+
+
+def test_write_atomic_batch_fsyncs_each_dir_once(monkeypatch, tmp_path: Path):
+    synced_dirs = []
+    monkeypatch.setattr(file_io, "_fsync_dir", synced_dirs.append)
+
+    items = [(tmp_path / "a" / f"{i}.md", f"text {i}") for i in range(3)]
+    items.append((tmp_path / "b" / "x.md", "x"))
+    written = write_atomic_batch(items, durability="dir")
+
+    assert written == [path for path, _ in items]
+    assert all(path.read_text() == data for path, data in items)
+    assert synced_dirs == [tmp_path / "a", tmp_path / "b"]
+
+
+def test_write_atomic_batch_reports_partial_writes(monkeypatch, tmp_path: Path):
+    real_replace = os.replace
+
+    def replace(src, dst):
+        if Path(dst).name == "b.md":
+            raise PermissionError("denied")
+        real_replace(src, dst)
+
+    monkeypatch.setattr(file_io.os, "replace", replace)
+    items = [(tmp_path / f"{name}.md", name) for name in ("a", "b", "c")]
+
+    with pytest.raises(PartialWriteError) as info:
+        write_atomic_batch(items)
+
+    assert info.value.written == [tmp_path / "a.md"]
+    assert isinstance(info.value.__cause__, PermissionError)
+    assert [p.name for p in tmp_path.iterdir()] == ["a.md"]
+
+
+def test_atomic_batch_writer_aborts_on_error(tmp_path: Path):
+    existing = tmp_path / "keep.md"
+    existing.write_text("original")
+
+    with pytest.raises(RuntimeError):
+        with AtomicBatchWriter() as batch:
+            batch.stage(existing, "replaced")
+            batch.stage(tmp_path / "new.md", "new")
+            raise RuntimeError("stop")
+
+    assert existing.read_text() == "original"
+    assert list(tmp_path.iterdir()) == [existing]
+
+
+def test_atomic_batch_writer_rejects_unknown_durability():
+    with pytest.raises(ValueError):
+        AtomicBatchWriter("paranoid")
+
+
+def test_mirror_tree_links_missing_files(tmp_path: Path):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "a.md").write_text("A")
+    (src / "sub" / "img.png").write_bytes(b"png")
+    (src / ".git").mkdir()
+    (src / ".git" / "HEAD").write_text("ref")
+    out = tmp_path / "out"
+    (out).mkdir()
+    (out / "a.md").write_text("earlier result")
+
+    assert mirror_tree(src, out) == 1
+    assert (out / "a.md").read_text() == "earlier result"
+    assert os.path.samefile(src / "sub" / "img.png", out / "sub" / "img.png")
+    assert not (out / ".git").exists()
+
+    assert link_or_copy(src / "a.md", out / "a.md", replace=True)
+    assert os.path.samefile(src / "a.md", out / "a.md")
+    write_atomic(out / "a.md", "new")
+    assert (src / "a.md").read_text() == "A"
+
+
+def test_atomic_writes_keep_normal_file_modes(tmp_path: Path):
+    image = tmp_path / "a.png"
+    write_atomic_bytes(image, b"png")
+    assert image.stat().st_mode & 0o777 == file_io.NEW_FILE_MODE
+    assert image.stat().st_mode & 0o777 != 0o600
+
+    os.chmod(image, 0o640)
+    write_atomic_bytes(image, b"png2")
+    assert image.stat().st_mode & 0o777 == 0o640
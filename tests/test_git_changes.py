@@ -0,0 +1,76 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from md_batch_gpt.file_io import is_markdown_file
+from md_batch_gpt.git_changes import (
+    GitError,
+    changed_files,
+    head_commit,
+    remember,
+    select_since,
+)
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+
+
+def git(repo: Path, *args: str) -> None:
+    subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        check=True,
+        capture_output=True,
+    )
+
+
+def make_repo(tmp_path: Path) -> Path:
+    repo = tmp_path / "repo"
+    docs = repo / "docs"
+    (docs / "sub").mkdir(parents=True)
+    (docs / "a.md").write_text("A")
+    (docs / "sub" / "b.md").write_text("B")
+    (repo / "outside.md").write_text("O")
+    git(repo, "init", "-q")
+    git(repo, "add", ".")
+    git(repo, "commit", "-qm", "init")
+    return docs
+
+
+def test_changed_files_since_ref(tmp_path: Path):
+    docs = make_repo(tmp_path)
+    base = head_commit(docs)
+    (docs / "a.md").write_text("A2")
+    (docs / "new.md").write_text("N")
+    (docs / ".hidden.md").write_text("H")
+    (docs.parent / "outside.md").write_text("O2")
+
+    changed = changed_files(docs, base)
+    assert changed == [docs / ".hidden.md", docs / "a.md", docs / "new.md"]
+
+    files, kept = select_since(docs, base, "run", lambda p: is_markdown_file(docs, p))
+    assert files == [docs / "a.md", docs / "new.md"] and kept == {}
+
+    with pytest.raises(GitError):
+        changed_files(docs, "no-such-ref")
+
+
+def test_select_since_last_skips_own_writes(tmp_path: Path):
+    docs = make_repo(tmp_path)
+    accept = lambda p: is_markdown_file(docs, p)
+
+    assert select_since(docs, "last", "run", accept) == (None, {})
+
+    # a run rewrote a.md and was recorded at the current commit
+    (docs / "a.md").write_text("A processed")
+    remember(docs, "run", head_commit(docs), ["a.md"])
+    (docs / "sub" / "b.md").write_text("B edited")
+
+    files, kept = select_since(docs, "last", "run", accept)
+    assert files == [docs / "sub" / "b.md"]
+    assert list(kept) == ["a.md"]
+
+    (docs / "a.md").write_text("A edited again")
+    files, _ = select_since(docs, "last", "run", accept)
+    assert files == [docs / "a.md", docs / "sub" / "b.md"]
+    assert select_since(docs, "last", "docs", accept) == (None, {})
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from md_batch_gpt.hedging import Hedger
+
+
+def warm(hedger, kind="chat", seconds=0.01, count=20):
+    for _ in range(count):
+        hedger.observe(kind, seconds)
+        hedger.calls += 1
+
+
+def test_no_hedge_until_enough_samples():
+    hedger = Hedger(percentile=50, max_rate=1, min_samples=5)
+    assert hedger.threshold("chat") is None
+    assert hedger.call("chat", lambda: "ok") == "ok"
+    assert hedger.stats()["hedges"] == 0
+
+
+def test_slow_call_is_hedged_and_hedge_wins():
+    hedger = Hedger(percentile=90, max_rate=1)
+    warm(hedger)
+    calls = []
+    discarded = []
+    release = threading.Event()
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            return "slow"
+        return "fast"
+
+    outcomes = []
+    assert hedger.call("chat", fn, on_discard=discarded.append, on_hedge=outcomes.append) == "fast"
+    assert outcomes == [True]
+    assert hedger.stats()["hedges_won"] == 1
+    release.set()
+    deadline = time.time() + 5
+    while not discarded and time.time() < deadline:
+        time.sleep(0.01)
+    assert discarded == ["slow"]
+
+
+def test_hedge_rate_is_capped():
+    hedger = Hedger(percentile=50, max_rate=0.05)
+    warm(hedger, seconds=0.001, count=20)
+    started = []
+
+    def fn():
+        started.append(1)
+        time.sleep(0.05)
+        return "ok"
+
+    for _ in range(3):
+        hedger.call("chat", fn)
+    # 23 calls at 5% allow one hedge
+    assert hedger.stats()["hedges"] == 1
+    assert len(started) == 4
+
+
+def test_failed_primary_falls_back_to_hedge_result():
+    hedger = Hedger(percentile=50, max_rate=1)
+    warm(hedger, seconds=0.001)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.05)
+            raise RuntimeError("primary failed")
+        time.sleep(0.1)
+        return "hedge"
+
+    assert hedger.call("chat", fn) == "hedge"
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        Hedger(percentile=100)
+    with pytest.raises(ValueError):
+        Hedger(max_rate=2)
@@ -0,0 +1,42 @@
+import importlib.util
+
+import pytest
+
+from md_batch_gpt.http_client import HttpSettings, build_client
+
+
+def test_settings_from_config():
+    settings = HttpSettings.from_config(
+        {"max_connections": 20, "keepalive_expiry": 30, "read_timeout": 120, "http2": True}
+    )
+    assert settings == HttpSettings(
+        max_connections=20, keepalive_expiry=30.0, read_timeout=120.0, http2=True
+    )
+    assert HttpSettings.from_config({}).is_default()
+
+    with pytest.raises(ValueError, match="Unknown"):
+        HttpSettings.from_config({"max_conections": 20})
+    with pytest.raises(ValueError, match="whole number"):
+        HttpSettings.from_config({"max_keepalive": 2.5})
+    with pytest.raises(ValueError, match="positive"):
+        HttpSettings.from_config({"connect_timeout": "5"})
+    with pytest.raises(ValueError, match="http2"):
+        HttpSettings.from_config({"http2": "false"})
+
+
+def test_limits_and_timeouts_fill_in_defaults():
+    settings = HttpSettings(max_connections=8).merged(read_timeout=60, max_keepalive=None)
+    limits, timeout = settings.limits(), settings.timeout()
+    assert (limits.max_connections, limits.max_keepalive_connections) == (8, 100)
+    assert limits.keepalive_expiry == 5.0
+    assert (timeout.connect, timeout.read, timeout.pool) == (5.0, 60, 60)
+
+    client = build_client(settings)
+    assert client.timeout.read == 60
+    client.close()
+
+
+@pytest.mark.skipif(importlib.util.find_spec("h2") is not None, reason="h2 installed")
+def test_http2_requires_h2():
+    with pytest.raises(RuntimeError, match="h2"):
+        build_client(HttpSettings(http2=True))
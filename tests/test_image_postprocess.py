@@ -0,0 +1,105 @@
+import importlib
+import io
+from concurrent.futures import Future
+from pathlib import Path
+
+import pytest
+
+from md_batch_gpt.report import RunReport
+
+
+def import_images(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    importlib.sys.modules.pop("md_batch_gpt.images", None)
+    return importlib.import_module("md_batch_gpt.images")
+
+
+def png_bytes(size=(64, 32)):
+    Image = pytest.importorskip("PIL.Image")
+    buf = io.BytesIO()
+    img = Image.new("RGBA", size, (200, 10, 10, 128))
+    img.save(buf, format="PNG", pnginfo=None)
+    return buf.getvalue()
+
+
+def test_postprocess_converts_by_extension_and_writes_thumbnails(tmp_path: Path):
+    Image = pytest.importorskip("PIL.Image")
+    from md_batch_gpt.image_postprocess import PostProcessOptions, postprocess_image
+
+    target = tmp_path / "out" / "hero.jpg"
+    stats = postprocess_image(
+        png_bytes(), target, PostProcessOptions(thumbnails=(16, 200))
+    )
+
+    with Image.open(target) as img:
+        assert img.format == "JPEG" and img.mode == "RGB"
+    with Image.open(tmp_path / "out" / "hero-16w.jpg") as thumb:
+        assert thumb.size == (16, 8)
+    # Never upscale
+    assert not (tmp_path / "out" / "hero-200w.jpg").exists()
+    assert stats["variants"] == 1
+    assert stats["bytes_out"] == target.stat().st_size
+
+
+def test_postprocess_strips_exif(tmp_path: Path):
+    Image = pytest.importorskip("PIL.Image")
+    from md_batch_gpt.image_postprocess import PostProcessOptions, postprocess_image
+
+    exif = Image.Exif()
+    exif[0x010E] = "secret description"
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buf, format="JPEG", exif=exif)
+
+    postprocess_image(buf.getvalue(), tmp_path / "a.webp")
+    postprocess_image(
+        buf.getvalue(), tmp_path / "b.webp", PostProcessOptions(strip_metadata=False)
+    )
+    with Image.open(tmp_path / "a.webp") as img:
+        assert not img.info.get("exif")
+    with Image.open(tmp_path / "b.webp") as img:
+        assert img.info.get("exif")
+
+
+def test_postprocess_rejects_unknown_extension(tmp_path: Path):
+    pytest.importorskip("PIL")
+    from md_batch_gpt.image_postprocess import postprocess_image
+
+    with pytest.raises(ValueError):
+        postprocess_image(png_bytes(), tmp_path / "image.unknown")
+
+
+def test_write_image_entries_hands_images_to_postprocessor(monkeypatch):
+    images = import_images(monkeypatch)
+    submitted = []
+
+    class FakePostProcessor:
+        def submit(self, data, path):
+            submitted.append((data, path))
+            future = Future()
+            if path == "bad.webp":
+                future.set_exception(ValueError("cannot decode"))
+            else:
+                future.set_result(
+                    {"bytes_in": 100, "bytes_out": 40, "variant_bytes": 5, "cpu_ms": 3}
+                )
+            return future
+
+    report = RunReport()
+    images.write_image_entries(
+        [
+            {"expected_filename": "a.webp", "summary": "A"},
+            {"expected_filename": "bad.webp", "summary": "B"},
+        ],
+        "m",
+        "256x256",
+        report,
+        keep_going=True,
+        generate=lambda prompt, **kw: prompt.encode(),
+        postprocessor=FakePostProcessor(),
+    )
+
+    assert submitted == [(b"A", "a.webp"), (b"B", "bad.webp")]
+    assert report.processed == ["a.webp"]
+    assert [f["item"] for f in report.failures] == ["bad.webp"]
+    assert report.usage["postprocess_bytes_in"] == 100
+    assert report.usage["postprocess_bytes_out"] == 40
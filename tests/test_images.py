@@ -0,0 +1,59 @@
+import importlib
+
+import pytest
+
+from md_batch_gpt.report import RunReport
+
+
+def import_images(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    importlib.sys.modules.pop("md_batch_gpt.images", None)
+    return importlib.import_module("md_batch_gpt.images")
+
+
+def test_image_outputs_for_variants(monkeypatch):
+    images = import_images(monkeypatch)
+
+    assert images.image_outputs({"expected_filename": "img/foo.png"}) == ["img/foo.png"]
+    assert images.image_outputs({"expected_filename": "img/foo.png", "variants": 2}) == [
+        "img/foo-1.png",
+        "img/foo-2.png",
+    ]
+    assert images.image_outputs(
+        {"expected_filename": "img/foo.png", "variants": ["a.png", "b.png"]}
+    ) == ["img/a.png", "img/b.png"]
+    for bad in (0, True, [], [""], "two"):
+        with pytest.raises(ValueError):
+            images.image_outputs({"expected_filename": "foo.png", "variants": bad})
+
+
+def test_variants_and_same_prompts_share_requests(monkeypatch, tmp_path):
+    images = import_images(monkeypatch)
+    calls = []
+
+    def generate_many(prompt, model, size, n):
+        calls.append((prompt, n))
+        return [f"{prompt}{i}".encode() for i in range(n)]
+
+    def generate(prompt, model, size):
+        calls.append((prompt, 1))
+        return prompt.encode()
+
+    entries = [
+        {"expected_filename": str(tmp_path / "a.png"), "summary": "A", "variants": 3},
+        {"expected_filename": str(tmp_path / "b.png"), "summary": "B"},
+        {"expected_filename": str(tmp_path / "c.png"), "summary": "A"},
+    ]
+    monkeypatch.setattr(images, "max_images_per_request", lambda model: 2)
+    report = RunReport()
+    images.write_image_entries(
+        entries, "m", "s", report, generate=generate, generate_many=generate_many
+    )
+
+    assert calls == [("A", 2), ("A", 2), ("B", 1)]
+    assert images.check_entries(entries, lambda entry: True) == 5
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "a-1.png", "a-2.png", "a-3.png", "b.png", "c.png",
+    ]
+    assert (tmp_path / "c.png").read_bytes() == b"A1"
+    assert len(report.processed) == 5
@@ -0,0 +1,133 @@
+import importlib
+import json
+import threading
+import time
+from pathlib import Path
+
+
+def import_jobs():
+    for name in ["md_batch_gpt.jobs", "md_batch_gpt.images", "md_batch_gpt.orchestrator"]:
+        importlib.sys.modules.pop(name, None)
+    return importlib.import_module("md_batch_gpt.jobs")
+
+
+def test_job_queue_lifecycle(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    jobs = import_jobs()
+    queue = jobs.JobQueue(tmp_path / "q.sqlite3")
+
+    first = queue.submit("run", {"folder": "a"})
+    second = queue.submit("docs", {"folder": "b"})
+
+    job = queue.claim()
+    assert (job.id, job.status, job.payload) == (first, "running", {"folder": "a"})
+    queue.finish(first, {"processed": ["x.md"]})
+    assert queue.get(first).result == {"processed": ["x.md"]}
+
+    assert queue.claim("w1").id == second
+    # A live worker keeps its lease; one that stopped renewing it loses the job
+    queue.heartbeat("w1", [second])
+    assert queue.requeue_expired(lease=60) == 0
+    assert queue.requeue_expired(lease=0) == 1
+    job = queue.claim("w2")
+    assert (job.id, job.worker) == (second, "w2")
+    # the worker that lost the lease can no longer record an outcome
+    queue.finish(second, {}, worker="w1")
+    assert queue.get(second).status == "running"
+    queue.fail(second, "boom", worker="w2")
+    assert [j.status for j in queue.list()] == ["done", "failed"]
+    assert queue.claim() is None
+    assert queue.pending() == 0
+
+
+def test_serve_runs_jobs_until_idle(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    jobs = import_jobs()
+    monkeypatch.setattr(
+        "md_batch_gpt.orchestrator.send_prompt", lambda p, c, m, t=None: c + "!"
+    )
+    monkeypatch.setattr(
+        "md_batch_gpt.images.generate_image", lambda prompt, model, size: prompt.encode()
+    )
+
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.md").write_text("A")
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("p")
+    spec = tmp_path / "spec.json"
+    spec.write_text(json.dumps([{"expected_filename": "out.png", "summary": "S"}]))
+
+    queue = jobs.JobQueue(tmp_path / "q.sqlite3")
+    run_id = queue.submit("run", {"folder": str(docs), "prompts": [str(prompt)]})
+    img_id = queue.submit(
+        "images", {"json_files": [str(spec)], "cwd": str(tmp_path)}
+    )
+    bad_id = queue.submit("run", {"folder": str(docs)})
+
+    try:
+        jobs.serve(queue, workers=2, max_requests=1, poll_interval=0.01, until_idle=True)
+    finally:
+        jobs.set_request_limit(None)
+
+    assert (docs / "a.md").read_text() == "A!"
+    assert (tmp_path / "out.png").read_bytes() == b"S"
+    assert queue.get(run_id).result["processed"] == ["a.md"]
+    assert queue.get(img_id).status == "done"
+    assert queue.get(bad_id).status == "failed"
+    assert "KeyError" in queue.get(bad_id).error
+
+
+def test_serve_leaves_jobs_of_live_workers_alone(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    jobs = import_jobs()
+    queue = jobs.JobQueue(tmp_path / "q.sqlite3")
+    live = queue.submit("run", {"folder": "a"})
+    queue.claim("other")
+    queue.heartbeat("other", [live])
+    stale = queue.submit("run", {"folder": "b"})
+    queue.claim("gone")
+    queue._conn.execute(
+        "UPDATE jobs SET started_at = 0, heartbeat_at = 0 WHERE id = ?", (stale,)
+    )
+    ran = []
+    monkeypatch.setattr(jobs, "run_job", lambda job: ran.append(job.id) or {})
+
+    # returns once it has nothing to claim, without waiting for "other"
+    started = time.monotonic()
+    jobs.serve(queue, workers=1, poll_interval=0.01, until_idle=True)
+
+    assert time.monotonic() - started < 5
+    assert ran == [stale]
+    job = queue.get(live)
+    assert (job.status, job.worker) == ("running", "other")
+
+
+def test_concurrent_jobs_report_their_own_usage(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    jobs = import_jobs()
+    oc = importlib.import_module("md_batch_gpt.openai_client")
+    barrier = threading.Barrier(2, timeout=5)
+
+    def send_prompt(prompt, text, model, max_tokens=None):
+        barrier.wait()
+        calls = int(prompt.strip())
+        for _ in range(calls):
+            oc._record_usage(requests=1)
+        barrier.wait()
+        return text
+
+    monkeypatch.setattr("md_batch_gpt.orchestrator.send_prompt", send_prompt)
+    queue = jobs.JobQueue(tmp_path / "q.sqlite3")
+    ids = []
+    for calls in (1, 5):
+        folder = tmp_path / f"docs{calls}"
+        folder.mkdir()
+        (folder / "a.md").write_text("A")
+        prompt = tmp_path / f"p{calls}.txt"
+        prompt.write_text(str(calls))
+        ids.append(queue.submit("run", {"folder": str(folder), "prompts": [str(prompt)]}))
+
+    jobs.serve(queue, workers=2, poll_interval=0.01, until_idle=True)
+
+    assert [queue.get(i).result["usage"]["requests"] for i in ids] == [1, 5]
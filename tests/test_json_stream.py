@@ -0,0 +1,62 @@
+import io
+import json
+
+import pytest
+
+from md_batch_gpt.json_stream import NotAnArray, iter_json_array
+
+
+def test_iter_json_array_small_chunks():
+    items = [
+        {"expected_filename": "a.png", "summary": "café \\"},
+        [1, -2.5e10, 12345678901234567890, True, None],
+        "\U0001f600",
+        0.000125,
+    ]
+    text = json.dumps(items, indent=1)
+    for chunk_size in (1, 2, 3, 7, 1000):
+        assert list(iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == items
+    assert list(iter_json_array(io.StringIO(" [ ] \n"))) == []
+
+
+def test_iter_json_array_yields_before_reading_everything():
+    handle = io.StringIO('[{"a": 1}, {"b": 2}, ' + " " * 10_000 + "]")
+    items = iter_json_array(handle, chunk_size=16)
+    assert next(items) == {"a": 1}
+    assert handle.tell() < 100
+
+
+@pytest.mark.parametrize(
+    "text", ["", "[1,]", "[1 2]", '[{"a": 1}', "[1] x", "[,1]", '["abc', "[tru]"]
+)
+def test_iter_json_array_rejects_malformed_json(text):
+    for chunk_size in (1, 3, 100):
+        with pytest.raises(json.JSONDecodeError):
+            list(iter_json_array(io.StringIO(text), chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize("allow_single", [False, True])
+def test_iter_json_array_error_positions_are_absolute(allow_single):
+    text = '\n [\n  {"a": 1},\n  {"b": 2},\n  {"c": 3 x}\n]'
+    if allow_single:
+        text = '\n {\n  "a": 1,\n  "b": 2,\n  "c": 3 x\n}'
+    try:
+        json.loads(text)
+    except json.JSONDecodeError as exc:
+        expected = (exc.pos, exc.lineno, exc.colno)
+    for chunk_size in (1, 4, 1000):
+        with pytest.raises(json.JSONDecodeError) as info:
+            list(
+                iter_json_array(
+                    io.StringIO(text), allow_single=allow_single, chunk_size=chunk_size
+                )
+            )
+        exc = info.value
+        assert (exc.pos, exc.lineno, exc.colno) == expected
+        assert f"line {exc.lineno} column {exc.colno} (char {exc.pos})" in str(exc)
+
+
+def test_iter_json_array_single_value():
+    with pytest.raises(NotAnArray):
+        list(iter_json_array(io.StringIO('{"a": 1}')))
+    assert list(iter_json_array(io.StringIO(' {"a": 1}'), allow_single=True)) == [{"a": 1}]
@@ -0,0 +1,65 @@
+from collections import Counter
+
+import pytest
+
+from md_batch_gpt.key_pool import KeyPool, PooledKey
+
+
+def make_pool(weights, **kwargs):
+    return KeyPool(
+        [PooledKey(f"k{i}", object(), w) for i, w in enumerate(weights)], **kwargs
+    )
+
+
+def test_weighted_round_robin():
+    pool = make_pool([1, 2, 1])
+    picks = []
+    for _ in range(8):
+        member = pool.acquire()
+        picks.append(member.label)
+        pool.release(member)
+    assert Counter(picks) == {"k0": 2, "k1": 4, "k2": 2}
+
+
+def test_least_loaded():
+    pool = make_pool([1, 1], strategy="least-loaded")
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second
+    pool.release(first)
+    assert pool.acquire() is first
+
+
+def test_persistent_failures_disable_key():
+    pool = make_pool([1, 1], failure_threshold=2)
+    bad = pool.members[0]
+    for _ in range(2):
+        bad.in_flight += 1
+        pool.release(bad, 429)
+    assert bad.disabled
+    good = pool.members[1]
+    for _ in range(3):
+        assert pool.acquire() is good
+        pool.release(good)
+    # The last remaining key is never removed
+    for _ in range(5):
+        assert pool.acquire() is good
+        pool.release(good, 401)
+    assert not good.disabled
+    assert good.in_flight == 0
+
+
+def test_success_resets_failure_streak():
+    pool = make_pool([1, 1], failure_threshold=2)
+    member = pool.members[0]
+    member.in_flight = 3
+    pool.release(member, 429)
+    pool.release(member)
+    pool.release(member, 429)
+    assert not member.disabled
+    assert pool.stats()[0]["failures"] == {429: 2}
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        make_pool([1], strategy="random")
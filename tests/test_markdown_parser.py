@@ -14,3 +14,39 @@ Outro"""
     )
     entries = parse_markdown_image_entries(tmp_path)
     assert entries == [{"expected_filename": "img.png", "summary": "desc", "alt_text": "alt"}]
+
+
+def test_find_json_block_matches_regex():
+    from md_batch_gpt.markdown_parser import JSON_BLOCK_RE, find_json_block
+
+    samples = [
+        "no fence",
+        "```json\n[1]\n```",
+        "text\n```\n{}\n```\nmore ```json\n[2]```",
+        "```python\nx\n```\n```json\n[3]\n```",
+        "````\n[4]\n```",
+        "```jsonx\n```json\n[5]```",
+        "```json\nunterminated",
+        "``` json\n```",
+    ]
+    for text in samples:
+        match = JSON_BLOCK_RE.search(text)
+        assert find_json_block(text) == (match.group(1) if match else None), text
+
+
+def test_front_matter_read_in_small_chunks(tmp_path: Path, monkeypatch):
+    from md_batch_gpt import markdown_parser
+
+    monkeypatch.setattr(markdown_parser, "READ_CHUNK", 4)
+    (tmp_path / "a.md").write_text(
+        "\n\n  ---\nexpected_filename: a.png\nsummary: A\n---\n" + "body\n" * 100
+    )
+    (tmp_path / "b.md").write_text(
+        "---\n- not a mapping\n---\n```json\n"
+        '{"expected_filename": "b.png", "summary": "B"}\n```\n'
+    )
+    entries = parse_markdown_image_entries(tmp_path)
+    assert entries == [
+        {"expected_filename": "a.png", "summary": "A"},
+        {"expected_filename": "b.png", "summary": "B"},
+    ]
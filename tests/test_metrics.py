@@ -0,0 +1,85 @@
+import importlib
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from md_batch_gpt import metrics
+from md_batch_gpt.file_io import write_atomic
+
+
+def test_counter_and_histogram_render():
+    registry = metrics.Registry()
+    calls = registry.counter("calls_total", "Calls", ["kind"])
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    calls.inc(kind="chat")
+    calls.inc(2, kind='say "hi"')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(3)
+
+    text = registry.render()
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{kind="chat"} 1' in text
+    assert 'calls_total{kind="say \\"hi\\""} 2' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_sum 3.55" in text
+    assert "latency_seconds_count 3" in text
+
+    with pytest.raises(ValueError):
+        calls.inc(model="m")
+
+
+def test_http_endpoint_and_textfile(tmp_path: Path):
+    registry = metrics.Registry()
+    registry.counter("jobs_total", "Jobs").inc(5)
+
+    server = metrics.serve_http(0, registry=registry)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as resp:
+            assert resp.headers["Content-Type"] == metrics.CONTENT_TYPE
+            assert "jobs_total 5" in resp.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    out = tmp_path / "mdgpt.prom"
+    stop = metrics.start_textfile_writer(out, interval=60, registry=registry)
+    stop()
+    assert "jobs_total 5" in out.read_text()
+    assert out.stat().st_mode & 0o777 == 0o644
+
+
+def test_write_and_chat_requests_are_instrumented(monkeypatch, tmp_path: Path):
+    before = metrics.BYTES_WRITTEN.value()
+    write_atomic(tmp_path / "a.md", "hello")
+    assert metrics.BYTES_WRITTEN.value() - before == 5
+
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    importlib.sys.modules.pop("md_batch_gpt.openai_client", None)
+    oc = importlib.import_module("md_batch_gpt.openai_client")
+
+    class Usage:
+        prompt_tokens = 7
+        completion_tokens = 3
+
+    class Resp:
+        choices = [type("Choice", (), {"message": type("M", (), {"content": "ok"})})]
+        usage = Usage()
+
+    monkeypatch.setattr(oc._client.chat.completions, "create", lambda **kw: Resp())
+    ok_before = metrics.REQUESTS.value(kind="chat", status="ok")
+    seen_before = metrics.REQUEST_SECONDS.count(kind="chat")
+    prompt_before = metrics.TOKENS.value(type="prompt")
+
+    assert oc.send_prompt("p", "c", "m", None) == "ok"
+
+    assert metrics.REQUESTS.value(kind="chat", status="ok") == ok_before + 1
+    assert metrics.REQUEST_SECONDS.count(kind="chat") == seen_before + 1
+    assert metrics.TOKENS.value(type="prompt") == prompt_before + 7
@@ -1,5 +1,10 @@
 import importlib
 import base64
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
 
 
 def import_oc():
@@ -32,3 +37,202 @@ def test_generate_image(monkeypatch):
     assert captured_kwargs["prompt"] == "a prompt"
     assert captured_kwargs["model"] == "m"
     assert "response_format" not in captured_kwargs
+
+
+def test_requests_spread_over_key_pool(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    monkeypatch.setenv("OPENAI_API_KEYS", "key-a,key-b")
+    importlib.sys.modules.pop("md_batch_gpt.config", None)
+    oc = import_oc()
+
+    used = []
+
+    class Message:
+        content = "ok"
+
+    class Choice:
+        message = Message()
+
+    class Resp:
+        choices = [Choice()]
+        usage = None
+
+    for member in oc._pool.members:
+        monkeypatch.setattr(
+            member.client.chat.completions,
+            "create",
+            lambda label=member.label, **kw: used.append(label) or Resp(),
+        )
+
+    for _ in range(4):
+        assert oc.send_prompt("p", "c", "m", None) == "ok"
+
+    assert sorted(used) == ["...ey-a", "...ey-a", "...ey-b", "...ey-b"]
+    assert [s["requests"] for s in oc._pool.stats()] == [2, 2]
+
+    importlib.sys.modules.pop("md_batch_gpt.config", None)
+    importlib.sys.modules.pop("md_batch_gpt.openai_client", None)
+
+
+def test_send_prompt_falls_back_when_overloaded(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    oc = import_oc()
+
+    tried = []
+
+    def fake_chat_request(messages, model, temperature, max_tokens=None):
+        tried.append(model)
+        if model == "primary":
+            response = type("Resp", (), {"status_code": 503, "headers": {}, "request": None})()
+            raise oc.openai.APIStatusError("busy", response=response, body=None)
+        return f"from {model}"
+
+    monkeypatch.setattr(oc, "_chat_request", fake_chat_request)
+    monkeypatch.setattr(oc, "FALLBACK_MODELS", {"primary": ["backup"]})
+
+    assert oc.send_prompt("p", "c", "primary", None) == "from backup"
+    assert tried == ["primary", "backup"]
+
+
+def test_generate_images_requests_n_at_once(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    oc = import_oc()
+
+    captured = {}
+    nodes = [
+        type("Node", (), {"b64_json": base64.b64encode(data).decode()})
+        for data in (b"one", b"two")
+    ]
+
+    def dummy_generate(**kwargs):
+        captured.update(kwargs)
+        return type("Resp", (), {"data": nodes})()
+
+    monkeypatch.setattr(oc._client.images, "generate", dummy_generate)
+
+    assert oc.generate_images("p", model="gpt-image-1", n=2) == [b"one", b"two"]
+    assert captured["n"] == 2
+    with pytest.raises(ValueError):
+        oc.generate_images("p", model="dall-e-3", n=2)
+
+
+def test_identical_concurrent_prompts_share_a_request(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    oc = import_oc()
+    entered = threading.Event()
+    release = threading.Event()
+    created = []
+
+    class Resp:
+        choices = [type("Choice", (), {"message": type("M", (), {"content": "ok"})})]
+        usage = None
+
+    def create(**kwargs):
+        created.append(kwargs)
+        entered.set()
+        release.wait(5)
+        return Resp()
+
+    monkeypatch.setattr(oc._client.chat.completions, "create", create)
+    before = oc.usage_snapshot()["coalesced"]
+
+    with ThreadPoolExecutor(3) as pool:
+        first = pool.submit(oc.send_prompt, "p", "same", "m", None)
+        entered.wait(5)
+        rest = [pool.submit(oc.send_prompt, "p", "same", "m", None) for _ in range(2)]
+        while oc._single_flight.stats()["shared"] < 2:
+            time.sleep(0.001)
+        release.set()
+        assert [f.result() for f in [first, *rest]] == ["ok"] * 3
+
+    assert len(created) == 1
+    assert oc.usage_snapshot()["coalesced"] - before == 2
+
+
+def test_http_settings_apply_to_clients_and_downloads(monkeypatch):
+    import httpx
+
+    from md_batch_gpt.http_client import HttpSettings
+
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    oc = import_oc()
+    oc.set_http_settings(HttpSettings(connect_timeout=2, read_timeout=30))
+
+    assert oc._client.timeout.read == 30
+    assert oc.http_settings().connect_timeout == 2
+    assert oc._downloader().timeout.connect == 2
+
+    old_client = oc._client
+    old_download = oc._downloader()
+    oc.set_http_settings(HttpSettings(read_timeout=60))
+    assert old_client.is_closed() and old_download.is_closed
+
+    oc._download_client = httpx.Client(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, content=b"png"))
+    )
+    node = type("Node", (), {"url": "https://images.example/a.png"})
+    assert oc._image_bytes(node) == b"png"
+
+
+def test_invalid_http_config_fails_on_first_use(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    monkeypatch.setattr("md_batch_gpt.config.HTTP_CONFIG", {"max_connections": "many"})
+    oc = import_oc()
+    with pytest.raises(ValueError, match="max_connections"):
+        oc.http_settings()
+    with pytest.raises(ValueError, match="max_connections"):
+        oc.send_prompt("p", "c", "m", None)
+
+
+def test_identical_image_calls_are_not_coalesced(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    oc = import_oc()
+    barrier = threading.Barrier(3, timeout=5)
+    counter = iter(range(100))
+
+    def generate(**kwargs):
+        barrier.wait()
+        data = base64.b64encode(f"img{next(counter)}".encode()).decode()
+        return type("R", (), {"data": [type("Node", (), {"b64_json": data})]})
+
+    monkeypatch.setattr(oc._client.images, "generate", generate)
+    with ThreadPoolExecutor(3) as pool:
+        images = list(pool.map(lambda _: oc.generate_image("same"), range(3)))
+
+    assert len(set(images)) == 3
+
+
+def test_hedges_take_a_request_slot_and_track_latency_per_model(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    oc = import_oc()
+    oc.set_request_limit(1)
+    oc.set_hedging(50, max_rate=1)
+    for _ in range(20):
+        oc._hedger.observe("chat:m", 0.001)
+        oc._hedger.calls += 1
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def create(**kwargs):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.1)
+        with lock:
+            running.pop()
+        message = type("M", (), {"content": "ok"})
+        return type("R", (), {"choices": [type("C", (), {"message": message})], "usage": None})
+
+    monkeypatch.setattr(oc._client.chat.completions, "create", create)
+    try:
+        assert oc.send_prompt("p", "c", "m", None) == "ok"
+        # the hedge waited for the only slot and was dropped once the call ended
+        time.sleep(0.2)
+        assert max(peak) == 1
+        assert len(peak) == 1
+        assert oc.hedging_stats()["hedges"] == 1
+        assert oc._hedger.threshold("chat:other") is None
+    finally:
+        oc.set_request_limit(None)
+        oc.set_hedging(None)
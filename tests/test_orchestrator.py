@@ -1,6 +1,7 @@
 from pathlib import Path
 
 import importlib
+import os
 
 
 def import_orchestrator():
@@ -54,7 +55,7 @@ def test_process_folder_dry_run(monkeypatch, tmp_path: Path, capsys):
     write_calls = []
 
     monkeypatch.setattr(orch, "send_prompt", lambda *a, **k: send_calls.append(True))
-    monkeypatch.setattr(orch, "write_atomic", lambda *a, **k: write_calls.append(True))
+    monkeypatch.setattr(orch, "write_atomic_batch", lambda *a, **k: write_calls.append(True))
 
     (tmp_path / "a.md").write_text("A")
     (tmp_path / "b.md").write_text("B")
@@ -158,7 +159,7 @@ def test_process_folder_no_markdown(monkeypatch, tmp_path: Path, capsys):
     write_calls = []
 
     monkeypatch.setattr(orch, "send_prompt", lambda *a, **k: send_calls.append(True))
-    monkeypatch.setattr(orch, "write_atomic", lambda *a, **k: write_calls.append(True))
+    monkeypatch.setattr(orch, "write_atomic_batch", lambda *a, **k: write_calls.append(True))
 
     (tmp_path / "a.txt").write_text("A")
     p1 = tmp_path / "p1.txt"
@@ -193,3 +194,355 @@ def test_process_folder_regex_json(monkeypatch, tmp_path: Path):
     orch.process_folder(tmp_path, [prompt], model="m", regex_json=regex)
 
     assert md.read_text(encoding="utf-8") == "bar[p]"
+
+
+def test_process_folder_shards_cover_folder(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+
+    monkeypatch.setattr(orch, "send_prompt", lambda p, c, m, t=None: c + "!")
+
+    for i in range(10):
+        (tmp_path / f"f{i}.md").write_text(str(i))
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("p")
+
+    reports = [
+        orch.process_folder(tmp_path, [prompt], model="m", shard=(i, 3))
+        for i in range(3)
+    ]
+
+    processed = sorted(rel for r in reports for rel in r.processed)
+    assert processed == sorted(f"f{i}.md" for i in range(10))
+    assert all((tmp_path / f"f{i}.md").read_text() == f"{i}!" for i in range(10))
+
+
+def test_process_folder_keep_going(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+
+    def fake_send_prompt(prompt, content, model, max_tokens=None):
+        if content == "bad":
+            raise RuntimeError("boom")
+        return content.upper()
+
+    monkeypatch.setattr(orch, "send_prompt", fake_send_prompt)
+
+    (tmp_path / "a.md").write_text("bad")
+    (tmp_path / "b.md").write_text("good")
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("p")
+
+    report = orch.process_folder(tmp_path, [prompt], model="m", keep_going=True)
+
+    assert report.processed == ["b.md"]
+    assert report.failures == [{"item": "a.md", "error": "RuntimeError: boom"}]
+    assert (tmp_path / "a.md").read_text() == "bad"
+    assert (tmp_path / "b.md").read_text() == "GOOD"
+
+
+def test_process_folder_keep_going_records_each_write(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+    monkeypatch.setattr(orch, "send_prompt", lambda p, content, *a, **k: content.upper())
+    real_replace = os.replace
+
+    def replace(src, dst):
+        if Path(dst).name == "b.md":
+            raise PermissionError("denied")
+        real_replace(src, dst)
+
+    monkeypatch.setattr("md_batch_gpt.file_io.os.replace", replace)
+    for name in ("a", "b", "c"):
+        (tmp_path / f"{name}.md").write_text(name)
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("p")
+
+    report = orch.process_folder(tmp_path, [prompt], model="m", keep_going=True)
+
+    # the batch may have renamed a file before b.md failed: that one counts
+    # as processed only, the others as failed only
+    failed = [f["item"] for f in report.failures]
+    assert "b.md" in failed
+    assert sorted(report.processed + failed) == ["a.md", "b.md", "c.md"]
+    assert all(f["error"] == "PermissionError: denied" for f in report.failures)
+    for name in report.processed:
+        assert (tmp_path / name).read_text() == name[0].upper()
+    for name in failed:
+        assert (tmp_path / name).read_text() == name[0]
+    assert [p.name for p in sorted(tmp_path.iterdir())] == ["a.md", "b.md", "c.md", "p.txt"]
+
+
+def test_process_folder_routes(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+    from md_batch_gpt.routing import Route
+
+    models = {}
+
+    def fake_send_prompt(prompt, content, model, max_tokens=None):
+        models[content] = model
+        return content
+
+    monkeypatch.setattr(orch, "send_prompt", fake_send_prompt)
+
+    (tmp_path / "small.md").write_text("tiny")
+    (tmp_path / "large.md").write_text("x" * 1000)
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("p")
+
+    orch.process_folder(
+        tmp_path, [prompt], model="big", routes=[Route("cheap", max_tokens=50)]
+    )
+
+    assert models == {"tiny": "cheap", "x" * 1000: "big"}
+
+
+def test_process_folder_workers(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+
+    monkeypatch.setattr(orch, "send_prompt", lambda p, c, m, t=None: f"{c}[{p}]")
+
+    for i in range(12):
+        (tmp_path / f"f{i}.md").write_text(str(i))
+    p1 = tmp_path / "p1.txt"
+    p1.write_text("p1")
+    p2 = tmp_path / "p2.txt"
+    p2.write_text("p2")
+
+    report = orch.process_folder(tmp_path, [p1, p2], model="m", workers=4, prefetch=2)
+
+    assert sorted(report.processed) == sorted(f"f{i}.md" for i in range(12))
+    for i in range(12):
+        assert (tmp_path / f"f{i}.md").read_text() == f"{i}[p1][p2]"
+
+
+def test_process_folder_regex_rules_run_once_unless_per_pass(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+
+    seen = []
+
+    def fake_send_prompt(prompt, content, model, max_tokens=None):
+        seen.append(content)
+        return f"{content}[{prompt}]"
+
+    monkeypatch.setattr(orch, "send_prompt", fake_send_prompt)
+
+    md = tmp_path / "a.md"
+    md.write_text("x")
+    p1 = tmp_path / "p1.txt"
+    p1.write_text("p")
+    p2 = tmp_path / "p2.txt"
+    p2.write_text("q")
+    regex = tmp_path / "r.json"
+    regex.write_text('{"p": "P", "x": {"replace": "X", "per_pass": true}}')
+
+    orch.process_folder(tmp_path, [p1, p2], model="m", regex_json=regex)
+
+    # The per-pass rule is visible to the second prompt, the other is not
+    assert seen == ["x", "X[p]"]
+    assert md.read_text() == "X[P][q]"
+
+
+def test_process_folder_edit_mode(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+
+    full_calls = []
+
+    def fake_send_prompt_edits(prompt, content, model, max_tokens=None):
+        if "broken" in content:
+            return '[{"find": "missing", "replace": "x"}]'
+        return '[{"find": "teh", "replace": "the"}]'
+
+    def fake_send_prompt(prompt, content, model, max_tokens=None):
+        full_calls.append(content)
+        return content.replace("broken", "fixed")
+
+    monkeypatch.setattr(orch, "send_prompt_edits", fake_send_prompt_edits)
+    monkeypatch.setattr(orch, "send_prompt", fake_send_prompt)
+
+    (tmp_path / "a.md").write_text("teh lesson body")
+    (tmp_path / "b.md").write_text("broken body")
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("p")
+
+    orch.process_folder(tmp_path, [prompt], model="m", edit_mode=True)
+
+    assert (tmp_path / "a.md").read_text() == "the lesson body"
+    assert (tmp_path / "b.md").read_text() == "fixed body"
+    assert full_calls == ["broken body"]
+
+
+def test_process_folder_prompt_selectors(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+
+    calls = []
+
+    def fake_send_prompt(prompt, content, model, max_tokens=None):
+        calls.append((prompt, content))
+        return f"{content}[{prompt.strip()}]"
+
+    monkeypatch.setattr(orch, "send_prompt", fake_send_prompt)
+
+    (tmp_path / "img.md").write_text("```json\n[]\n```")
+    (tmp_path / "plain.md").write_text("plain")
+    images_only = tmp_path / "p1.txt"
+    images_only.write_text("---\nrequires: '```json'\n---\nimg")
+    everyone = tmp_path / "p2.txt"
+    everyone.write_text("all")
+
+    report = orch.process_folder(tmp_path, [images_only], model="m")
+
+    assert calls == [("img", "```json\n[]\n```")]
+    assert report.skipped == ["plain.md"]
+    assert (tmp_path / "plain.md").read_text() == "plain"
+
+    calls.clear()
+    orch.process_folder(tmp_path, [images_only, everyone], model="m")
+    assert sorted(c[0] for c in calls) == ["all", "all", "img"]
+
+
+def test_process_folder_packs_small_files(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+    packed_calls, single_calls = [], []
+
+    def fake_packed(prompt, content, model, max_tokens):
+        packed_calls.append(content)
+        key = content.split()[2].rstrip(">")
+        docs = orch.unpack_documents(content, content.count("<<<doc "), key)
+        return orch.pack_documents([d.upper() for d in docs], key)
+
+    monkeypatch.setattr(orch, "send_prompt_packed", fake_packed)
+    monkeypatch.setattr(
+        orch, "send_prompt", lambda p, c, m, t: single_calls.append(c) or c + "!"
+    )
+
+    for name in ("a", "b", "c"):
+        (tmp_path / f"{name}.md").write_text(name * 8)
+    (tmp_path / "big.md").write_text("x" * 4000)
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("p")
+
+    report = orch.process_folder(tmp_path, [prompt], model="m", pack_tokens=100)
+
+    assert len(packed_calls) == 1
+    assert single_calls == ["x" * 4000]
+    assert (tmp_path / "a.md").read_text() == "AAAAAAAA"
+    assert sorted(report.processed) == ["a.md", "b.md", "big.md", "c.md"]
+
+
+def test_process_folder_pack_falls_back_per_file(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+    singles = []
+
+    monkeypatch.setattr(orch, "send_prompt_packed", lambda *a: "only one document")
+    monkeypatch.setattr(
+        orch, "send_prompt", lambda p, c, m, t: singles.append(c) or c + "!"
+    )
+    (tmp_path / "a.md").write_text("a")
+    (tmp_path / "b.md").write_text("b")
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("p")
+
+    orch.process_folder(tmp_path, [prompt], model="m", pack_tokens=100)
+
+    assert sorted(singles) == ["a", "b"]
+    assert (tmp_path / "b.md").read_text() == "b!"
+
+
+def test_process_folder_schedule_largest_first(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+    sent = []
+    monkeypatch.setattr(orch, "send_prompt", lambda p, c, m, t: sent.append(c) or c)
+
+    for name, size in (("a", 10), ("b", 400), ("c", 40)):
+        (tmp_path / f"{name}.md").write_text(name * size)
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("p")
+
+    orch.process_folder(tmp_path, [prompt], model="m", schedule="largest")
+
+    assert [text[0] for text in sent] == ["b", "c", "a"]
+
+
+def test_process_folder_output_dir(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+    monkeypatch.setattr(orch, "send_prompt", lambda p, c, m, t: c + "!")
+
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "a.md").write_text("A")
+    (src / "sub" / "b.md").write_text("B")
+    (src / "skip.md").write_text("S")
+    (src / "img.png").write_bytes(b"png")
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("---\nglob: ['a.md', 'sub/*']\n---\np")
+    out = tmp_path / "out"
+
+    report = orch.process_folder(src, [prompt], model="m", output_dir=out)
+
+    assert sorted(report.processed) == ["a.md", "sub/b.md"]
+    assert report.skipped == ["skip.md"]
+    assert (out / "a.md").read_text() == "A!"
+    assert (out / "sub" / "b.md").read_text() == "B!"
+    assert (src / "a.md").read_text() == "A"
+    assert (src / "skip.md").samefile(out / "skip.md")
+    assert (src / "img.png").samefile(out / "img.png")
+
+
+def test_process_folder_strips_wrappers_and_renames(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+    monkeypatch.setattr(
+        orch, "send_prompt", lambda p, c, m, t: f"```markdown\n# {c.strip()} Title\n```\n"
+    )
+
+    (tmp_path / "a.md").write_text("Alpha")
+    (tmp_path / "b.md").write_text("Beta")
+    (tmp_path / "keep.md").write_text("# Kept Name\n")
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("---\nglob: ['a.md', 'b.md']\n---\np")
+
+    report = orch.process_folder(
+        tmp_path, [prompt], model="m", strip_wrappers=True, rename_by_heading=True
+    )
+
+    assert (tmp_path / "alpha-title.md").read_text() == "# Alpha Title\n"
+    assert (tmp_path / "beta-title.md").exists()
+    assert (tmp_path / "kept-name.md").read_text() == "# Kept Name\n"
+    assert report.renamed == {
+        "a.md": "alpha-title.md",
+        "b.md": "beta-title.md",
+        "keep.md": "kept-name.md",
+    }
+
+
+def test_process_folder_rerun_renames_into_output_dir(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    orch = import_orchestrator()
+    monkeypatch.setattr(orch, "send_prompt", lambda p, c, m, t: f"# Title One\n{c}")
+
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.md").write_text("A")
+    (src / "b.md").write_text("# Bee\n")
+    out = tmp_path / "out"
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("---\nglob: a.md\n---\np")
+
+    for _ in range(2):
+        report = orch.process_folder(
+            src, [prompt], model="m", output_dir=out, rename_by_heading=True
+        )
+        assert report.failures == []
+        assert report.renamed == {"a.md": "title-one.md", "b.md": "bee.md"}
+        assert sorted(p.name for p in out.glob("*.md")) == ["bee.md", "title-one.md"]
+        assert (out / "title-one.md").read_text() == "# Title One\nA"
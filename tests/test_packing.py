@@ -0,0 +1,44 @@
+from pathlib import Path
+
+import pytest
+
+from md_batch_gpt.packing import (
+    MAX_PACK_FILES,
+    PackError,
+    new_key,
+    pack_documents,
+    plan_packs,
+    unpack_documents,
+)
+
+
+def test_pack_round_trip():
+    texts = ["# One\n\ntext", "two\n", "three"]
+    key = new_key(texts)
+    packed = pack_documents(texts, key)
+    assert unpack_documents(packed, 3, key) == texts
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [
+        "<<<doc 1 k>>>\na\n<<<end 1 k>>>",  # a document is missing
+        "<<<doc 2 k>>>\nb\n<<<end 2 k>>>\n<<<doc 1 k>>>\na\n<<<end 1 k>>>",  # reordered
+        "Sure!\n<<<doc 1 k>>>\na\n<<<end 1 k>>>\n<<<doc 2 k>>>\nb\n<<<end 2 k>>>",
+        "<<<doc 1 k>>>\na\n<<<end 1 k>>>\n<<<doc 2 k>>>\n\n<<<end 2 k>>>",  # empty
+        "<<<doc 1 k>>>\na\n<<<end 1 k>>>\n<<<doc 2 k>>>\nb",  # unterminated
+    ],
+)
+def test_unpack_rejects_damaged_replies(reply):
+    with pytest.raises(PackError):
+        unpack_documents(reply, 2, "k")
+
+
+def test_plan_packs_respects_budget_and_large_files():
+    sizes = {"a": 10, "b": 20, "c": 80, "d": 25, "e": 15}
+    packs = plan_packs([Path(n) for n in "abcde"], 50, lambda p: sizes[p.name])
+    assert [[p.name for p in pack] for pack in packs] == [["c"], ["a", "b"], ["d", "e"]]
+    assert plan_packs([Path("a")], None) == [[Path("a")]]
+
+    many = plan_packs([Path(str(i)) for i in range(MAX_PACK_FILES + 1)], 10**6, lambda p: 1)
+    assert [len(p) for p in many] == [MAX_PACK_FILES, 1]
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from md_batch_gpt.pipeline import run_pipeline
+
+
+def test_pipeline_processes_every_item_in_batches():
+    batches = []
+    run_pipeline(
+        range(20),
+        read=lambda i: i * 10,
+        process=lambda i, data: data + 1,
+        write=batches.append,
+        workers=3,
+        batch_size=4,
+    )
+    results = sorted(pair for batch in batches for pair in batch)
+    assert results == [(i, i * 10 + 1) for i in range(20)]
+    assert all(len(batch) <= 4 for batch in batches)
+
+
+def test_pipeline_workers_overlap():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def process(item, data):
+        # Deadlocks (and times out) unless three workers run at once
+        barrier.wait()
+        return data
+
+    written = []
+    run_pipeline(range(3), lambda i: i, process, written.extend, workers=3)
+    assert sorted(written) == [(0, 0), (1, 1), (2, 2)]
+
+
+def test_pipeline_reader_backpressure():
+    lock = threading.Lock()
+    state = {"read": 0, "processed": 0, "max_ahead": 0}
+
+    def read(item):
+        with lock:
+            state["read"] += 1
+            state["max_ahead"] = max(state["max_ahead"], state["read"] - state["processed"])
+        return item
+
+    def process(item, data):
+        with lock:
+            state["processed"] += 1
+        return data
+
+    run_pipeline(range(50), read, process, lambda batch: None, workers=1, prefetch=2)
+    # prefetch queue + the item being put + the item in the worker
+    assert state["max_ahead"] <= 4
+
+
+def test_pipeline_error_stops_and_raises():
+    def process(item, data):
+        if item == 3:
+            raise RuntimeError("boom")
+        return data
+
+    with pytest.raises(RuntimeError, match="boom"):
+        run_pipeline(range(10), lambda i: i, process, lambda batch: None)
+
+
+def test_pipeline_on_error_continues():
+    failed = []
+    written = []
+
+    def process(item, data):
+        if item % 2:
+            raise ValueError(item)
+        return data
+
+    run_pipeline(
+        range(6),
+        lambda i: i,
+        process,
+        written.extend,
+        workers=2,
+        on_error=lambda item, exc: failed.append(item),
+    )
+    assert sorted(failed) == [1, 3, 5]
+    assert sorted(i for i, _ in written) == [0, 2, 4]
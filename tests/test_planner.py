@@ -0,0 +1,172 @@
+import importlib
+import threading
+from pathlib import Path
+
+import pytest
+
+
+def import_planner(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    for name in ["md_batch_gpt.planner", "md_batch_gpt.images", "md_batch_gpt.orchestrator"]:
+        importlib.sys.modules.pop(name, None)
+    return importlib.import_module("md_batch_gpt.planner")
+
+
+def one_by_one(run_unit):
+    def run_units(units, durability):
+        failed = {}
+        for unit in units:
+            try:
+                run_unit(unit, durability)
+            except Exception as exc:
+                failed[unit.id] = exc
+        return failed
+
+    return run_units
+
+
+def make_docs(tmp_path: Path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.md").write_text("---\nexpected_filename: a.png\nsummary: A\n---\nbody")
+    (docs / "b.md").write_text(
+        'Text\n```json\n{"expected_filename": "b.png", "summary": "B"}\n```\n' * 5
+    )
+    prompt = tmp_path / "p.txt"
+    prompt.write_text("Fix it")
+    return docs, prompt
+
+
+def test_plan_save_load_and_diff(monkeypatch, tmp_path: Path):
+    planner = import_planner(monkeypatch)
+    docs, prompt = make_docs(tmp_path)
+
+    first = planner.plan_run(docs, [prompt], "m")
+    assert [u.id for u in first.units] == ["prompt:a.md", "prompt:b.md"]
+    assert all(u.cost > 0 for u in first.units)
+
+    path = tmp_path / "plan.json"
+    first.save(path)
+    assert planner.load_manifest(path).to_dict() == first.to_dict()
+
+    (docs / "b.md").write_text("changed")
+    (docs / "c.md").write_text("new")
+    (docs / "a.md").unlink()
+    diff = planner.diff_manifests(first, planner.plan_run(docs, [prompt], "m"))
+    assert diff == {"added": ["prompt:c.md"], "removed": ["prompt:a.md"], "changed": ["prompt:b.md"]}
+
+
+def test_images_depend_on_prompt_units_for_their_docs(monkeypatch, tmp_path: Path):
+    planner = import_planner(monkeypatch)
+    docs, prompt = make_docs(tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    merged = planner.plan_run(docs, [prompt], "m").extend(planner.plan_docs(docs, "dall-e-3", "s"))
+    image = next(u for u in merged.units if u.id == f"image:{tmp_path / 'a.png'}")
+    assert image.outputs == [str(tmp_path / "a.png")]
+    assert image.deps == ["prompt:a.md"]
+
+
+def test_execute_respects_dependencies_and_resumes(monkeypatch, tmp_path: Path):
+    planner = import_planner(monkeypatch)
+    out = tmp_path / "out.txt"
+    units = [
+        planner.WorkUnit("late", "image", {"n": 1}, deps=["early"]),
+        planner.WorkUnit("early", "image", {"n": 1}, outputs=[str(out)]),
+        planner.WorkUnit("broken", "image", {"n": 1}),
+        planner.WorkUnit("after-broken", "image", {"n": 1}, deps=["broken"]),
+    ]
+    manifest = planner.Manifest(units)
+    ran = []
+    lock = threading.Lock()
+
+    def run_unit(unit, durability):
+        with lock:
+            ran.append(unit.id)
+        if unit.id == "broken":
+            raise RuntimeError("boom")
+        for o in unit.outputs:
+            Path(o).write_text("x")
+
+    state = tmp_path / "state.json"
+    report = planner.execute_manifest(
+        manifest,
+        workers=2,
+        keep_going=True,
+        state_path=state,
+        run_units=one_by_one(run_unit),
+    )
+    assert ran.index("early") < ran.index("late")
+    assert "after-broken" not in ran
+    assert sorted(report.processed) == ["early", "late"]
+    assert sorted(f["item"] for f in report.failures) == ["after-broken", "broken"]
+
+    ran.clear()
+    report = planner.execute_manifest(
+        manifest, keep_going=True, state_path=state, run_units=one_by_one(run_unit)
+    )
+    assert sorted(report.skipped) == ["early", "late"]
+    assert ran == ["broken"]
+
+
+def test_cycles_and_unknown_deps_are_rejected(monkeypatch):
+    planner = import_planner(monkeypatch)
+    with pytest.raises(ValueError, match="cycle"):
+        planner.Manifest(
+            [
+                planner.WorkUnit("a", "image", {}, deps=["b"]),
+                planner.WorkUnit("b", "image", {}, deps=["a"]),
+            ]
+        ).validate()
+    with pytest.raises(ValueError, match="unknown"):
+        planner.Manifest([planner.WorkUnit("a", "image", {}, deps=["x"])]).validate()
+
+
+def test_execute_schedule_starts_longest_chain_first(monkeypatch):
+    planner = import_planner(monkeypatch)
+    units = [
+        planner.WorkUnit("big", "image", {}, cost=5),
+        planner.WorkUnit("head", "image", {}, cost=1),
+        planner.WorkUnit("tail", "image", {}, deps=["head"], cost=10),
+        planner.WorkUnit("small", "image", {}, cost=2),
+    ]
+    ran = []
+
+    planner.execute_manifest(
+        planner.Manifest(units),
+        workers=1,
+        schedule="largest",
+        run_units=one_by_one(lambda unit, durability: ran.append(unit.id)),
+    )
+
+    assert ran[:3] == ["head", "big", "small"]
+
+
+def test_execute_batches_prompt_units_per_prompt_set(monkeypatch, tmp_path: Path):
+    planner = import_planner(monkeypatch)
+    docs, prompt = make_docs(tmp_path)
+    (docs / "c.md").write_text("C")
+    other = tmp_path / "q.txt"
+    other.write_text("Other")
+    calls = []
+
+    def process_folder(folder, prompts, files=None, keep_going=False, **kwargs):
+        calls.append(([p.name for p in prompts], sorted(f.name for f in files)))
+        report = planner.RunReport()
+        if "c.md" in [f.name for f in files]:
+            report.record_failure("c.md", RuntimeError("boom"))
+        return report
+
+    monkeypatch.setattr(planner, "process_folder", process_folder)
+    notes = tmp_path / "notes"
+    notes.mkdir()
+    (notes / "n.md").write_text("N")
+    manifest = planner.plan_run(docs, [prompt], "m").extend(
+        planner.plan_run(notes, [other], "m")
+    )
+
+    report = planner.execute_manifest(manifest, workers=1, keep_going=True)
+
+    assert sorted(calls) == [(["p.txt"], ["a.md", "b.md", "c.md"]), (["q.txt"], ["n.md"])]
+    assert [f["item"] for f in report.failures] == ["prompt:c.md"]
+    assert sorted(report.processed) == ["prompt:a.md", "prompt:b.md", "prompt:n.md"]
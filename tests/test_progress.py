@@ -0,0 +1,77 @@
+import importlib
+import io
+import json
+
+
+def import_progress(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    importlib.sys.modules.pop("md_batch_gpt.progress", None)
+    return importlib.import_module("md_batch_gpt.progress")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_snapshot_rate_and_eta(monkeypatch):
+    pg = import_progress(monkeypatch)
+    clock = FakeClock()
+    progress = pg.Progress(total=10, clock=clock, window=60.0)
+    clock.now += 10
+    progress.advance(4)
+    progress.advance(failed=True)
+
+    snap = progress.snapshot()
+    assert snap["done"] == 5
+    assert snap["failed"] == 1
+    assert snap["total"] == 10
+    assert snap["rate"] == 0.5
+    assert snap["eta"] == 10.0
+
+
+def test_rate_only_counts_recent_window(monkeypatch):
+    pg = import_progress(monkeypatch)
+    clock = FakeClock()
+    progress = pg.Progress(total=20, clock=clock, window=10.0)
+    clock.now += 1
+    progress.advance(8)
+    clock.now += 20
+    progress.advance(2)
+
+    snap = progress.snapshot()
+    assert snap["rate"] == 0.2
+    assert snap["eta"] == 50.0
+
+
+def test_eta_unknown_before_first_unit(monkeypatch):
+    pg = import_progress(monkeypatch)
+    progress = pg.Progress(total=3, clock=FakeClock())
+    assert progress.snapshot()["eta"] is None
+    assert "ETA ?" in pg.Progress.format_line(progress.snapshot())
+
+
+def test_close_writes_line_and_json_records(monkeypatch):
+    pg = import_progress(monkeypatch)
+    stream, json_stream = io.StringIO(), io.StringIO()
+    progress = pg.Progress(unit="images", stream=stream, json_stream=json_stream)
+    progress.add_total(2)
+    progress.advance(2)
+    progress.close()
+
+    assert stream.getvalue().startswith("\r2/2 images")
+    assert stream.getvalue().endswith("\n")
+    record = json.loads(json_stream.getvalue().splitlines()[-1])
+    assert record["event"] == "done"
+    assert record["done"] == 2 and record["eta"] == 0.0
+    assert {"in_flight", "retries", "tokens"} <= record.keys()
+
+
+def test_format_duration(monkeypatch):
+    pg = import_progress(monkeypatch)
+    assert pg.format_duration(7) == "7s"
+    assert pg.format_duration(245) == "4m05s"
+    assert pg.format_duration(3720) == "1h02m"
@@ -0,0 +1,58 @@
+from pathlib import Path
+
+import pytest
+
+from md_batch_gpt.prompts import load_prompt
+
+
+def test_prompt_without_front_matter(tmp_path: Path):
+    path = tmp_path / "p.txt"
+    path.write_text("---\nNot selectors, just a separator\n---\nBody")
+    spec = load_prompt(path)
+    assert spec.text == "---\nNot selectors, just a separator\n---\nBody"
+    assert spec.applies("any.md", "")
+
+
+def test_prompt_selectors(tmp_path: Path):
+    path = tmp_path / "p.txt"
+    path.write_text(
+        "---\nglob: [\"lessons/*\", \"faq.md\"]\nrequires: '```json'\n"
+        "min_size: 10\nmax_size: 100\n---\nFix the JSON block.\n"
+    )
+    spec = load_prompt(path)
+    body = "intro\n```json\n{}\n```"
+    assert spec.text == "Fix the JSON block.\n"
+    assert spec.applies("lessons/a.md", body)
+    assert spec.applies("faq.md", body)
+    assert not spec.applies("other.md", body)
+    assert not spec.applies("faq.md", "no block here at all")
+    assert not spec.applies("faq.md", "```json")
+    assert not spec.applies("faq.md", body + "x" * 100)
+
+
+def test_prompt_unknown_selector(tmp_path: Path):
+    path = tmp_path / "p.txt"
+    path.write_text("---\nglob: '*.md'\nmax-size: 3\n---\nBody")
+    with pytest.raises(ValueError):
+        load_prompt(path)
+
+
+@pytest.mark.parametrize(
+    "selector",
+    [
+        "min_size: 10k",
+        "min_size: '10'",
+        "min_size: 1.5",
+        "min_size: -1",
+        "min_size: true",
+        "requires: 5",
+        "glob: 3",
+        "glob: {a: b}",
+        "glob: ['*.md', 2]",
+    ],
+)
+def test_prompt_selector_types_are_checked(tmp_path: Path, selector):
+    path = tmp_path / "p.txt"
+    path.write_text(f"---\n{selector}\n---\nBody")
+    with pytest.raises(ValueError, match=selector.split(":")[0]):
+        load_prompt(path)
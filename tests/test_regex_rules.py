@@ -0,0 +1,77 @@
+import re
+from pathlib import Path
+
+from md_batch_gpt.regex_rules import RegexEngine, RegexRule, load_rules
+
+
+def rules(*pairs):
+    return [RegexRule(re.compile(p), r) for p, r in pairs]
+
+
+def sequential(rule_list, text):
+    for rule in rule_list:
+        text = rule.pattern.sub(rule.replacement, text)
+    return text
+
+
+def test_engine_matches_sequential_rules():
+    rule_list = rules(
+        (r"\bcolour\b", "color"),
+        (r"(?i)figure (\d+)", r"Fig. \1"),
+        (r"\[note\]\((.+?)\)", r"> \1"),
+        (r"^# (.*)$", r"## \1"),
+        (r"\s+$", ""),
+        (r"colou?rful", "vivid"),
+    )
+    text = "# Title\ncolour and colourful, see FIGURE 12 [note](check) \nFigure 3 colour"
+    assert RegexEngine(rule_list).apply(text) == sequential(rule_list, text)
+
+
+def test_engine_first_listed_rule_wins_at_position():
+    engine = RegexEngine(rules(("abc", "1"), ("ab", "2"), ("a", "3")))
+    assert engine.apply("abc ab a") == "1 2 3"
+
+
+def test_engine_chains_rules_like_sequential_sub():
+    chained = rules(("foo", "bar"), ("bar", "baz"))
+    assert RegexEngine(chained).apply("foo") == "baz"
+    spaces = rules(("  +", " "), (r" \.", "."))
+    assert RegexEngine(spaces).apply("a   .") == "a."
+    words = rules((r"\bfoo\b", "bar"), (r"\bqux\b", "x"), (r"\bbar\b", "baz"))
+    assert RegexEngine(words).apply("foo qux bar") == "baz x baz"
+
+
+def test_engine_scans_whole_words_together():
+    rule_list = rules(
+        (r"\bcolour\b", "color"),
+        (r"\bfavour\b", "favor"),
+        (r"\bcolour\b", "hue"),
+        (r"\bgrey\b", ""),
+    )
+    engine = RegexEngine(rule_list)
+    assert len(engine._steps) == 1
+    text = "colourful colour, favour-grey ſtop İt grey_ish"
+    assert engine.apply(text) == sequential(rule_list, text)
+
+
+def test_engine_handles_case_folding_prefixes():
+    rule_list = rules((r"(?i)stop", "S"), (r"(?i)it", "I"), ("st", "T"))
+    text = "ſtop here İt STOP it"
+    assert RegexEngine(rule_list).apply(text) == sequential(rule_list, text)
+
+
+def test_engine_supports_named_groups_and_backrefs():
+    engine = RegexEngine(
+        rules((r"(?P<w>\w+)-(?P=w)", r"\g<w>"), (r"dup (\w+) \1", r"\1"), ("x", "y"))
+    )
+    assert engine.apply("aa-aa dup z z x") == "aa z y"
+
+
+def test_load_rules_per_pass(tmp_path: Path):
+    path = tmp_path / "r.json"
+    path.write_text('{"a": "b", "c": {"replace": "d", "per_pass": true}}')
+    loaded = load_rules(path)
+    assert [(r.pattern.pattern, r.replacement, r.per_pass) for r in loaded] == [
+        ("a", "b", False),
+        ("c", "d", True),
+    ]
@@ -0,0 +1,30 @@
+from pathlib import Path
+
+import pytest
+
+from md_batch_gpt.routing import choose_model, load_routes
+
+
+def test_choose_model_first_match_wins():
+    routes = load_routes(
+        [
+            {"glob": "advanced/*", "model": "big"},
+            {"prompt": "fix-*.txt", "model": "fixer"},
+            {"max_tokens": 100, "model": "small"},
+        ]
+    )
+    short, long = "x" * 40, "x" * 4000
+    assert choose_model(routes, "advanced/a.md", Path("p.txt"), short, "d") == "big"
+    assert choose_model(routes, "a.md", Path("prompts/fix-1.txt"), long, "d") == "fixer"
+    assert choose_model(routes, "a.md", Path("p.txt"), short, "d") == "small"
+    assert choose_model(routes, "a.md", Path("p.txt"), long, "d") == "d"
+    assert choose_model([], "a.md", Path("p.txt"), short, "d") == "d"
+
+
+def test_load_routes_rejects_bad_tables():
+    with pytest.raises(ValueError):
+        load_routes([{"glob": "*"}])
+    with pytest.raises(ValueError):
+        load_routes([{"model": "m", "size": 3}])
+    with pytest.raises(ValueError, match="array of tables"):
+        load_routes({"model": "m"})
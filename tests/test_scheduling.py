@@ -0,0 +1,37 @@
+from pathlib import Path
+
+import pytest
+
+from md_batch_gpt.prompts import PromptSpec
+from md_batch_gpt.scheduling import markdown_cost, order_by_cost, top_level_group
+
+
+def test_order_by_cost_modes():
+    items = ["a/1", "a/9", "b/2", "c/5", "a/7"]
+    cost = lambda item: int(item[-1])
+
+    assert order_by_cost(items, cost, "input") == items
+    assert order_by_cost(items, cost, "largest") == ["a/9", "a/7", "c/5", "b/2", "a/1"]
+    assert order_by_cost(items, cost, "fair", group=top_level_group) == [
+        "a/9", "c/5", "b/2", "a/7", "a/1"
+    ]
+    with pytest.raises(ValueError):
+        order_by_cost(items, cost, "random")
+
+
+def test_top_level_group():
+    assert top_level_group("a.md") == ""
+    assert top_level_group("unit1/lesson/a.md") == "unit1"
+
+
+def test_markdown_cost_counts_applicable_passes(tmp_path: Path):
+    path = tmp_path / "a.md"
+    path.write_text("x" * 400)
+    every = PromptSpec(Path("p1"), "p1")
+    other = PromptSpec(Path("p2"), "p2", globs=("other/*",))
+    small = PromptSpec(Path("p3"), "p3", max_size=100)
+
+    assert markdown_cost(path, "a.md", [every]) == 101
+    assert markdown_cost(path, "a.md", [every, every, other, small]) == 202
+    assert markdown_cost(path, "a.md", [other]) == 101
+    assert markdown_cost(tmp_path / "missing.md", "missing.md", [every]) == 0
@@ -0,0 +1,39 @@
+from pathlib import Path
+
+import pytest
+
+from md_batch_gpt.report import RunReport, load_report, merge_reports
+from md_batch_gpt.sharding import parse_shard, select_shard, shard_of
+
+
+def test_parse_shard():
+    assert parse_shard("0/4") == (0, 4)
+    assert parse_shard("3/4") == (3, 4)
+    for bad in ["4/4", "-1/2", "1", "a/b", "0/0"]:
+        with pytest.raises(ValueError):
+            parse_shard(bad)
+
+
+def test_select_shard_partitions_items():
+    keys = [f"dir{i % 7}/file{i}.md" for i in range(200)]
+    shards = [select_shard(keys, lambda k: k, (i, 3)) for i in range(3)]
+    assert sorted(k for shard in shards for k in shard) == sorted(keys)
+    assert all(shards)
+    # Stable across calls so separate machines agree
+    assert shard_of("dir1/file1.md", 3) == shard_of("dir1/file1.md", 3)
+    assert select_shard(keys, lambda k: k, None) == keys
+
+
+def test_merge_reports(tmp_path: Path):
+    r1 = RunReport(shards=["0/2"], processed=["a.md"], usage={"requests": 2})
+    r2 = RunReport(shards=["1/2"], processed=["b.md"], usage={"requests": 3})
+    r2.record_failure("c.md", RuntimeError("boom"))
+    r1.write(tmp_path / "r1.json")
+    r2.write(tmp_path / "r2.json")
+
+    merged = merge_reports(load_report(tmp_path / p) for p in ["r1.json", "r2.json"])
+
+    assert merged.shards == ["0/2", "1/2"]
+    assert merged.processed == ["a.md", "b.md"]
+    assert merged.failures == [{"item": "c.md", "error": "RuntimeError: boom"}]
+    assert merged.usage == {"requests": 5}
@@ -0,0 +1,58 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from md_batch_gpt.single_flight import SingleFlight
+
+
+
+
+def test_concurrent_duplicates_share_one_call():
+    flight = SingleFlight()
+    entered = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        entered.set()
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(4) as pool:
+        first = pool.submit(flight.do, "k", fn)
+        entered.wait(5)
+        others = [pool.submit(flight.do, "k", fn) for _ in range(3)]
+        while flight.stats()["shared"] < 3:
+            time.sleep(0.001)
+        release.set()
+        results = [f.result() for f in [first, *others]]
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    # Not a cache: once finished the next call runs again
+    assert flight.do("k", lambda: "again") == "again"
+
+
+def test_exception_is_shared_with_waiters():
+    flight = SingleFlight()
+    entered = threading.Event()
+    release = threading.Event()
+
+    def fn():
+        entered.set()
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(flight.do, "k", fn)
+        entered.wait(5)
+        second = pool.submit(flight.do, "k", fn)
+        while flight.stats()["shared"] < 1:
+            time.sleep(0.001)
+        release.set()
+        for future in (first, second):
+            with pytest.raises(RuntimeError):
+                future.result()
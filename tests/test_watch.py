@@ -0,0 +1,63 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from md_batch_gpt.file_io import write_atomic
+from md_batch_gpt.watch import InotifyWatcher, watch
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.mark.parametrize("force_polling", [False, True])
+def test_watch_processes_changes_and_ignores_own_writes(tmp_path: Path, force_polling):
+    if not force_polling:
+        try:
+            InotifyWatcher(tmp_path).close()
+        except OSError:
+            pytest.skip("inotify not available")
+
+    batches = []
+
+    def handle(paths):
+        batches.append([p.relative_to(tmp_path).as_posix() for p in paths])
+        for p in paths:
+            write_atomic(p, p.read_text() + "!")
+        return paths
+
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=watch,
+        args=(tmp_path, handle),
+        kwargs=dict(debounce=0.1, poll_interval=0.05, force_polling=force_polling, stop=stop),
+    )
+    thread.start()
+    try:
+        time.sleep(0.2)
+        sub = tmp_path / "sub"
+        sub.mkdir()
+        (sub / "a.md").write_text("a")
+        (tmp_path / "b.md").write_text("b")
+        (tmp_path / "notes.txt").write_text("ignored")
+        (tmp_path / ".hidden.md").write_text("ignored")
+        assert wait_for(lambda: batches)
+        time.sleep(0.4)
+        assert sorted(p for batch in batches for p in batch) == ["b.md", "sub/a.md"]
+        assert (tmp_path / "b.md").read_text() == "b!"
+
+        # A later edit by someone else is picked up again
+        (tmp_path / "b.md").write_text("edited")
+        assert wait_for(lambda: (tmp_path / "b.md").read_text() == "edited!")
+        time.sleep(0.4)
+        assert (tmp_path / "b.md").read_text() == "edited!"
+    finally:
+        stop.set()
+        thread.join(timeout=5)